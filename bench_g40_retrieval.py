@@ -0,0 +1,147 @@
+import argparse
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+import numpy as np
+import get_g40_course_gribs as g40
+from globe40.fake_cds import FakeCDSServer
+from globe40.reanalysis_retriever import ReanalysisRetriever
+from globe40.scenarios import DEFAULT_YEAR_SHIFTS
+
+
+def summarise(records, wall_seconds, cpu_seconds, time_scale):
+    """
+    Returns throughput and latency figures for a benchmark run, in simulated time,
+    and the share of the wall time spent on local CPU work such as writing and
+    reading GRIBs, which is counted in the simulated time as if it were queueing.
+    """
+    completed = [r for r in records if r["state"] == "completed"]
+    latencies = np.array([r["latency"] for r in completed]) if completed else np.zeros(1)
+    simulated = wall_seconds / time_scale
+    total_bytes = sum(r["bytes"] for r in completed)
+    return {
+        "requests": len(completed),
+        "failed_attempts": len(records) - len(completed),
+        "cpu_share": cpu_seconds / wall_seconds if wall_seconds else 0,
+        "simulated_hours": simulated / 3600,
+        "requests_per_hour": len(completed) / (simulated / 3600) if simulated else 0,
+        "bytes": total_bytes,
+        "bytes_per_sec": total_bytes / simulated if simulated else 0,
+        "latency_p50": float(np.percentile(latencies, 50)),
+        "latency_p95": float(np.percentile(latencies, 95)),
+        "latency_max": float(latencies.max()),
+    }
+
+
+def run_benchmark(
+    input_files,
+    max_in_flight,
+    merge_requests,
+    server_args,
+    workdir,
+    timestep_key="6_hourly",
+    year_shifts=DEFAULT_YEAR_SHIFTS,
+):
+    """
+    Runs process_tsv over the input files against a fake CDS server in workdir.
+    The cache is off, so which requests are sent does not depend on the order
+    earlier ones completed in.
+    """
+    server = FakeCDSServer(**server_args)
+    input_files = [os.path.abspath(f) for f in input_files]
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    try:
+        # Keep per-request progress output out of the benchmark report
+        with contextlib.redirect_stdout(io.StringIO()):
+            for input_file in input_files:
+                g40.process_tsv(
+                    input_file,
+                    percentage_to_change=25,
+                    days_either_end=14,
+                    timestep_key=timestep_key,
+                    variable_set_key="ten_metre_wind",
+                    merge_requests=merge_requests,
+                    max_in_flight=max_in_flight,
+                    cache_dir=None,
+                    retry_delay=0,
+                    make_client=server.client,
+                    year_shifts=year_shifts,
+                )
+    finally:
+        os.chdir(cwd)
+    return summarise(
+        server.records,
+        time.monotonic() - started,
+        time.process_time() - cpu_started,
+        server.time_scale,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the retrieval pipeline against a local fake CDS server."
+    )
+    parser.add_argument(
+        "input_files",
+        nargs="*",
+        default=["globe_40_legs_2026.split_leg_4.tsv"],
+        help="Leg TSV files to plan requests from",
+    )
+    parser.add_argument(
+        "--max-in-flight", type=int, nargs="+", default=[1, 2, 4], help="Settings to compare"
+    )
+    parser.add_argument("--no-merge", action="store_true", help="Disable request merging")
+    parser.add_argument("--server-limit", type=int, default=2, help="Requests CDS runs at once per user")
+    parser.add_argument("--queue-delay", type=float, default=120, help="Mean queue delay in seconds")
+    parser.add_argument("--seconds-per-field", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--grid", type=float, default=2.0, help="Synthetic GRIB grid in degrees")
+    parser.add_argument("--transfer-grid", type=float, default=0.25, help="Grid downloads are timed at, in degrees")
+    # Local CPU work (writing and reading GRIBs) is not scaled, so the scale is
+    # set for the simulated queue and transfer to take most of the wall time
+    parser.add_argument("--time-scale", type=float, default=0.02, help="Wall seconds per simulated second")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for simulated delays and failures")
+    parser.add_argument(
+        "--timestep", default="daily_noon", choices=sorted(ReanalysisRetriever.TIMESTEPS), help="Time steps to fetch"
+    )
+    parser.add_argument(
+        "--year-shifts", type=int, nargs="+", default=[-2], help="Years to shift each leg's dates by"
+    )
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    server_args = {
+        "max_running": args.server_limit,
+        "queue_delay": args.queue_delay,
+        "seconds_per_field": args.seconds_per_field,
+        "failure_rate": args.failure_rate,
+        "grid": args.grid,
+        "time_scale": args.time_scale,
+        "seed": args.seed,
+        "transfer_grid": args.transfer_grid,
+    }
+    for max_in_flight in args.max_in_flight:
+        with tempfile.TemporaryDirectory() as workdir:
+            result = run_benchmark(
+                args.input_files,
+                max_in_flight,
+                not args.no_merge,
+                server_args,
+                workdir,
+                args.timestep,
+                args.year_shifts,
+            )
+        print(
+            f"max_in_flight={max_in_flight}: {result['requests']} requests"
+            f" ({result['failed_attempts']} failed attempts) in {result['simulated_hours']:.1f} h"
+            f" ({result['cpu_share']:.0%} of it local CPU),"
+            f" {result['requests_per_hour']:.1f} req/h, {result['bytes_per_sec'] / 1e3:.1f} kB/s,"
+            f" latency p50 {result['latency_p50']:.0f}s p95 {result['latency_p95']:.0f}s"
+            f" max {result['latency_max']:.0f}s"
+        )
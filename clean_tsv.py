@@ -1,77 +1,269 @@
-import geojson as gj
+import argparse
 import csv
+import itertools
 import re
+import sys
+import numpy as np
+
+# Degrees and minutes with optional seconds, e.g. 47° 15.00’ N, 47°15′30″N or
+# 47° 15' 30" N, or signed decimal degrees with an optional hemisphere, e.g.
+# -47.696, +12.5 or 47.696° N. Compiled once and matched against every cell.
+COORDINATE_PATTERN = re.compile(
+    r"""
+    \s*(?:
+        (?P<sign>[-+])?(?P<degrees>\d{1,3})\s*°\s*
+        (?P<minutes>\d+(?:\.\d*)?)\s*[’′']\s*
+        (?:(?P<seconds>\d+(?:\.\d*)?)\s*(?:″|”|"|''|’’|′′)\s*)?
+        (?P<hemisphere>[NSEW])?
+    |
+        (?P<decimal>[-+]?(?:\d+(?:\.\d*)?|\.\d+))\s*°?\s*
+        (?P<decimal_hemisphere>[NSEW])?
+    )\s*
+    """,
+    re.VERBOSE,
+)
+
+# Columns of the legs table holding coordinates
+COORDINATE_COLUMNS = ("start_lat", "start_lon", "finish_lat", "finish_lon")
+
+# Other column names recognised as coordinates, e.g. in race tracker exports
+COORDINATE_NAMES = re.compile(r"(^|_)(lat|lon|lng|latitude|longitude)$", re.IGNORECASE)
+
+# Rows read, converted and written at a time
+DEFAULT_BATCH_SIZE = 65536
+
+# Errors kept with their details; the rest are only counted
+DEFAULT_MAX_ERRORS = 100
+
+
+def parse_coordinates(values, latitude=None):
+    """
+    Parses a column of coordinate strings in any of the formats of
+    COORDINATE_PATTERN to decimal degrees.
+
+    Parameters:
+    - values (list): The coordinate strings.
+    - latitude (bool): True for latitudes, which must be N or S and within 90
+      degrees, False for longitudes, which must be E or W. None allows either.
+
+    Returns:
+    - tuple: (decimals, errors) where decimals is a float array with NaN where a
+      value could not be parsed and errors maps the index of each such value to
+      the reason.
+    """
+    matches = list(map(COORDINATE_PATTERN.fullmatch, values))
+    n = len(values)
+    degrees = np.full(n, np.nan)
+    minutes = np.zeros(n)
+    seconds = np.zeros(n)
+    negative = np.zeros(n, dtype=bool)
+    errors = {}
+    wrong_hemispheres = {True: "EW", False: "NS", None: ""}[latitude]
+    limit = 90.0 if latitude else 180.0
+    for i, match in enumerate(matches):
+        if match is None:
+            errors[i] = f"'{values[i]}' is not in a known coordinate format"
+            continue
+        sign, degree, minute, second, hemisphere, decimal, decimal_hemisphere = (
+            match.groups()
+        )
+        if decimal is not None:
+            degrees[i] = float(decimal)
+            hemisphere = decimal_hemisphere
+        else:
+            degrees[i] = float(degree)
+            minutes[i] = float(minute)
+            if second is not None:
+                seconds[i] = float(second)
+            negative[i] = sign == "-"
+        if hemisphere is not None:
+            if hemisphere in wrong_hemispheres:
+                errors[i] = f"'{values[i]}' has the wrong hemisphere"
+            negative[i] |= hemisphere in "SW"
+
+    out_of_range = (minutes >= 60) | (seconds >= 60)
+    for i in np.flatnonzero(out_of_range):
+        errors.setdefault(int(i), f"'{values[i]}' has 60 or more minutes or seconds")
+    magnitude = np.abs(degrees) + minutes / 60 + seconds / 3600
+    decimals = np.where(negative, -magnitude, np.copysign(magnitude, degrees))
+    for i in np.flatnonzero(np.abs(decimals) > limit):
+        errors.setdefault(int(i), f"'{values[i]}' is beyond {limit:g} degrees")
+    decimals[list(errors)] = np.nan
+    return decimals, errors
 
 
 def convert_to_decimal(coord_str):
     """
-    Converts a latitude or longitude string in the format '47° 15.00’ N' or '122° 30.00’ W' to a decimal value.
+    Converts a latitude or longitude string such as '47° 15.00’ N', '122° 30′ 15″ W'
+    or '-47.696' to a decimal value.
 
     Args:
         coord_str (str): The coordinate string to convert.
 
     Returns:
-        float: The coordinate in decimal degrees.
+        str: The coordinate in decimal degrees to three decimal places.
 
     Raises:
         ValueError: If the input string is not in the expected format.
     """
-    # Define the regular expression for the expected format
-    pattern = r"^\s*(\d{1,3})°\s*([\d.]+)’\s*([NSEW])\s*$"
-    #    pattern = r"^\s*(\d{1,3})°\s*([\d.]+)′\s*([NSEW])\s*$"
+    decimals, errors = parse_coordinates([coord_str])
+    if errors:
+        raise ValueError(f"Input string {errors[0]}.")
+    return "{:.3f}".format(decimals[0])
 
-    # Attempt to match the input string with the regex
-    match = re.match(pattern, coord_str)
 
-    if not match:
-        raise ValueError(f"Input string '{coord_str}' is not in the expected format.")
+def coordinate_columns(header):
+    """
+    Returns the names in a header that hold coordinates.
+    """
+    return [
+        name
+        for name in header
+        if name in COORDINATE_COLUMNS or COORDINATE_NAMES.search(name)
+    ]
 
-    # Extract the degrees, minutes, and direction from the matched groups
-    degrees = float(match.group(1))
-    minutes = float(match.group(2))
-    direction = match.group(3)
 
-    # Convert minutes to decimal and add to degrees
-    decimal = degrees + (minutes / 60)
+def is_latitude(name):
+    """
+    Returns whether a coordinate column holds latitudes rather than longitudes.
+    """
+    return "lat" in name.lower()
 
-    # Adjust for the direction
-    if direction in ["S", "W"]:
-        decimal *= -1
 
-    return "{:.3f}".format(decimal)
+def clean_stream(
+    infile,
+    outfile,
+    columns=None,
+    precision=3,
+    batch_size=DEFAULT_BATCH_SIZE,
+    max_errors=DEFAULT_MAX_ERRORS,
+):
+    """
+    Copies a TSV from infile to outfile with its coordinate columns converted to
+    decimal degrees. Rows are read in batches of batch_size, each coordinate
+    column of a batch is converted at once and the batch is written in one go,
+    so memory stays at one batch however long the file is.
 
+    Rows with a value that cannot be converted are left out and reported rather
+    than stopping the run.
 
-def process_row(row):
-    """
-    Example function that processes a row from the TSV file.
+    Parameters:
+    - infile, outfile (file): Open text files.
+    - columns (list): Columns to convert. None finds them from the header.
+    - precision (int): Decimal places written.
+    - batch_size (int): Rows per batch.
+    - max_errors (int): Errors kept with their details.
+
+    Returns:
+    - dict: rows read, rows written, the number of errors and the first
+      max_errors of them as (line, column, reason).
     """
-    columns_to_modify = ["start_lat", "start_lon", "finish_lat", "finish_lon"]
-    new_row = {}
-    for key, value in row.items():
-        if key in columns_to_modify:
-            new_row[key] = convert_to_decimal(value)
-        else:
-            new_row[key] = value
-    print("\t".join(new_row.values()))
+    reader = csv.reader(infile, delimiter="\t")
+    writer = csv.writer(outfile, delimiter="\t", lineterminator="\n")
+    header = next(reader, None)
+    report = {"rows": 0, "written": 0, "errors": 0, "details": []}
+    if header is None:
+        return report
+    writer.writerow(header)
+    columns = coordinate_columns(header) if columns is None else list(columns)
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise ValueError(f"Columns {', '.join(missing)} are not in the header.")
+    indexes = [header.index(c) for c in columns]
+    number_format = "{:.%df}" % precision
+
+    line = 1
+    while True:
+        batch = list(itertools.islice(reader, batch_size))
+        if not batch:
+            break
+        bad = np.zeros(len(batch), dtype=bool)
+        converted = []
+        for column, index in zip(columns, indexes):
+            values = [row[index] if index < len(row) else "" for row in batch]
+            decimals, errors = parse_coordinates(values, is_latitude(column))
+            for i, reason in errors.items():
+                if len(report["details"]) < max_errors:
+                    report["details"].append((line + i + 1, column, reason))
+            report["errors"] += len(errors)
+            bad[list(errors)] = True
+            converted.append(list(map(number_format.format, decimals.tolist())))
 
+        rows = []
+        for i in np.flatnonzero(~bad):
+            row = batch[i]
+            for index, column_values in zip(indexes, converted):
+                row[index] = column_values[i]
+            rows.append(row)
+        writer.writerows(rows)
+        report["rows"] += len(batch)
+        report["written"] += len(rows)
+        line += len(batch)
+    return report
 
-def process_tsv(file_path):
+
+def process_tsv(file_path, output_path=None, **kwargs):
     """
-    Reads a TSV file and processes each row.
+    Cleans a TSV file, see clean_stream, writing to output_path or stdout.
+
+    Returns:
+    - dict: The report of clean_stream.
     """
-    feature_list = []
     with open(file_path, mode="r", newline="", encoding="utf-8") as tsvfile:
-        reader = csv.DictReader(tsvfile, delimiter="\t")
-        header = reader.fieldnames
-        if header:
-            print("\t".join(header))
-        # Iterate over each row in the TSV file
-        for row in reader:
-            process_row(row)
+        if output_path is None:
+            return clean_stream(tsvfile, sys.stdout, **kwargs)
+        with open(
+            output_path, mode="w", newline="", encoding="utf-8", buffering=1 << 20
+        ) as out:
+            return clean_stream(tsvfile, out, **kwargs)
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "input_file",
+        nargs="?",
+        default="globe_40_legs_2026.tsv",
+        help="TSV file with degree and minute coordinates",
+    )
+    parser.add_argument("--output", help="TSV file to write (default: stdout)")
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        help="Columns to convert (default: the legs' coordinates and any *_lat/*_lon)",
+    )
+    parser.add_argument(
+        "--precision", type=int, default=3, help="Decimal places written"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Rows converted and written at a time",
+    )
+
+
+def run(args):
+    report = process_tsv(
+        args.input_file,
+        args.output,
+        columns=args.columns,
+        precision=args.precision,
+        batch_size=args.batch_size,
+    )
+    for line, column, reason in report["details"]:
+        print(f"{args.input_file} line {line} {column}: {reason}", file=sys.stderr)
+    if report["errors"]:
+        print(
+            f"Left out {report['rows'] - report['written']} of {report['rows']} rows"
+            f" with {report['errors']} invalid coordinates",
+            file=sys.stderr,
+        )
 
 
 # Example usage
 if __name__ == "__main__":
-    # Replace 'your_file.tsv' with the path to your TSV file
-    tsv_file_path = "globe_40_legs_2026.tsv"
-    process_tsv(tsv_file_path)
+    parser = argparse.ArgumentParser(
+        description="Print a legs TSV with its coordinates in decimal degrees."
+    )
+    add_arguments(parser)
+    run(parser.parse_args())
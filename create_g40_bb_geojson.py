@@ -1,19 +1,40 @@
 import geojson as gj
-import csv
 import argparse
 import os
+from globe40.areas import crosses_antimeridian
+from globe40.geometry import DEFAULT_SPACING_NM, DEFAULT_TOLERANCE, route_line
+from globe40.legs import read_legs
 
+# Decimal places of coordinates in compact output, about 11 m
+COMPACT_PRECISION = 4
 
-def process_row_into_area_feature(row):
+
+def box_ring(l, b, r, t):
+    """
+    Returns the closed ring of a bounding box.
+    """
+    return [(l, t), (l, b), (r, b), (r, t), (l, t)]
+
+
+def process_row_into_area_feature(row, precision=None):
     """
-    Function that processes a row into a bounding box feature
+    Function that processes a row into a bounding box feature. Boxes crossing the
+    antimeridian (bb_left east of bb_right) are cut at 180 degrees into a
+    MultiPolygon, as RFC 7946 asks, so maps do not draw them the long way round.
     """
-    l = int(row["bb_left"])
-    b = int(row["bb_bottom"])
-    r = int(row["bb_right"])
-    t = int(row["bb_top"])
+    l = float(row["bb_left"])
+    b = float(row["bb_bottom"])
+    r = float(row["bb_right"])
+    t = float(row["bb_top"])
+    if crosses_antimeridian([t, l, b, r]):
+        geometry = gj.MultiPolygon(
+            [[box_ring(*box)] for box in ((l, b, 180, t), (-180, b, r, t))],
+            precision=precision,
+        )
+    else:
+        geometry = gj.Polygon([box_ring(l, b, r, t)], precision=precision)
     return gj.Feature(
-        geometry=gj.Polygon([[(l, t), (l, b), (r, b), (r, t), (l, t)]]),
+        geometry=geometry,
         properties={
             "title": "{}".format(row["leg_name"]),
             "description": "{} to {}".format(row["start_city"], row["finish_city"]),
@@ -23,14 +44,14 @@ def process_row_into_area_feature(row):
     )
 
 
-def process_row_into_point_feature(row):
+def process_row_into_point_feature(row, precision=None):
     """
     Function that processes a row into a point feature
     """
     lat = float(row["start_lat"])
     lon = float(row["start_lon"])
     return gj.Feature(
-        geometry=gj.Point((lon, lat)),
+        geometry=gj.Point((lon, lat), precision=precision),
         properties={
             "title": "{}".format(row["start_city"]),
             "description": "{} to depart {} on {}".format(
@@ -40,41 +61,119 @@ def process_row_into_point_feature(row):
     )
 
 
-def process_tsv(input_file, output_file):
+def process_row_into_route_feature(
+    row, spacing_nm=DEFAULT_SPACING_NM, tolerance=DEFAULT_TOLERANCE, precision=None
+):
     """
-    Reads a TSV file and processes each row.
+    Function that processes a row into a great circle route feature from start
+    to finish, densified every spacing_nm and simplified to tolerance degrees. A
+    route crossing the antimeridian is cut at 180 degrees into a
+    MultiLineString. Returns None when the start and finish are the same.
     """
-    feature_list = []
-    with open(input_file, mode="r", newline="", encoding="utf-8") as tsvfile:
-        reader = csv.DictReader(tsvfile, delimiter="\t")
+    parts = route_line(
+        float(row["start_lat"]),
+        float(row["start_lon"]),
+        float(row["finish_lat"]),
+        float(row["finish_lon"]),
+        spacing_nm,
+        tolerance,
+    )
+    if not parts:
+        return None
+    if len(parts) == 1:
+        geometry = gj.LineString(parts[0], precision=precision)
+    else:
+        geometry = gj.MultiLineString(parts, precision=precision)
+    return gj.Feature(
+        geometry=geometry,
+        properties={
+            "title": "{}".format(row["leg_name"]),
+            "description": "Great circle from {} to {}".format(
+                row["start_city"], row["finish_city"]
+            ),
+            "stroke": row["leg_color_code"],
+        },
+    )
 
-        # Iterate over each row in the TSV file
-        for row in reader:
-            feature_list.append(process_row_into_area_feature(row))
-            feature_list.append(process_row_into_point_feature(row))
+
+def process_tsv(
+    input_file,
+    output_file,
+    compact=False,
+    spacing_nm=DEFAULT_SPACING_NM,
+    tolerance=DEFAULT_TOLERANCE,
+):
+    """
+    Reads a TSV file, or takes legs already read by read_legs, and processes each
+    row into its bounding box, start point and great circle route. With compact,
+    the file is written without indentation and with coordinates rounded to
+    COMPACT_PRECISION decimal places, for sending over slow links.
+    """
+    precision = COMPACT_PRECISION if compact else None
+    feature_list = []
+    for row in read_legs(input_file):
+        feature_list.append(process_row_into_area_feature(row, precision))
+        feature_list.append(process_row_into_point_feature(row, precision))
+        route = process_row_into_route_feature(row, spacing_nm, tolerance, precision)
+        if route is not None:
+            feature_list.append(route)
 
     # Create the GeoJSON FeatureCollection
     feature_collection = gj.FeatureCollection(feature_list)
 
     # Write the GeoJSON data to the output file
     with open(output_file, "w", encoding="utf-8") as f:
-        gj.dump(feature_collection, f, ensure_ascii=False, indent=2)
+        if compact:
+            gj.dump(feature_collection, f, ensure_ascii=False, separators=(",", ":"))
+        else:
+            gj.dump(feature_collection, f, ensure_ascii=False, indent=2)
 
 
-if __name__ == "__main__":
-    # Set up argument parser
-    parser = argparse.ArgumentParser(
-        description="Process a TSV file into a GeoJSON FeatureCollection."
-    )
+def add_arguments(parser):
     parser.add_argument("input_file", help="Path to the input TSV file")
+    parser.add_argument(
+        "--output",
+        help="GeoJSON file to write (default: the input file with .geojson)",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help=f"Write without indentation, rounding to {COMPACT_PRECISION} decimals",
+    )
+    parser.add_argument(
+        "--spacing-nm",
+        type=float,
+        default=DEFAULT_SPACING_NM,
+        help="Distance between points of the densified routes (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Degrees simplified routes may stray from the great circle "
+        "(default: %(default)s)",
+    )
 
-    # Parse the command-line arguments
-    args = parser.parse_args()
 
+def run(args):
     # Derive the output file name
-    input_file = args.input_file
-    output_file = os.path.splitext(input_file)[0] + ".geojson"
+    output_file = args.output or os.path.splitext(args.input_file)[0] + ".geojson"
 
     # Process the TSV file and generate the GeoJSON output
-    process_tsv(input_file, output_file)
+    process_tsv(
+        args.input_file,
+        output_file,
+        compact=args.compact,
+        spacing_nm=args.spacing_nm,
+        tolerance=args.tolerance,
+    )
     print(f"GeoJSON data has been written to {output_file}")
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Process a TSV file into a GeoJSON FeatureCollection."
+    )
+    add_arguments(parser)
+    run(parser.parse_args())
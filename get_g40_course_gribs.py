@@ -1,10 +1,27 @@
-import geojson as gj
-import csv
 import argparse
-import cdsapi
+import json
+from collections import Counter
+from pathlib import Path
 import globe40.reanalysis_retriever as rr
+from globe40.cache import GribCache, request_key
+from globe40.areas import NATIVE_GRID
+from globe40.chunker import DEFAULT_TARGET_BYTES, chunk_interval
+from globe40.corridor import DEFAULT_MARGIN_NM, corridor_windows
+from globe40.coverage import CoverageIndex
+from globe40.executor import RetrievalExecutor
+from globe40.journal import JobJournal
+from globe40.legs import read_legs
+from globe40.metrics import MetricsLog
+from globe40.planner import merged_leg_name, plan_estimate, plan_requests
+from globe40.scenarios import DEFAULT_YEAR_SHIFTS
+from globe40.tiling import corridor_tiles
 from globe40.utils import extend_interval, get_days_in_interval
 
+MERGED_OUTPUT_DIR = "./gribs/_merged"
+CACHE_DIR = "./gribs/_cache"
+JOURNAL_PATH = "./gribs/jobs.sqlite"
+METRICS_PATH = "./gribs/metrics.jsonl"
+
 
 def process_row_into_area(row):
     """
@@ -18,7 +35,7 @@ def process_row_into_area(row):
 
 
 def process_row_into_intervals(
-    row, percentage_to_change, days_either_end, year_shifts=[-6, -5, -4, -3, -2]
+    row, percentage_to_change, days_either_end, year_shifts=DEFAULT_YEAR_SHIFTS
 ):
     """
     Extends the interval based on the given percentage and days padding.
@@ -31,95 +48,609 @@ def process_row_into_intervals(
         )
 
 
-def generate_rows(input_file):
-    """
-    Reads rows from a TSV file as dictionaries.
+def process_row(
+    retriever,
+    row,
+    percentage_to_change,
+    days_either_end,
+    timesteps_key=None,
+    variable_set_key=None,
+    target_bytes=None,
+    grid=NATIVE_GRID,
+    year_shifts=DEFAULT_YEAR_SHIFTS,
+    corridor_days=None,
+    corridor_margin_nm=DEFAULT_MARGIN_NM,
+    max_tiles=None,
+):
     """
-    with open(input_file, mode="r", newline="", encoding="utf-8") as tsvfile:
-        reader = csv.DictReader(tsvfile, delimiter="\t")
-        for row in reader:
-            yield row
+    Processes each row and yields the required information for retrieval, one
+    interval per year shift.
 
+    By default each interval is split by calendar month. With target_bytes, the
+    interval is chunked by estimated request size for the given timesteps and
+    variable sets on the given grid instead; chunks that only cover part of a
+    month are labelled with their days so they get their own files.
 
-def process_row(retriever, row, percentage_to_change, days_either_end):
-    """
-    Processes each row and yields the required information for retrieval.
+    With corridor_days, each interval is first split into windows of that many
+    days, each fetched with the area around where the fleet can be during it,
+    corridor_margin_nm included, instead of the whole bounding box. Legs
+    without waypoints keep their bounding box, as their track is not known.
+
+    With max_tiles, each chunk is instead fetched as up to max_tiles rectangles
+    covering the leg's track buffered by corridor_margin_nm, one chunk per
+    rectangle labelled with its tile number; ingest stitches them back together.
+
+    Raises:
+    - ValueError: If both corridor_days and max_tiles are given.
     """
+    if corridor_days is not None and max_tiles is not None:
+        raise ValueError("Corridor windows and tiles cannot be combined.")
     area = process_row_into_area(row)
     leg_name = row["leg_name"]
+    tiles = (
+        None
+        if max_tiles is None
+        else corridor_tiles(row, corridor_margin_nm, max_tiles, grid=grid)
+    )
     for extended_start_date, extended_end_date in process_row_into_intervals(
-        row, percentage_to_change, days_either_end
+        row, percentage_to_change, days_either_end, year_shifts
     ):
+        if corridor_days is None:
+            windows = [(extended_start_date, extended_end_date, area)]
+        else:
+            windows = corridor_windows(
+                row,
+                extended_start_date,
+                extended_end_date,
+                days_either_end,
+                corridor_days,
+                corridor_margin_nm,
+                grid,
+            )
 
-        for year, month, days in get_days_in_interval(
-            extended_start_date, extended_end_date
-        ):
-            yield {
-                "year": year,
-                "month": month,
-                "days": days,
-                "leg_name": leg_name,
-                "area": area,
-                "output_dir": f"./gribs/{leg_name}",
-            }
+        chunks = []
+        for window_start, window_end, window_area in windows:
+            if target_bytes is None:
+                window_chunks = get_days_in_interval(window_start, window_end)
+            else:
+                window_chunks = chunk_interval(
+                    window_start,
+                    window_end,
+                    timesteps_key,
+                    variable_set_key,
+                    window_area,
+                    target_bytes=target_bytes,
+                    grid=grid,
+                )
+            chunks.extend((chunk, window_area) for chunk in window_chunks)
+        months = Counter((year, month) for (year, month, _), _ in chunks)
+        for (year, month, days), window_area in chunks:
+            label_days = days if months[(year, month)] > 1 else None
+            areas = [window_area] if tiles is None else tiles
+            for tile, chunk_area in enumerate(areas, start=1):
+                label_tile = tile if len(areas) > 1 else None
+                yield {
+                    "year": year,
+                    "month": month,
+                    "days": days,
+                    "leg_name": leg_name,
+                    "area": chunk_area,
+                    "output_dir": f"./gribs/{leg_name}",
+                    "period": (
+                        None
+                        if label_days is None and label_tile is None
+                        else rr.ReanalysisRetriever.period_label(
+                            year, month, label_days, label_tile
+                        )
+                    ),
+                }
 
 
 def fetch_grib_data(retriever, row_data, timesteps_key, variable_set_key):
     """
-    Fetches GRIB data based on the processed row data.
+    Fetches GRIB data based on the processed row data. variable_set_key may be a
+    list of keys, fetched with one request and split into one file per set.
     """
-    retriever.retrieve_reanalysis_grib(
+    output_paths = retriever.retrieve_variable_sets(
         year=row_data["year"],
         month=row_data["month"],
         day_range=row_data["days"],
         timesteps_key=timesteps_key,
-        variable_set_key=variable_set_key,
+        variable_set_keys=variable_set_key,
         leg_name=row_data["leg_name"],
         area=row_data["area"],
         output_dir=row_data["output_dir"],
+        period=row_data.get("period"),
     )
     print(
         f"Fetched GRIB data for {row_data['year']}-{row_data['month']} {row_data['days']} {row_data['area']} into {row_data['output_dir']}"
     )
+    return output_paths
+
+
+def fetch_planned_request(retriever, request, timesteps_key, variable_set_key):
+    """
+    Fetches a planned request. When it covers several legs, the union is fetched
+    once and each leg's days and area are cut from it into the leg's usual files,
+    one per variable set.
+    """
+    from globe40.grib_tools import subset_grib
+
+    if len(request["members"]) == 1:
+        fetch_grib_data(
+            retriever, request["members"][0], timesteps_key, variable_set_key
+        )
+        return
+
+    merged_path = retriever.retrieve_reanalysis_grib(
+        year=request["year"],
+        month=request["month"],
+        day_range=request["days"],
+        timesteps_key=timesteps_key,
+        variable_set_key=variable_set_key,
+        leg_name=merged_leg_name(request),
+        area=request["area"],
+        output_dir=MERGED_OUTPUT_DIR,
+        period=retriever.period_label(
+            request["year"], request["month"], request["days"]
+        ),
+    )
+    if merged_path is None:
+        return
+
+    for member in request["members"]:
+        for key in retriever.split_key(variable_set_key):
+            member_path = Path(member["output_dir"]) / retriever.output_filename(
+                member["leg_name"],
+                key,
+                member["year"],
+                member["month"],
+                timesteps_key,
+                member.get("period"),
+                retriever.grid,
+            )
+            count = subset_grib(
+                merged_path,
+                member_path,
+                days=member["days"],
+                area=retriever.snap_area(member["area"]),
+                short_names=retriever.short_names_for(key),
+            )
+            print(
+                f"Split {count} GRIB messages for {member['year']}-{member['month']} {member['days']} {member['area']} into {member_path}"
+            )
+
+
+def describe_job(job):
+    """
+    Returns a short progress label for a chunk or a planned request.
+    """
+    legs = ",".join(m["leg_name"] for m in job.get("members", [job]))
+    period = rr.ReanalysisRetriever.period_label(job["year"], job["month"])
+    return f"{legs} {period} ({len(job['days'])} days)"
+
+
+def job_key(job, timesteps_key, variable_set_key, grid=None):
+    """
+    Returns a stable journal key for a chunk or a planned request. The grid is
+    only part of the key when it is not the native one.
+    """
+    key = {
+        "leg": sorted(m["leg_name"] for m in job.get("members", [job])),
+        "year": job["year"],
+        "month": job["month"],
+        "day": job["days"],
+        "area": job["area"],
+        "time": timesteps_key,
+        "variable": rr.ReanalysisRetriever.split_key(variable_set_key),
+    }
+    if grid is not None:
+        key["grid"] = grid
+    return request_key("job", key)
+
+
+def job_outputs(job, timesteps_key, variable_set_key, grid=None):
+    """
+    Returns (path, request) for every file a chunk or planned request leaves in
+    the legs' directories, one per leg and variable set, with the request each
+    file answers.
+    """
+    retriever = rr.ReanalysisRetriever(None, grid=grid)
+    outputs = []
+    for member in job.get("members", [job]):
+        for key in retriever.split_key(variable_set_key):
+            path = Path(member["output_dir"]) / retriever.output_filename(
+                member["leg_name"],
+                key,
+                member["year"],
+                member["month"],
+                timesteps_key,
+                member.get("period"),
+                grid,
+            )
+            _, request = retriever.build_request(
+                member["year"],
+                member["month"],
+                member["days"],
+                timesteps_key,
+                key,
+                member["area"],
+            )
+            outputs.append((path, request))
+    return outputs
+
+
+def outputs_intact(job, timesteps_key, variable_set_key, grid=None):
+    """
+    Returns whether every file of a finished job is present, complete and holds
+    the messages its request asked for.
+    """
+    from globe40.grib_tools import GribIntegrityError, verify_grib
+
+    for path, request in job_outputs(job, timesteps_key, variable_set_key, grid):
+        try:
+            verify_grib(path, request)
+        except (OSError, GribIntegrityError) as e:
+            print(f"Re-queueing {describe_job(job)}: {e}")
+            return False
+    return True
+
+
+def write_plan(plan_path, jobs, timesteps_key, variable_set_key, grid=None):
+    """
+    Writes the estimate of a list of jobs to plan_path as JSON and prints its
+    totals.
+    """
+    plan = plan_estimate(jobs, timesteps_key, variable_set_key, grid or NATIVE_GRID)
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+    totals = plan["totals"]
+    print(
+        f"Planned {totals['requests']} requests, {totals['fields']} fields,"
+        f" {totals['bytes'] / 2**30:.2f} GiB, {totals['queue_seconds'] / 3600:.1f} h"
+        f" of CDS queue time ({totals['oversized']} over the field limit) into"
+        f" {plan_path}"
+    )
+    return plan
+
+
+def report_metrics(metrics):
+    """
+    Prints where a run spent its time waiting for and downloading requests.
+    """
+    if metrics is None:
+        return
+    summary = metrics.summary()
+    print(
+        f"Metrics {metrics.path}: {summary['requests']}, {summary['bytes'] / 2**20:.1f} MiB,"
+        f" queued {summary['queue_wait'] / 3600:.2f} h, processing"
+        f" {summary['processing'] / 3600:.2f} h, transfer"
+        f" {summary['transfer'] / 3600:.2f} h at {summary['throughput'] / 1e3:.1f} kB/s"
+    )
 
 
 def process_tsv(
-    input_file, percentage_to_change, days_either_end, timestep_key, variable_set_key
+    input_file,
+    percentage_to_change,
+    days_either_end,
+    timestep_key,
+    variable_set_key,
+    merge_requests=True,
+    max_in_flight=1,
+    cache_dir=CACHE_DIR,
+    journal_path=JOURNAL_PATH,
+    resume=False,
+    max_attempts=5,
+    retry_delay=60,
+    make_client=None,
+    target_bytes=DEFAULT_TARGET_BYTES,
+    use_coverage=True,
+    grid=None,
+    year_shifts=DEFAULT_YEAR_SHIFTS,
+    plan_path=None,
+    metrics_path=None,
+    metrics_textfile=None,
+    corridor_days=None,
+    corridor_margin_nm=DEFAULT_MARGIN_NM,
+    max_tiles=None,
 ):
     """
-    Reads a TSV file and processes each row using generators.
-    """
-    client = cdsapi.Client()
-    retriever = rr.ReanalysisRetriever(client)
+    Reads a TSV file, or takes legs already read by read_legs, and processes each
+    row using generators. variable_set_key is one key of
+    ReanalysisRetriever.VARIABLE_SETS or a list of keys fetched together
+    in one request per chunk. With merge_requests,
+    chunks of different legs that share a month are planned into combined requests.
+    Up to max_in_flight requests are queued at CDS at the same time. Requests
+    already in the cache at cache_dir are not sent again; None disables the cache.
+
+    Every job is recorded in the journal at journal_path and transient failures are
+    retried up to max_attempts times, waiting retry_delay seconds and doubling. With
+    resume, jobs the journal already has as done are skipped unless one of their
+    files is missing or damaged, in which case only that job is fetched again.
+    make_client builds the CDS client for each worker thread, cdsapi.Client by
+    default. Requests are chunked to about target_bytes each; None splits
+    strictly by calendar month.
+
+    With use_coverage, requests inside wider, longer or denser cached downloads
+    are cut out of them and only the uncovered remainder is fetched. grid sets
+    the output grid spacing in degrees for lighter overview runs; None keeps the
+    native 0.25 degrees. year_shifts are the years each leg's interval is moved
+    by, one window per shift. With corridor_days, each leg is fetched in windows
+    of that many days, each around where the fleet can be, as in process_row.
+    With max_tiles, each leg is fetched as up to that many rectangles around its
+    track instead of its bounding box.
 
-    # Use generators to process and fetch data
-    for row in generate_rows(input_file):
+    With plan_path, nothing is fetched: the planned requests, in the order they
+    would be sent, are written there as JSON with their estimated fields, bytes
+    and queue time and totals per leg and variable set.
+
+    With metrics_path, the queue wait, processing and transfer time, size,
+    throughput and attempt of every request sent to CDS are appended there as
+    JSON lines, and with metrics_textfile their totals are kept there for
+    node_exporter's textfile collector.
+    """
+    chunks = (
+        row_data
+        for row in read_legs(input_file)
         for row_data in process_row(
-            retriever, row, percentage_to_change, days_either_end
-        ):
-            fetch_grib_data(retriever, row_data, timestep_key, variable_set_key)
+            None,
+            row,
+            percentage_to_change,
+            days_either_end,
+            timestep_key,
+            variable_set_key,
+            target_bytes,
+            grid or NATIVE_GRID,
+            year_shifts,
+            corridor_days,
+            corridor_margin_nm,
+            max_tiles,
+        )
+    )
+    if merge_requests:
+        jobs = plan_requests(chunks, grid=grid or NATIVE_GRID)
+        fetch = fetch_planned_request
+    else:
+        jobs = chunks
+        fetch = fetch_grib_data
 
+    if plan_path is not None:
+        write_plan(plan_path, jobs, timestep_key, variable_set_key, grid)
+        return
 
-if __name__ == "__main__":
-    # Set up argument parser
-    parser = argparse.ArgumentParser(
-        description="Process a TSV file into a collection of gribfiles."
+    if make_client is None:
+        import cdsapi
+
+        make_client = cdsapi.Client
+
+    cache = None if cache_dir is None else GribCache(cache_dir)
+    coverage = (
+        CoverageIndex(cache, rr.ReanalysisRetriever.SHORT_NAMES)
+        if cache is not None and use_coverage
+        else None
+    )
+    metrics = (
+        None if metrics_path is None else MetricsLog(metrics_path, metrics_textfile)
+    )
+    executor = RetrievalExecutor(
+        lambda: rr.ReanalysisRetriever(
+            make_client(),
+            cache=cache,
+            raise_errors=journal_path is not None,
+            coverage=coverage,
+            grid=grid,
+            metrics=metrics,
+        ),
+        max_in_flight,
+    )
+
+    if journal_path is None:
+        executor.run(
+            jobs,
+            lambda retriever, job: fetch(
+                retriever, job, timestep_key, variable_set_key
+            ),
+            describe=describe_job,
+        )
+        report_metrics(metrics)
+        return
+
+    journal = JobJournal(journal_path)
+    keyed_jobs = []
+    for job in jobs:
+        key = job_key(job, timestep_key, variable_set_key, grid)
+        journal.add_job(key, job, describe_job(job))
+        finished = resume and journal.is_finished(key)
+        if finished and outputs_intact(job, timestep_key, variable_set_key, grid):
+            continue
+        if finished or not resume:
+            journal.reset(key)
+        keyed_jobs.append((key, job))
+
+    executor.run(
+        keyed_jobs,
+        lambda retriever, keyed: journal.run(
+            keyed[0],
+            lambda: fetch(retriever, keyed[1], timestep_key, variable_set_key),
+            max_attempts=max_attempts,
+            base_delay=retry_delay,
+        ),
+        describe=lambda keyed: describe_job(keyed[1]),
     )
+    print(f"Job journal {journal_path}: {journal.summary()}")
+    journal.close()
+    report_metrics(metrics)
+
+
+def add_arguments(parser):
+    """
+    Adds the options of a fetch run to an argparse parser.
+    """
     parser.add_argument("input_file", help="Path to the input TSV file")
+    parser.add_argument(
+        "--no-merge",
+        action="store_true",
+        help="Fetch every leg and month separately instead of merging overlapping requests",
+    )
+    parser.add_argument(
+        "--variable-sets",
+        nargs="+",
+        default=["waves"],
+        choices=sorted(rr.ReanalysisRetriever.VARIABLE_SETS),
+        help="Variable sets to fetch, combined into one request per chunk",
+    )
+    parser.add_argument(
+        "--target-mb",
+        type=float,
+        default=DEFAULT_TARGET_BYTES / 2**20,
+        help="Approximate size of each request in MiB; 0 splits by calendar month",
+    )
+    parser.add_argument(
+        "--grid",
+        type=float,
+        default=None,
+        help="Output grid spacing in degrees, e.g. 0.5 or 1 for overview runs (default: native 0.25)",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=1,
+        help="Number of requests queued at CDS at the same time (match your per-user limit)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=CACHE_DIR,
+        help="Directory of downloaded GRIBs keyed by request hash",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always download, without reading or writing the cache",
+    )
+    parser.add_argument(
+        "--no-coverage",
+        action="store_true",
+        help="Only reuse cached files for identical requests, never cut from wider ones",
+    )
+    parser.add_argument(
+        "--journal",
+        default=JOURNAL_PATH,
+        help="SQLite file recording the state of every planned request",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Only run requests the journal does not have as done",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=5,
+        help="Attempts per request before it is marked failed",
+    )
+    parser.add_argument(
+        "--retry-delay",
+        type=float,
+        default=60,
+        help="Seconds to wait after a first failure, doubling on each retry",
+    )
+
+    parser.add_argument(
+        "--plan",
+        metavar="PLAN_JSON",
+        help="Write the planned requests and their estimated cost here and exit without fetching",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=METRICS_PATH,
+        help="JSONL file each CDS request's timings, size and attempt are appended to",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        help="Prometheus text file for node_exporter, e.g. /var/lib/node_exporter/globe40.prom",
+    )
+    parser.add_argument(
+        "--stretch-percent",
+        type=float,
+        default=25,
+        help="Percentage to stretch each leg's duration by",
+    )
+    parser.add_argument(
+        "--padding-days",
+        type=int,
+        default=14,
+        help="Days of padding before and after each leg",
+    )
+    parser.add_argument(
+        "--year-shifts",
+        nargs="+",
+        type=int,
+        default=list(DEFAULT_YEAR_SHIFTS),
+        help="Years to shift each leg's dates by, one window per shift",
+    )
+    corridor = parser.add_mutually_exclusive_group()
+    corridor.add_argument(
+        "--corridor-days",
+        type=int,
+        help="Fetch each leg in windows of this many days, each only around where the fleet can be",
+    )
+    corridor.add_argument(
+        "--tiles",
+        type=int,
+        help="Fetch each leg as up to this many rectangles around its track instead of its bounding box",
+    )
+    parser.add_argument(
+        "--corridor-margin-nm",
+        type=float,
+        default=DEFAULT_MARGIN_NM,
+        help="Nautical miles kept around the track in corridor windows and tiles",
+    )
 
-    # Parse the command-line arguments
-    args = parser.parse_args()
 
-    # Define parameters for interval adjustment
-    percentage_to_change = 25
-    days_either_end = 14
+def add_plan_arguments(parser):
+    """
+    Adds the options of a fetch run, writing the plan to plan.json by default
+    instead of fetching.
+    """
+    add_arguments(parser)
+    parser.set_defaults(plan="plan.json")
+
+
+def run(args):
+    """
+    Fetches, or with args.plan only plans, the GRIBs for a parsed command line.
+    """
     timesteps_key = "6_hourly"
-    variable_set_key = "waves"
-    # Process the TSV file
     process_tsv(
         args.input_file,
-        percentage_to_change,
-        days_either_end,
+        args.stretch_percent,
+        args.padding_days,
         timesteps_key,
-        variable_set_key,
+        args.variable_sets,
+        merge_requests=not args.no_merge,
+        max_in_flight=args.max_in_flight,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        journal_path=args.journal,
+        resume=args.resume,
+        max_attempts=args.max_attempts,
+        retry_delay=args.retry_delay,
+        target_bytes=int(args.target_mb * 2**20) or None,
+        use_coverage=not args.no_coverage,
+        grid=args.grid,
+        year_shifts=args.year_shifts,
+        plan_path=args.plan,
+        metrics_path=args.metrics,
+        metrics_textfile=args.metrics_textfile,
+        corridor_days=args.corridor_days,
+        corridor_margin_nm=args.corridor_margin_nm,
+        max_tiles=args.tiles,
+    )
+
+
+if __name__ == "__main__":
+    # Set up argument parser
+    parser = argparse.ArgumentParser(
+        description="Process a TSV file into a collection of gribfiles."
     )
+    add_arguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,459 @@
+import hashlib
+import json
+import numpy as np
+from globe40.climatology import (
+    DEFAULT_BLOCK_STEPS,
+    DEFAULT_PERCENTILES,
+    WAVE_HEIGHT_BINS,
+    WAVE_THRESHOLDS,
+    WIND_ROSE_SPEED_BINS,
+    WIND_THRESHOLDS,
+    cell_histogram,
+    hours_per_step,
+    window_blocks,
+    window_times,
+    wind_rose_codes,
+    wind_speed,
+)
+
+# Directory under each leg of the store holding its statistics
+STATISTICS_DIR = "_statistics"
+
+# Wind speed histogram bin edges in m/s; percentiles are read from these bins
+WIND_SPEED_BINS = (*np.arange(0.0, 40.5, 0.5), np.inf)
+
+# Significant wave height histogram bin edges in metres, which include every
+# edge of WAVE_HEIGHT_BINS so its distribution can be summed from them
+WAVE_HEIGHT_FINE_BINS = (*np.arange(0.0, 15.25, 0.25), np.inf)
+
+N_ROSE_SECTORS = 16
+
+# Statistic kept per leg: the short names it is derived from, its histogram bin
+# edges (None for moments only) and its exceedance thresholds
+STATISTICS = {
+    "wind_speed": (("10u", "10v"), WIND_SPEED_BINS, WIND_THRESHOLDS),
+    "wind_rose": (
+        ("10u", "10v"),
+        np.arange(N_ROSE_SECTORS * (len(WIND_ROSE_SPEED_BINS) - 1) + 1),
+        (),
+    ),
+    "swh": (("swh",), WAVE_HEIGHT_FINE_BINS, WAVE_THRESHOLDS),
+    "msl": (("msl",), None, ()),
+}
+
+
+class CellStatistics:
+    """
+    Per-cell statistics of a lat x lon field that can be updated one window of
+    data at a time and merged with statistics of other windows: counts, mean and
+    sum of squared deviations (merged with Chan's formula), extremes, a
+    histogram on fixed bins and hours above each threshold. Merging costs the
+    size of the grid, not of the data behind it.
+    """
+
+    def __init__(self, shape, bins=None, thresholds=()):
+        self.shape = tuple(shape)
+        self.bins = None if bins is None else np.asarray(bins, dtype=np.float64)
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.windows = 0
+        self.steps = 0
+        self.count = np.zeros(self.shape, dtype=np.int64)
+        self.mean = np.zeros(self.shape)
+        self.m2 = np.zeros(self.shape)
+        self.minimum = np.full(self.shape, np.inf)
+        self.maximum = np.full(self.shape, -np.inf)
+        n_bins = 0 if self.bins is None else self.bins.size - 1
+        self.histogram = np.zeros((n_bins, *self.shape), dtype=np.int64)
+        self.hours_above = np.zeros((self.thresholds.size, *self.shape))
+
+    def _add_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            share = np.where(total > 0, count / total, 0.0)
+        self.mean = self.mean + delta * share
+        self.m2 = self.m2 + m2 + delta**2 * self.count * share
+        self.count = total
+
+    def update(self, data, step_hours):
+        """
+        Adds one window of data shaped time x lat x lon, ignoring NaN.
+
+        Returns:
+        - CellStatistics: self.
+        """
+        return self.update_blocks([data], step_hours)
+
+    def update_blocks(self, blocks, step_hours):
+        """
+        Adds one window of data given as consecutive time x lat x lon blocks,
+        one block at a time, ignoring NaN.
+
+        Returns:
+        - CellStatistics: self.
+        """
+        for data in blocks:
+            self._add_block(data, step_hours)
+        self.windows += 1
+        return self
+
+    def _add_block(self, data, step_hours):
+        data = np.asarray(data, dtype=np.float64)
+        valid = ~np.isnan(data)
+        count = valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, np.nansum(data, axis=0) / count, 0.0)
+        m2 = np.nansum((data - mean) ** 2, axis=0)
+        self._add_moments(count, mean, m2)
+        self.minimum = np.fmin(self.minimum, np.nanmin(data, axis=0, initial=np.inf))
+        self.maximum = np.fmax(self.maximum, np.nanmax(data, axis=0, initial=-np.inf))
+        if self.bins is not None:
+            self.histogram += cell_histogram(data, self.bins)
+        above = data[None] > self.thresholds[:, None, None, None]
+        self.hours_above += above.sum(axis=1) * step_hours
+        self.steps += data.shape[0]
+
+    def merge(self, other):
+        """
+        Adds the statistics of other windows into these.
+
+        Returns:
+        - CellStatistics: self.
+
+        Raises:
+        - ValueError: If the two have different grids, bins or thresholds.
+        """
+        same_bins = (self.bins is None) == (other.bins is None) and (
+            self.bins is None or np.array_equal(self.bins, other.bins)
+        )
+        if (
+            self.shape != other.shape
+            or not same_bins
+            or not np.array_equal(self.thresholds, other.thresholds)
+        ):
+            raise ValueError("Statistics with different grids or bins cannot merge.")
+        self._add_moments(other.count, other.mean, other.m2)
+        self.minimum = np.fmin(self.minimum, other.minimum)
+        self.maximum = np.fmax(self.maximum, other.maximum)
+        self.histogram += other.histogram
+        self.hours_above += other.hours_above
+        self.windows += other.windows
+        self.steps += other.steps
+        return self
+
+    @classmethod
+    def combine(cls, statistics):
+        """
+        Returns the merge of several statistics, leaving them unchanged.
+        """
+        statistics = list(statistics)
+        first = statistics[0]
+        combined = cls(first.shape, first.bins, first.thresholds)
+        for other in statistics:
+            combined.merge(other)
+        return combined
+
+    def variance(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    def means(self):
+        return np.where(self.count > 0, self.mean, np.nan)
+
+    def percentiles(self, q=DEFAULT_PERCENTILES):
+        """
+        Returns per-cell percentiles read from the histogram, interpolating
+        linearly within bins and keeping within the extremes, shaped
+        q x lat x lon. Where values are dense they are within a fraction of a
+        bin of np.nanpercentile; in a sparse tail they can be further off.
+        """
+        edges = np.broadcast_to(self.bins[:, None, None], (self.bins.size, *self.shape))
+        # Open ended bins are closed at the extremes seen
+        edges = np.clip(edges, self.minimum, self.maximum)
+        cumulative = np.cumsum(self.histogram, axis=0)
+        total = cumulative[-1] if cumulative.size else np.zeros(self.shape)
+        results = []
+        for p in np.atleast_1d(q):
+            # The value of rank r, counting from 0, is taken to sit r + 0.5 into
+            # the histogram, as if each bin spread its values evenly
+            target = p / 100.0 * np.maximum(total - 1, 0) + 0.5
+            k = np.minimum((cumulative < target).sum(axis=0), self.bins.size - 2)
+            k = k[None]
+            before = np.where(k > 0, np.take_along_axis(cumulative, k - 1, 0), 0)
+            inside = np.take_along_axis(self.histogram, k, 0)
+            low = np.take_along_axis(edges, k, 0)
+            high = np.take_along_axis(edges, k + 1, 0)
+            # Empty cells have no extremes, so their edges are meaningless
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fraction = np.clip((target - before) / inside, 0, 1)
+                value = low + np.where(inside > 0, fraction, 0) * (high - low)
+            results.append(np.where(total > 0, value[0], np.nan))
+        return np.stack(results)
+
+    def rebin(self, edges):
+        """
+        Returns the histogram summed into coarser bins whose edges are all edges
+        of this one's, shaped bin x lat x lon.
+
+        Raises:
+        - ValueError: If an edge is not one of the histogram's.
+        """
+        positions = np.searchsorted(self.bins, edges)
+        if positions.max() >= self.bins.size or not np.array_equal(
+            self.bins[positions], np.asarray(edges, dtype=np.float64)
+        ):
+            raise ValueError("Coarser bins must share the histogram's edges.")
+        return np.add.reduceat(self.histogram[: positions[-1]], positions[:-1], axis=0)
+
+    def mean_hours_above(self):
+        """
+        Returns the mean hours per window above each threshold, shaped
+        threshold x lat x lon.
+        """
+        return self.hours_above / max(self.windows, 1)
+
+    def save(self, path, source=""):
+        """
+        Saves the statistics as a .npz file, with source recording what they
+        were computed from.
+        """
+        arrays = {
+            "source": np.asarray(source),
+            "shape": np.asarray(self.shape),
+            "thresholds": self.thresholds,
+            "windows": np.asarray(self.windows),
+            "steps": np.asarray(self.steps),
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "histogram": self.histogram,
+            "hours_above": self.hours_above,
+        }
+        if self.bins is not None:
+            arrays["bins"] = self.bins
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            statistics = cls(
+                saved["shape"],
+                saved["bins"] if "bins" in saved.files else None,
+                saved["thresholds"],
+            )
+            statistics.windows = int(saved["windows"])
+            statistics.steps = int(saved["steps"])
+            for name in (
+                "count",
+                "mean",
+                "m2",
+                "minimum",
+                "maximum",
+                "histogram",
+                "hours_above",
+            ):
+                setattr(statistics, name, saved[name])
+        return statistics
+
+
+def statistic_values(name, parts):
+    """
+    Returns the values a statistic is kept of from its short names' values.
+    """
+    if name == "wind_speed":
+        return wind_speed(*parts)
+    if name == "wind_rose":
+        return wind_rose_codes(*parts, N_ROSE_SECTORS, WIND_ROSE_SPEED_BINS)
+    return parts[0]
+
+
+def window_statistics(store, leg_name, name, window, block_steps=DEFAULT_BLOCK_STEPS):
+    """
+    Computes one statistic of a leg over one (start_date, end_date) window,
+    reading block_steps time steps from the store at a time.
+
+    Returns:
+    - CellStatistics: The statistics, or None if the store has no data in the
+      window.
+    """
+    short_names, bins, thresholds = STATISTICS[name]
+    fields = [store.open(leg_name, s) for s in short_names]
+    times = window_times(fields[0], window)
+    if times.size == 0:
+        return None
+    statistics = CellStatistics(
+        (fields[0].lats.size, fields[0].lons.size), bins, thresholds
+    )
+    return statistics.update_blocks(
+        (
+            statistic_values(name, parts)
+            for parts in window_blocks(fields, window, block_steps)
+        ),
+        hours_per_step(times - times[0]),
+    )
+
+
+def statistics_path(store, leg_name, name, window):
+    start, end = window
+    return store.store_dir / leg_name / STATISTICS_DIR / name / f"{start}_{end}.npz"
+
+
+def window_source(store, leg_name, name, window):
+    """
+    Returns the number of time steps the store holds for a statistic's window
+    and a fingerprint of the data behind them: the grid's shape and origin and,
+    for each chunk overlapping the window, its name, times and the size and
+    modification time of its values. The fingerprint changes when GRIBs are
+    ingested into the window again, even with the same steps and grid.
+    """
+    field = store.open(leg_name, STATISTICS[name][0][0])
+    start = np.datetime64(window[0], "s")
+    end = np.datetime64(window[1], "s") + np.timedelta64(1, "D")
+    times = field.times
+    steps = int(np.searchsorted(times, end) - np.searchsorted(times, start))
+    chunks = []
+    for chunk in field.index["chunks"]:
+        if np.datetime64(chunk["end"]) < start or np.datetime64(chunk["start"]) >= end:
+            continue
+        stat = (field.directory / f"{chunk['name']}.npy").stat()
+        chunks.append(
+            [chunk["name"], chunk["start"], chunk["end"], chunk["length"]]
+            + [stat.st_size, stat.st_mtime_ns]
+        )
+    source = {
+        "steps": steps,
+        "shape": [field.lats.size, field.lons.size],
+        "origin": [float(field.lats[0]), float(field.lons[0])],
+        "chunks": sorted(chunks),
+    }
+    digest = hashlib.sha1(json.dumps(source).encode("utf-8")).hexdigest()
+    return steps, digest
+
+
+def available_statistics(store, leg_name):
+    variables = set(store.variables(leg_name))
+    return [name for name, spec in STATISTICS.items() if set(spec[0]) <= variables]
+
+
+def update_leg_statistics(store, leg_name, windows, names=None):
+    """
+    Saves each statistic of a leg for each window that has none yet, or whose
+    data in the store has changed since, e.g. after a new year's GRIBs are
+    ingested, a month is ingested again or the leg's grid moves. Windows
+    already summarised are not read again.
+
+    Parameters:
+    - store (FieldStore): The store holding the leg's decoded fields.
+    - leg_name (str): The leg to summarise.
+    - windows (list): (start_date, end_date) pairs, e.g. one per year shift.
+    - names (list): Statistics to update. None updates all the store allows.
+
+    Returns:
+    - list: Paths of the statistics written.
+    """
+    written = []
+    for name in available_statistics(store, leg_name) if names is None else names:
+        for window in windows:
+            path = statistics_path(store, leg_name, name, window)
+            steps, source = window_source(store, leg_name, name, window)
+            if path.exists():
+                with np.load(path) as saved:
+                    if "source" in saved.files and str(saved["source"]) == source:
+                        continue
+            if steps == 0:
+                path.unlink(missing_ok=True)
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            window_statistics(store, leg_name, name, window).save(path, source)
+            written.append(path)
+    return written
+
+
+def leg_statistics(store, leg_name, windows, names=None):
+    """
+    Returns each statistic of a leg per window, updating any that are missing
+    or stale first.
+
+    Returns:
+    - dict: Lists of CellStatistics keyed by statistic name, one per window in
+      order, with None for windows without data.
+    """
+    names = available_statistics(store, leg_name) if names is None else names
+    update_leg_statistics(store, leg_name, windows, names)
+    results = {}
+    for name in names:
+        paths = [statistics_path(store, leg_name, name, w) for w in windows]
+        results[name] = [CellStatistics.load(p) if p.exists() else None for p in paths]
+    return results
+
+
+def climatology_from_statistics(store, leg_name, per_window, q=DEFAULT_PERCENTILES):
+    """
+    Merges per-window statistics of a leg into the results of leg_climatology.
+
+    Parameters:
+    - store (FieldStore): The store holding the leg's decoded fields.
+    - leg_name (str): The leg summarised.
+    - per_window (dict): Lists of CellStatistics keyed by statistic name, one
+      per window in order, with None for windows without data.
+    - q (tuple): The percentiles to report.
+
+    Returns:
+    - dict: Result arrays keyed as by leg_climatology.
+    """
+    present = {
+        name: [s for s in statistics if s is not None]
+        for name, statistics in per_window.items()
+        if any(s is not None for s in statistics)
+    }
+    results = {}
+    if "wind_speed" in present:
+        speed = CellStatistics.combine(present["wind_speed"])
+        results["wind_speed_percentiles"] = speed.percentiles(q)
+        results["wind_speed_mean"] = speed.means()
+        results["wind_speed_std"] = np.sqrt(speed.variance())
+        results["wind_exceedance_hours"] = speed.mean_hours_above()
+    if "wind_rose" in present:
+        counts = CellStatistics.combine(present["wind_rose"]).histogram
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frequencies = counts / counts.sum(axis=0)
+        results["wind_rose"] = frequencies.reshape(
+            N_ROSE_SECTORS, len(WIND_ROSE_SPEED_BINS) - 1, *counts.shape[1:]
+        )
+    if "swh" in present:
+        swh = CellStatistics.combine(present["swh"])
+        results["wave_height_percentiles"] = swh.percentiles(q)
+        results["wave_height_mean"] = swh.means()
+        results["wave_height_std"] = np.sqrt(swh.variance())
+        results["wave_height_distribution"] = swh.rebin(WAVE_HEIGHT_BINS)
+        results["wave_exceedance_hours"] = swh.mean_hours_above()
+    if "msl" in present:
+        shape = present["msl"][0].shape
+        window_means = np.stack(
+            [
+                np.full(shape, np.nan) if s is None else s.means()
+                for s in per_window["msl"]
+            ]
+        )
+        results["mslp_anomaly"] = window_means - np.nanmean(window_means, axis=0)
+    for prefix, name in (("wind", "wind_speed"), ("wave", "swh"), ("mslp", "msl")):
+        if name in present:
+            field = store.open(leg_name, STATISTICS[name][0][0])
+            results[f"{prefix}_lats"] = field.lats
+            results[f"{prefix}_lons"] = field.lons
+    return results
+
+
+def streaming_climatology(store, leg_name, windows, q=DEFAULT_PERCENTILES):
+    """
+    Computes the results of leg_climatology from saved per-window statistics,
+    so adding a year or choosing other windows only reads the fields of windows
+    not summarised before.
+
+    Returns:
+    - dict: Result arrays keyed as by leg_climatology.
+    """
+    per_window = leg_statistics(store, leg_name, windows)
+    return climatology_from_statistics(store, leg_name, per_window, q)
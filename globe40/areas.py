@@ -0,0 +1,80 @@
+import math
+
+# Native ERA5 single levels grid spacing in degrees
+NATIVE_GRID = 0.25
+
+
+def normalise_longitude(lon):
+    """
+    Returns a longitude in [-180, 180), keeping 180 itself as 180.
+    """
+    if lon == 180:
+        return 180.0
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def crosses_antimeridian(area):
+    """
+    Returns whether an area [North, West, South, East] wraps across 180 degrees,
+    which leg boxes mark with a West edge east of the East edge, e.g. 150 to -70.
+    """
+    return area[1] > area[3]
+
+
+def area_width(area):
+    """
+    Returns the width of an area in degrees of longitude, going east from its
+    West edge, so a box from 150 to -70 is 140 degrees wide and not 220.
+    """
+    width = area[3] - area[1]
+    return width + 360 if width < 0 else width
+
+
+def split_antimeridian(area):
+    """
+    Returns an area as the sub-areas CDS can fetch: the area itself, or for an
+    area crossing 180 degrees its western part up to 180 and its eastern part
+    from -180.
+    """
+    if not crosses_antimeridian(area):
+        return [list(area)]
+    north, west, south, east = area
+    return [[north, west, south, 180], [north, -180, south, east]]
+
+
+def union_longitudes(west_a, east_a, west_b, east_b):
+    """
+    Returns the narrowest (west, east) range covering two longitude ranges, either
+    of which may cross 180 degrees.
+    """
+    width_a = area_width([0, west_a, 0, east_a])
+    width_b = area_width([0, west_b, 0, east_b])
+    candidates = [
+        (west_a, max(width_a, (west_b - west_a) % 360 + width_b)),
+        (west_b, max(width_b, (west_a - west_b) % 360 + width_a)),
+    ]
+    west, width = min(candidates, key=lambda c: c[1])
+    if width >= 360:
+        return -180, 180
+    return west, normalise_longitude(west + width)
+
+
+def snap_area(area, grid=NATIVE_GRID):
+    """
+    Returns an area with each edge moved outward to the nearest multiple of grid,
+    so a coarser grid still covers the whole box and its points line up with the
+    native grid.
+    """
+
+    def snap(value, round_edge):
+        # Rounded first so float noise such as 40.00000001 does not add a row
+        snapped = round_edge(round(value / grid, 6)) * grid
+        return value if abs(snapped - value) < 1e-9 else snapped
+
+    north, west, south, east = area
+    return [
+        min(snap(north, math.ceil), 90),
+        snap(west, math.floor),
+        max(snap(south, math.floor), -90),
+        snap(east, math.ceil),
+    ]
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# Request keys whose values are calendar numbers, normalised so "01" and 1 match
+NUMERIC_KEYS = ("year", "month", "day")
+
+
+def canonical_request(dataset, request):
+    """
+    Returns a normalised copy of a CDS request, with the dataset name included, so
+    equivalent requests always serialise the same way.
+    """
+    canonical = {"dataset": dataset}
+    for key, value in request.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        if key in NUMERIC_KEYS:
+            values = ["{}".format(int(v)) for v in values]
+        elif key == "area":
+            values = ["{:g}".format(float(v)) for v in values]
+        else:
+            values = ["{}".format(v) for v in values]
+        canonical[key] = values
+    return canonical
+
+
+def request_key(dataset, request):
+    """
+    Returns the content address of a request, a SHA-256 of its canonical form.
+    """
+    encoded = json.dumps(canonical_request(dataset, request), sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def file_checksum(path, block_size=1 << 20):
+    """
+    Returns the SHA-256 of a file, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class GribCache:
+    """
+    A directory of GRIB files named by the hash of the request that produced them,
+    with a JSON manifest recording size, checksum and the request itself.
+    """
+
+    MANIFEST_NAME = "manifest.json"
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.cache_dir / self.MANIFEST_NAME
+        self._lock = threading.Lock()
+        if self.manifest_path.exists():
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    def path_for(self, key):
+        """
+        Returns where the file for a key lives, whether or not it is present.
+        """
+        return self.cache_dir / f"{key}.grib"
+
+    def lookup(self, key, verify=False):
+        """
+        Returns the cached path for a key, or None when the file is missing, has the
+        wrong size or, with verify, the wrong checksum.
+        """
+        with self._lock:
+            entry = self.manifest.get(key)
+        path = self.path_for(key)
+        if entry is None or not path.exists():
+            return None
+        if path.stat().st_size != entry["size"]:
+            return None
+        if verify and file_checksum(path) != entry["checksum"]:
+            return None
+        return path
+
+    def entries(self):
+        """
+        Returns a snapshot of the manifest as a dictionary of key to entry, safe
+        to iterate while other threads store files.
+        """
+        with self._lock:
+            return dict(self.manifest)
+
+    def store(self, key, dataset, request, downloaded_path):
+        """
+        Moves a downloaded file into the cache and records it in the manifest.
+
+        Returns:
+        - Path: The cached path.
+        """
+        path = self.path_for(key)
+        os.replace(downloaded_path, path)
+        entry = {
+            "size": path.stat().st_size,
+            "checksum": file_checksum(path),
+            "request": canonical_request(dataset, request),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        with self._lock:
+            self.manifest[key] = entry
+            self._write_manifest()
+        return path
+
+    def _write_manifest(self):
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,115 @@
+import calendar
+import math
+from globe40.cost import CDS_FIELD_LIMIT, NATIVE_GRID, request_bytes, request_fields
+from globe40.utils import get_days_in_interval
+
+# Aim for requests of about this many bytes
+DEFAULT_TARGET_BYTES = 100 * 1024 * 1024
+
+# Extra fraction of days a cross-month merge may fetch and throw away
+DEFAULT_MAX_OVERFETCH = 0.15
+
+
+def split_days(days, max_days):
+    """
+    Splits a list of days into the fewest contiguous, evenly sized pieces of at
+    most max_days days.
+    """
+    pieces = math.ceil(len(days) / max_days)
+    size, extra = divmod(len(days), pieces)
+    result = []
+    start = 0
+    for i in range(pieces):
+        end = start + size + (1 if i < extra else 0)
+        result.append(days[start:end])
+        start = end
+    return result
+
+
+def fetched_days(year, months, days):
+    """
+    Returns how many days CDS returns for the product of months and days, not
+    counting days that do not exist in a month (such as 31 September).
+    """
+    return sum(
+        sum(1 for d in days if int(d) <= calendar.monthrange(year, month)[1])
+        for month in months
+    )
+
+
+def chunk_interval(
+    start_date,
+    end_date,
+    timesteps_key,
+    variable_set_key,
+    area,
+    target_bytes=DEFAULT_TARGET_BYTES,
+    max_fields=CDS_FIELD_LIMIT,
+    max_overfetch=DEFAULT_MAX_OVERFETCH,
+    grid=NATIVE_GRID,
+):
+    """
+    Splits an interval into requests sized from a cost model rather than always by
+    calendar month.
+
+    Months whose estimated size is above target_bytes or max_fields are split into
+    runs of days. Small neighbouring months of the same year are merged into one
+    request for several months, which CDS fetches as the product of the months and
+    the union of their days, as long as that stays under the targets and the days
+    of that product fetch at most max_overfetch more than needed.
+
+    Parameters:
+    - start_date (str): The start date in 'YYYY-MM-DD' format.
+    - end_date (str): The end date in 'YYYY-MM-DD' format.
+    - timesteps_key (str): A key of ReanalysisRetriever.TIMESTEPS.
+    - variable_set_key (str or list): A variable set key or list of keys.
+    - area (list): [North, West, South, East] in degrees.
+    - target_bytes (int): The request size to aim for.
+    - max_fields (int): The largest number of fields in one request.
+    - max_overfetch (float): Extra fraction of days a merge may add.
+    - grid (float): The grid spacing in degrees.
+
+    Returns:
+    - list: Tuples of (year, month, days) as from get_days_in_interval, where month
+      is a tuple of months for merged requests.
+
+    Raises:
+    - ValueError: If the start_date is after the end_date.
+    """
+    day_fields = request_fields(1, timesteps_key, variable_set_key)
+    day_bytes = request_bytes(day_fields, area, grid)
+    max_days = max(1, min(target_bytes // day_bytes, max_fields // day_fields))
+
+    pieces = []
+    for year, month, days in get_days_in_interval(start_date, end_date):
+        for part in split_days(days, max_days):
+            pieces.append(
+                {"year": year, "months": (month,), "days": part, "wanted": len(part)}
+            )
+
+    chunks = []
+    for piece in pieces:
+        if chunks:
+            last = chunks[-1]
+            days = sorted(
+                {int(d) for d in last["days"]} | {int(d) for d in piece["days"]}
+            )
+            months = last["months"] + piece["months"]
+            fetched = fetched_days(last["year"], months, days)
+            wanted = last["wanted"] + piece["wanted"]
+            if (
+                last["year"] == piece["year"]
+                and piece["months"][0] not in last["months"]
+                and fetched <= max_days
+                and fetched <= wanted * (1 + max_overfetch)
+            ):
+                last["days"] = ["{}".format(d) for d in days]
+                last["months"] = months
+                last["wanted"] = wanted
+                continue
+        chunks.append(piece)
+
+    return [
+        (c["year"], c["months"][0] if len(c["months"]) == 1 else c["months"], c["days"])
+        for c in chunks
+    ]
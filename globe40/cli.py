@@ -0,0 +1,78 @@
+import argparse
+import importlib
+import sys
+
+# Module, function adding its arguments and help of each subcommand. Modules are
+# only imported once their command is chosen, so e.g. clean never loads cdsapi.
+COMMANDS = {
+    "clean": (
+        "clean_tsv",
+        "add_arguments",
+        "Print a legs TSV with its coordinates in decimal degrees.",
+    ),
+    "bbox": (
+        "create_g40_bb_geojson",
+        "add_arguments",
+        "Write the legs' bounding boxes as a GeoJSON FeatureCollection.",
+    ),
+    "plan": (
+        "get_g40_course_gribs",
+        "add_plan_arguments",
+        "Write the requests a fetch would make and their cost, fetching nothing.",
+    ),
+    "fetch": (
+        "get_g40_course_gribs",
+        "add_arguments",
+        "Download the GRIBs for every leg.",
+    ),
+    "ingest": (
+        "globe40.store",
+        "add_arguments",
+        "Decode leg GRIB directories into a FieldStore.",
+    ),
+    "stats": (
+        "globe40.climatology",
+        "add_arguments",
+        "Print wind and wave climatology of each leg from a FieldStore.",
+    ),
+    "join": (
+        "globe40.tracks",
+        "add_arguments",
+        "Join a leg's stored fields onto a tracker export.",
+    ),
+}
+
+
+def build_parser():
+    """
+    Returns the top level parser, which only knows the command names.
+    """
+    parser = argparse.ArgumentParser(
+        prog="globe40", description="Weather data for the Globe40 legs."
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+    for name, (_, _, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=help_text, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs a globe40 subcommand. The command name is parsed first, then only its
+    module is imported to parse the rest of the arguments and run.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    command, rest = build_parser().parse_known_args(argv[:1])
+    module_name, adder_name, help_text = COMMANDS[command.command]
+    module = importlib.import_module(module_name)
+
+    parser = argparse.ArgumentParser(
+        prog=f"globe40 {command.command}", description=help_text
+    )
+    getattr(module, adder_name)(parser)
+    module.run(parser.parse_args(rest + argv[1:]))
+
+
+if __name__ == "__main__":
+    main()
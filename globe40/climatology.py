@@ -0,0 +1,223 @@
+import numpy as np
+from globe40.scenarios import DEFAULT_YEAR_SHIFTS
+from globe40.utils import extend_interval
+
+# Percentiles reported for wind speed and wave height
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90, 95, 99)
+
+# Wind speed thresholds in m/s (about 20, 25, 30 and 35 knots)
+WIND_THRESHOLDS = (10.3, 12.9, 15.4, 18.0)
+
+# Significant wave height thresholds in metres
+WAVE_THRESHOLDS = (2.5, 4.0, 6.0)
+
+# Wind rose speed bin edges in m/s, the last bin is open ended
+WIND_ROSE_SPEED_BINS = (0.0, 5.1, 10.3, 15.4, 20.6, np.inf)
+
+# Significant wave height histogram bin edges in metres
+WAVE_HEIGHT_BINS = (0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 8.0, np.inf)
+
+# Time steps read from the store at once, two days of hourly fields
+DEFAULT_BLOCK_STEPS = 48
+
+
+def window_times(field, window):
+    """
+    Returns the time steps a stored field holds within a (start_date, end_date)
+    window in 'YYYY-MM-DD' format, both days included.
+    """
+    start = np.datetime64(window[0], "s")
+    end = np.datetime64(window[1], "s") + np.timedelta64(1, "D")
+    times = field.times
+    return times[(times >= start) & (times < end)]
+
+
+def window_blocks(fields, window, block_steps=DEFAULT_BLOCK_STEPS):
+    """
+    Yields the values of fields sharing their time steps, such as 10u and 10v,
+    over a window, block_steps time steps at a time. Only one block of each
+    field is read from the store at once.
+
+    Parameters:
+    - fields (list): FieldArrays of one leg from the FieldStore.
+    - window (tuple): (start_date, end_date) in 'YYYY-MM-DD' format.
+    - block_steps (int): The most time steps in a block.
+
+    Yields:
+    - list: A time x lat x lon array per field, in the order of fields.
+    """
+    times = window_times(fields[0], window)
+    for first in range(0, times.size, block_steps):
+        block = times[first : first + block_steps]
+        yield [field.sel(block[0], block[-1])[1] for field in fields]
+
+
+def hours_per_step(offsets):
+    """
+    Returns the most common spacing between time steps in hours.
+    """
+    if offsets.size < 2:
+        return 24.0
+    steps = np.diff(offsets).astype("timedelta64[s]").astype(np.int64)
+    values, counts = np.unique(steps, return_counts=True)
+    return values[np.argmax(counts)] / 3600
+
+
+def wind_speed(u, v):
+    return np.hypot(u, v)
+
+
+def wind_direction(u, v):
+    """
+    Returns the direction the wind blows from in degrees, 0 for a northerly.
+    """
+    return np.mod(270.0 - np.degrees(np.arctan2(v, u)), 360.0)
+
+
+def cell_histogram(data, bins):
+    """
+    Returns per-cell counts of values falling in each bin, shaped bin x lat x lon,
+    using one bincount over all cells instead of a loop.
+    """
+    flat = data.reshape(-1, data.shape[-2] * data.shape[-1])
+    n_cells = flat.shape[1]
+    n_bins = len(bins) - 1
+    valid = ~np.isnan(flat)
+    index = np.clip(np.digitize(flat, bins) - 1, 0, n_bins - 1)
+    cells = np.broadcast_to(np.arange(n_cells), flat.shape)
+    counts = np.bincount((index * n_cells + cells)[valid], minlength=n_bins * n_cells)
+    return counts.reshape(n_bins, *data.shape[-2:])
+
+
+def wind_rose_codes(u, v, n_sectors=16, speed_bins=WIND_ROSE_SPEED_BINS):
+    """
+    Returns sector * speed bins + speed bin of each wind, NaN where it is missing,
+    so a wind rose is a histogram of the codes.
+    """
+    speed = wind_speed(u, v)
+    sector_width = 360.0 / n_sectors
+    sector = np.floor(
+        np.mod(wind_direction(u, v) + sector_width / 2, 360.0) / sector_width
+    )
+    n_speed = len(speed_bins) - 1
+    speed_index = np.clip(np.digitize(speed, speed_bins) - 1, 0, n_speed - 1)
+    return np.where(np.isnan(speed), np.nan, sector * n_speed + speed_index)
+
+
+def leg_climatology(
+    store, leg_name, windows, q=DEFAULT_PERCENTILES, block_steps=DEFAULT_BLOCK_STEPS
+):
+    """
+    Computes per-cell climatology for a leg over all year-shifted windows: wind
+    percentiles, rose and exceedance hours from 10u/10v, wave height
+    percentiles, distribution and exceedance hours from swh, and MSLP anomaly
+    maps from msl. Variables missing from the store are skipped.
+
+    Each window is reduced block_steps time steps at a time into mergeable
+    per-cell statistics, so memory use follows the grid and the block rather
+    than the number of windows and steps. Percentiles are read from histograms
+    with bins of 0.5 m/s of wind and 0.25 m of wave height.
+
+    Parameters:
+    - store (FieldStore): The store holding the leg's decoded fields.
+    - leg_name (str): The leg to summarise.
+    - windows (list): (start_date, end_date) pairs, one per year shift.
+    - q (tuple): The percentiles to report.
+    - block_steps (int): The most time steps read from the store at once.
+
+    Returns:
+    - dict: Result arrays keyed by name, plus means and standard deviations of
+      wind speed and wave height and the coordinates of each group as
+      wind_lats and wind_lons, wave_lats and wave_lons, mslp_lats and mslp_lons.
+      Waves come on a coarser grid than wind and pressure. mslp_anomaly has a
+      row per window, NaN for windows without data.
+    """
+    # The statistics build on this module's helpers, so are imported on use
+    from globe40.accumulators import (
+        available_statistics,
+        climatology_from_statistics,
+        window_statistics,
+    )
+
+    per_window = {
+        name: [
+            window_statistics(store, leg_name, name, window, block_steps)
+            for window in windows
+        ]
+        for name in available_statistics(store, leg_name)
+    }
+    return climatology_from_statistics(store, leg_name, per_window, q)
+
+
+def leg_windows(leg, percentage_to_change, days_either_end, year_shifts):
+    """
+    Returns the (start_date, end_date) window of a leg for each year shift.
+    """
+    return [
+        extend_interval(
+            leg["start_date"][:10],
+            leg["approx_finish_date"][:10],
+            percentage_to_change,
+            days_either_end,
+            year_shift,
+        )
+        for year_shift in year_shifts
+    ]
+
+
+def add_arguments(parser):
+    parser.add_argument("input_file", help="Path to the legs TSV file")
+    parser.add_argument("--store", default="./store", help="FieldStore directory")
+    parser.add_argument("--leg", nargs="+", help="Legs to summarise (default: all)")
+    parser.add_argument("--stretch-percent", type=float, default=25)
+    parser.add_argument("--padding-days", type=int, default=14)
+    parser.add_argument(
+        "--year-shifts", nargs="+", type=int, default=list(DEFAULT_YEAR_SHIFTS)
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep mergeable statistics per window in the store and only read"
+        " windows not summarised before",
+    )
+
+
+def run(args):
+    from globe40.legs import read_legs
+    from globe40.store import FieldStore
+
+    store = FieldStore(args.store)
+    stored = set(store.legs())
+    for leg in read_legs(args.input_file):
+        if leg.leg_name not in stored or (args.leg and leg.leg_name not in args.leg):
+            continue
+        windows = leg_windows(
+            leg, args.stretch_percent, args.padding_days, args.year_shifts
+        )
+        if args.incremental:
+            from globe40.accumulators import streaming_climatology
+
+            results = streaming_climatology(store, leg.leg_name, windows)
+        else:
+            results = leg_climatology(store, leg.leg_name, windows)
+        print(f"{leg.leg_name}: {leg.start_city} to {leg.finish_city}")
+        for name, label in (
+            ("wind_speed_percentiles", "wind speed m/s"),
+            ("wave_height_percentiles", "wave height m"),
+        ):
+            if name in results:
+                means = np.nanmean(results[name], axis=(1, 2))
+                values = ", ".join(
+                    f"p{p} {v:.1f}" for p, v in zip(DEFAULT_PERCENTILES, means)
+                )
+                print(f"  {label}: {values}")
+        for name, thresholds, unit in (
+            ("wind_exceedance_hours", WIND_THRESHOLDS, "m/s"),
+            ("wave_exceedance_hours", WAVE_THRESHOLDS, "m"),
+        ):
+            if name in results:
+                means = np.nanmean(results[name], axis=(1, 2))
+                values = ", ".join(
+                    f"{t:g} {unit} {h:.0f}" for t, h in zip(thresholds, means)
+                )
+                print(f"  hours above: {values}")
@@ -0,0 +1,195 @@
+import numpy as np
+from globe40.areas import NATIVE_GRID, area_width, normalise_longitude, snap_area
+from globe40.geometry import great_circle, unwrap_longitudes
+from globe40.routing import haversine_nm
+
+# Days of each corridor window, each fetched with its own area
+DEFAULT_WINDOW_DAYS = 7
+
+# Distance in nautical miles kept around the fleet's possible positions
+DEFAULT_MARGIN_NM = 600.0
+
+# Spacing in nautical miles of the track the fleet is assumed to follow
+TRACK_SPACING_NM = 50.0
+
+
+def parse_waypoints(text):
+    """
+    Parses a waypoints cell such as '-35 18; -40 60' into (lat, lon) pairs.
+    """
+    waypoints = []
+    for point in (text or "").split(";"):
+        if point.strip():
+            lat, lon = (float(v) for v in point.replace(",", " ").split())
+            waypoints.append((lat, lon))
+    return waypoints
+
+
+def leg_track(row, spacing_nm=TRACK_SPACING_NM):
+    """
+    Returns the track a leg's fleet is assumed to sail: great circles from the
+    start through any waypoints in the row's optional waypoints column to the
+    finish. Longitudes are continuous and start inside the leg's bounding box,
+    so they can be compared with its edges even across 180 degrees.
+
+    Returns:
+    - tuple: (lats, lons, fractions) where fractions are the share of the total
+      distance sailed at each point, from 0 to 1.
+    """
+    points = [
+        (float(row["start_lat"]), float(row["start_lon"])),
+        *parse_waypoints(row.get("waypoints")),
+        (float(row["finish_lat"]), float(row["finish_lon"])),
+    ]
+    lats, lons = [], []
+    for (lat1, lon1), (lat2, lon2) in zip(points[:-1], points[1:]):
+        part_lats, part_lons = great_circle(lat1, lon1, lat2, lon2, spacing_nm)
+        # Each part starts where the last one ended
+        lats.append(part_lats[bool(lats) :])
+        lons.append(part_lons[bool(lons) :])
+    lats, lons = np.concatenate(lats), unwrap_longitudes(np.concatenate(lons))
+    bb_left = float(row["bb_left"])
+    lons += bb_left + (lons[0] - bb_left) % 360.0 - lons[0]
+
+    distances = np.concatenate(
+        [[0.0], np.cumsum(haversine_nm(lats[:-1], lons[:-1], lats[1:], lons[1:]))]
+    )
+    total = distances[-1]
+    fractions = distances / total if total > 0 else np.zeros_like(distances)
+    return lats, lons, fractions
+
+
+def progress_bounds(first_days, last_days, fastest_days, slowest_days):
+    """
+    Returns the least and most of its track the fleet can have sailed from the
+    first to the last day of each window, counted from the start, if it finishes
+    between fastest_days and slowest_days after starting and keeps a steady
+    pace. Days before the start give 0 and days after the latest finish give 1.
+    """
+    first_days = np.asarray(first_days, dtype=np.float64)
+    last_days = np.asarray(last_days, dtype=np.float64)
+    least = np.clip(first_days / max(slowest_days, 1), 0.0, 1.0)
+    most = np.clip((last_days + 1) / max(min(fastest_days, slowest_days), 1), 0.0, 1.0)
+    return least, most
+
+
+def track_boxes(lats, lons, fractions, least, most):
+    """
+    Returns the bounding box of the part of the track between least and most
+    for each window, as continuous (north, west, south, east) arrays.
+    """
+    least, most = np.asarray(least)[:, None], np.asarray(most)[:, None]
+    inside = (fractions >= least) & (fractions <= most)
+    # The ends of each part are usually between two track points
+    end_lats = np.interp(np.hstack([least, most]), fractions, lats)
+    end_lons = np.interp(np.hstack([least, most]), fractions, lons)
+
+    def bound(values, ends, reduce, empty):
+        masked = np.where(inside, values, empty)
+        return reduce(np.hstack([reduce(masked, axis=1)[:, None], ends]), axis=1)
+
+    return (
+        bound(lats, end_lats, np.max, -np.inf),
+        bound(lons, end_lons, np.min, np.inf),
+        bound(lats, end_lats, np.min, np.inf),
+        bound(lons, end_lons, np.max, -np.inf),
+    )
+
+
+def corridor_area(box, bounding_box, margin_nm=DEFAULT_MARGIN_NM, grid=NATIVE_GRID):
+    """
+    Returns the area to fetch around a part of the track: its box, as from
+    track_boxes, widened by margin_nm, snapped outward to grid and kept within
+    the leg's bounding box [North, West, South, East].
+    """
+    north, west, south, east = box
+    margin_lat = margin_nm / 60.0
+    widest = min(max(abs(north), abs(south)) + margin_lat, 80.0)
+    margin_lon = margin_nm / (60.0 * np.cos(np.radians(widest)))
+
+    bb_north, bb_west, bb_south, _ = bounding_box
+    bb_east = bb_west + area_width(bounding_box)
+    north = min(north + margin_lat, bb_north)
+    south = max(south - margin_lat, bb_south)
+    west = max(west - margin_lon, bb_west)
+    east = min(east + margin_lon, bb_east)
+    if north <= south or east <= west:
+        return list(bounding_box)
+    north, west, south, east = snap_area([north, west, south, east], grid)
+    north, south = min(north, bb_north), max(south, bb_south)
+    west, east = max(west, bb_west), min(east, bb_east)
+    return [
+        float(north),
+        normalise_longitude(float(west)),
+        float(south),
+        normalise_longitude(float(east)),
+    ]
+
+
+def corridor_windows(
+    row,
+    start_date,
+    end_date,
+    days_either_end=0,
+    window_days=DEFAULT_WINDOW_DAYS,
+    margin_nm=DEFAULT_MARGIN_NM,
+    grid=NATIVE_GRID,
+):
+    """
+    Splits an interval of a leg into windows of window_days days, each with the
+    area around where the fleet can be during it rather than the whole leg's
+    bounding box. The fleet is assumed to leave days_either_end after the start
+    of the interval and sail the leg's track at a steady pace, finishing no
+    sooner than minimum_duration_days and no later than days_either_end before
+    its end. Neighbouring windows with the same area are joined.
+
+    The track is only known for legs with a waypoints column. Without one the
+    great circle from start to finish can cross land the fleet sails around,
+    e.g. Africa on the way from Mindelo to Reunion, so the whole interval is
+    returned as one window with the leg's bounding box.
+
+    Parameters:
+    - row (dict or Leg): The leg.
+    - start_date, end_date (str): The interval in 'YYYY-MM-DD' format, as from
+      extend_interval.
+    - days_either_end (int): The padding extend_interval added at either end.
+    - window_days (int): The length of each window.
+    - margin_nm (float): Distance kept around the fleet's possible positions.
+    - grid (float): The grid spacing the areas are snapped to.
+
+    Returns:
+    - list: (start_date, end_date, area) tuples in date order.
+    """
+    bounding_box = [
+        float(row["bb_top"]),
+        float(row["bb_left"]),
+        float(row["bb_bottom"]),
+        float(row["bb_right"]),
+    ]
+    if not parse_waypoints(row.get("waypoints")):
+        return [(start_date, end_date, bounding_box)]
+
+    first, last = np.datetime64(start_date, "D"), np.datetime64(end_date, "D")
+    leg_start = first + days_either_end
+    slowest_days = max(int((last - first).astype(np.int64)) - 2 * days_either_end, 0)
+    n_windows = -(-int((last - first).astype(np.int64) + 1) // window_days)
+    window_starts = first + np.arange(n_windows) * window_days
+    window_ends = np.minimum(window_starts + window_days - 1, last)
+
+    least, most = progress_bounds(
+        (window_starts - leg_start).astype(np.int64),
+        (window_ends - leg_start).astype(np.int64),
+        float(row.get("minimum_duration_days") or slowest_days),
+        slowest_days,
+    )
+    lats, lons, fractions = leg_track(row)
+    boxes = np.stack(track_boxes(lats, lons, fractions, least, most), axis=1)
+
+    windows = []
+    for window_start, window_end, box in zip(window_starts, window_ends, boxes):
+        area = corridor_area(box, bounding_box, margin_nm, grid)
+        if windows and windows[-1][2] == area:
+            windows[-1] = (windows[-1][0], str(window_end), area)
+        else:
+            windows.append((str(window_start), str(window_end), area))
+    return windows
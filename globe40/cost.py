@@ -0,0 +1,71 @@
+from globe40.areas import NATIVE_GRID, area_width
+from globe40.reanalysis_retriever import ReanalysisRetriever
+
+# CDS packs ERA5 fields at 16 bits per value
+BYTES_PER_VALUE = 2
+
+# Approximate size of the GRIB sections around each field's data
+BYTES_PER_MESSAGE = 200
+
+# Largest number of fields CDS accepts in one ERA5 request
+CDS_FIELD_LIMIT = 120000
+
+# Rough CDS queue model: mean wait before a request starts, then processing time
+# per field, as observed for ERA5 single levels
+QUEUE_DELAY_SECONDS = 120
+SECONDS_PER_FIELD = 0.2
+
+
+def area_grid_points(area, grid=NATIVE_GRID):
+    """
+    Returns the number of grid points inside an area. Areas crossing 180 degrees
+    are measured going east from their West edge.
+
+    Parameters:
+    - area (list): [North, West, South, East] in degrees.
+    - grid (float): The grid spacing in degrees.
+
+    Returns:
+    - int: The number of grid points.
+    """
+    north, west, south, east = area
+    rows = int(round((north - south) / grid)) + 1
+    cols = int(round(area_width(area) / grid)) + 1
+    return rows * cols
+
+
+def request_fields(n_days, timesteps_key, variable_set_key, n_months=1):
+    """
+    Returns the number of fields (GRIB messages) a request produces.
+
+    Parameters:
+    - n_days (int): Number of days requested in each month.
+    - timesteps_key (str): A key of ReanalysisRetriever.TIMESTEPS.
+    - variable_set_key (str or list): A variable set key, combined key or list of keys.
+    - n_months (int): Number of months the days are requested for.
+
+    Returns:
+    - int: The number of fields.
+    """
+    n_times = len(ReanalysisRetriever.TIMESTEPS[timesteps_key])
+    n_variables = len(ReanalysisRetriever.variables_for(variable_set_key))
+    return n_months * n_days * n_times * n_variables
+
+
+def request_bytes(n_fields, area, grid=NATIVE_GRID):
+    """
+    Returns the estimated size in bytes of n_fields fields over an area.
+    """
+    return n_fields * (
+        area_grid_points(area, grid) * BYTES_PER_VALUE + BYTES_PER_MESSAGE
+    )
+
+
+def queue_seconds(
+    n_fields, queue_delay=QUEUE_DELAY_SECONDS, seconds_per_field=SECONDS_PER_FIELD
+):
+    """
+    Returns the estimated time in seconds a request of n_fields fields spends in
+    the CDS queue and being processed, before its download starts.
+    """
+    return queue_delay + n_fields * seconds_per_field
@@ -0,0 +1,307 @@
+import os
+import shutil
+from pathlib import Path
+from globe40.areas import NATIVE_GRID, crosses_antimeridian
+from globe40.cache import canonical_request
+
+# Request keys that are sets of values a request is the cartesian product of
+SET_KEYS = ("variable", "year", "month", "day", "time")
+
+
+def area_of(canonical):
+    """
+    Returns the area of a canonical request as floats, or None for the globe.
+    """
+    if "area" not in canonical:
+        return None
+    return [float(v) for v in canonical["area"]]
+
+
+def area_contains(outer, inner):
+    """
+    Returns whether the outer area, None for the globe, contains the inner one.
+    """
+    if outer is None:
+        return True
+    if inner is None:
+        return False
+    return (
+        inner[0] <= outer[0]
+        and inner[1] >= outer[1]
+        and inner[2] >= outer[2]
+        and inner[3] <= outer[3]
+    )
+
+
+def area_intersection(area_a, area_b):
+    """
+    Returns the overlap of two areas, or None when they do not overlap.
+    """
+    north = min(area_a[0], area_b[0])
+    west = max(area_a[1], area_b[1])
+    south = max(area_a[2], area_b[2])
+    east = min(area_a[3], area_b[3])
+    if north < south or east < west:
+        return None
+    return [north, west, south, east]
+
+
+def request_grid(canonical):
+    """
+    Returns the grid spacing of a canonical request in degrees.
+    """
+    return float(canonical["grid"][0]) if "grid" in canonical else NATIVE_GRID
+
+
+def area_remainder(area, covered, grid=NATIVE_GRID):
+    """
+    Returns the strips of area outside covered, as up to four areas: full width
+    strips to the north and south and strips to the west and east between them.
+    Strips start one grid step from covered so no row or column is fetched twice.
+    """
+    north, west, south, east = area
+    c_north, c_west, c_south, c_east = covered
+    strips = []
+    if north > c_north:
+        strips.append([north, west, c_north + grid, east])
+    if south < c_south:
+        strips.append([c_south - grid, west, south, east])
+    if west < c_west:
+        strips.append([c_north, west, c_south, c_west - grid])
+    if east > c_east:
+        strips.append([c_north, c_east + grid, c_south, east])
+    return strips
+
+
+def with_values(canonical, key, values):
+    """
+    Returns a copy of a canonical request with one key replaced.
+    """
+    updated = dict(canonical)
+    updated[key] = values
+    return updated
+
+
+def with_area(canonical, area):
+    return with_values(canonical, "area", ["{:g}".format(v) for v in area])
+
+
+def request_size(canonical):
+    """
+    Returns the relative size of a canonical request, for ranking candidates.
+    """
+    size = 1
+    for key in SET_KEYS:
+        size *= len(canonical.get(key, [None]))
+    area = area_of(canonical)
+    if area is not None:
+        grid = request_grid(canonical)
+        size *= (area[0] - area[2] + grid) * (area[3] - area[1] + grid)
+    return size
+
+
+def fixed_keys_match(entry, canonical):
+    """
+    Returns whether every key that is not a set or the area is the same.
+    """
+    keys = (set(entry) | set(canonical)) - set(SET_KEYS) - {"area"}
+    return all(entry.get(k) == canonical.get(k) for k in keys)
+
+
+def covered_sets(entry, canonical, skip=None):
+    """
+    Returns whether the entry has every value of each set key, except skip.
+    """
+    return all(
+        set(canonical.get(key, [])) <= set(entry.get(key, []))
+        for key in SET_KEYS
+        if key != skip
+    )
+
+
+def split_request(entry, canonical):
+    """
+    Splits a request into the part an entry covers and the remainder, along a
+    single set key or the area.
+
+    Returns:
+    - tuple: (covered, remainders) as canonical requests, or None when the entry
+      covers nothing or would need a split along more than one key.
+    """
+    if not fixed_keys_match(entry, canonical):
+        return None
+    entry_area, area = area_of(entry), area_of(canonical)
+    # Areas across 180 degrees are fetched as two halves, which are indexed
+    if any(a is not None and crosses_antimeridian(a) for a in (entry_area, area)):
+        return None
+
+    if covered_sets(entry, canonical):
+        if area_contains(entry_area, area):
+            return canonical, []
+        if entry_area is None or area is None:
+            return None
+        overlap = area_intersection(entry_area, area)
+        if overlap is None:
+            return None
+        return with_area(canonical, overlap), [
+            with_area(canonical, strip)
+            for strip in area_remainder(area, overlap, request_grid(canonical))
+        ]
+
+    if not area_contains(entry_area, area):
+        return None
+    for key in SET_KEYS:
+        if not covered_sets(entry, canonical, skip=key):
+            continue
+        have = set(entry.get(key, []))
+        inside = [v for v in canonical.get(key, []) if v in have]
+        outside = [v for v in canonical.get(key, []) if v not in have]
+        if inside and outside:
+            return with_values(canonical, key, inside), [
+                with_values(canonical, key, outside)
+            ]
+    return None
+
+
+def to_request(canonical):
+    """
+    Turns a canonical request back into a dataset name and CDS request.
+    """
+    request = {}
+    for key, values in canonical.items():
+        if key == "dataset":
+            continue
+        if key == "area":
+            request[key] = [float(v) for v in values]
+        elif key in SET_KEYS or len(values) != 1:
+            request[key] = list(values)
+        else:
+            request[key] = values[0]
+    return canonical["dataset"], request
+
+
+class CoverageIndex:
+    """
+    Answers requests from what is already in a GribCache. Each cached file is
+    indexed by the variables, dates, times and area of its request, so a request
+    inside a wider, longer or denser download is cut out of it locally and only
+    the days, times, variables or area strips no file covers are left to fetch.
+    """
+
+    def __init__(self, cache, short_names):
+        """
+        Parameters:
+        - cache (GribCache): The cache to index.
+        - short_names (dict): GRIB short name of each CDS variable name.
+        """
+        self.cache = cache
+        self.short_names = short_names
+
+    def entries(self):
+        """
+        Returns (path, canonical request) for every file present in the cache.
+        """
+        entries = []
+        for key, entry in self.cache.entries().items():
+            path = self.cache.lookup(key)
+            if path is not None:
+                entries.append((path, entry["request"]))
+        return entries
+
+    def plan(self, dataset, request, max_depth=4):
+        """
+        Works out how much of a request the cache can fill.
+
+        Each step takes the cached file covering the largest part of what is
+        still missing, splitting along one key or the area, and carries on with
+        the remainders up to max_depth levels.
+
+        Returns:
+        - tuple: (sources, missing) where sources are (path, canonical request)
+          pairs to cut from cached files and missing are (dataset, request)
+          pairs still to be fetched.
+        """
+        entries = self.entries()
+        sources, missing = [], []
+        pending = [(canonical_request(dataset, request), 0)]
+        while pending:
+            canonical, depth = pending.pop()
+            best = None
+            for path, entry in entries:
+                split = split_request(entry, canonical)
+                if split is None:
+                    continue
+                if best is None or request_size(split[0]) > request_size(best[1]):
+                    best = (path, *split)
+            if best is None or (best[2] and depth >= max_depth):
+                missing.append(to_request(canonical))
+                continue
+            sources.append((best[0], best[1]))
+            pending.extend((remainder, depth + 1) for remainder in best[2])
+        return sources, missing
+
+    def extract(self, path, canonical, output_path):
+        """
+        Cuts the part of a cached file described by a canonical request into
+        output_path.
+
+        Returns:
+        - int: The number of messages written.
+        """
+        from globe40.grib_tools import subset_grib
+
+        variables = canonical.get("variable")
+        return subset_grib(
+            path,
+            output_path,
+            days=canonical.get("day"),
+            area=area_of(canonical),
+            short_names=(
+                None
+                if variables is None
+                else [self.short_names.get(v, v) for v in variables]
+            ),
+            years=canonical.get("year"),
+            months=canonical.get("month"),
+            times=canonical.get("time"),
+        )
+
+    def assemble(self, sources, output_path, area=None):
+        """
+        Writes the parts of every source into one GRIB file covering area. Parts
+        that split the request by date, time or variable are written one after
+        the other; parts that split it by area are stitched back into one grid
+        per message. The file is built under a temporary name and renamed when
+        complete.
+
+        Returns:
+        - int: The number of messages written.
+        """
+        from globe40.grib_tools import stitch_grib
+
+        output_path = Path(output_path)
+        part_paths = [
+            output_path.with_name(f"{output_path.name}.{n}.piece")
+            for n in range(len(sources))
+        ]
+        try:
+            count = sum(
+                self.extract(path, canonical, part_path)
+                for (path, canonical), part_path in zip(sources, part_paths)
+            )
+            if area is not None and any(
+                area_of(canonical) != [float(v) for v in area]
+                for _, canonical in sources
+            ):
+                return stitch_grib(part_paths, output_path, area)
+
+            tmp_path = output_path.with_name(output_path.name + ".assemble")
+            with open(tmp_path, "wb") as out:
+                for part_path in part_paths:
+                    with open(part_path, "rb") as part:
+                        shutil.copyfileobj(part, out)
+            os.replace(tmp_path, output_path)
+            return count
+        finally:
+            for part_path in part_paths:
+                part_path.unlink(missing_ok=True)
@@ -0,0 +1,82 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class RetrievalExecutor:
+    """
+    Runs retrieval jobs on a pool of threads with a bounded number of requests in
+    flight. Each worker thread gets its own retriever from make_retriever, so
+    clients holding an HTTP session are never shared between threads.
+    """
+
+    def __init__(self, make_retriever, max_in_flight=1):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1.")
+        self.make_retriever = make_retriever
+        self.max_in_flight = max_in_flight
+        self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _retriever(self):
+        if not hasattr(self._local, "retriever"):
+            self._local.retriever = self.make_retriever()
+        return self._local.retriever
+
+    def _run_job(self, fetch, job, label):
+        with self._lock:
+            self._in_flight += 1
+            in_flight = self._in_flight
+        self.logger.info(f"Started: {label} ({in_flight} in flight)")
+        started = time.monotonic()
+        try:
+            return fetch(self._retriever(), job)
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._in_flight -= 1
+            self.logger.debug(f"Finished: {label} after {elapsed:.1f}s")
+
+    def run(self, jobs, fetch, describe=str):
+        """
+        Runs fetch(retriever, job) for every job and reports progress as jobs finish.
+
+        Parameters:
+        - jobs (iterable): The jobs to run, submitted in order.
+        - fetch (callable): Called as fetch(retriever, job) on a worker thread.
+        - describe (callable): Returns a short label for a job used in progress logs.
+
+        Returns:
+        - list: One dictionary per job, in submission order, with job, result,
+          error and elapsed (seconds from start of the run to completion).
+        """
+        jobs = list(jobs)
+        outcomes = [None] * len(jobs)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            futures = {
+                pool.submit(self._run_job, fetch, job, describe(job)): index
+                for index, job in enumerate(jobs)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                index = futures[future]
+                elapsed = time.monotonic() - started
+                error = future.exception()
+                outcomes[index] = {
+                    "job": jobs[index],
+                    "result": None if error else future.result(),
+                    "error": error,
+                    "elapsed": elapsed,
+                }
+                if error:
+                    self.logger.error(
+                        f"[{done}/{len(jobs)}] Failed: {describe(jobs[index])}. {error}"
+                    )
+                else:
+                    self.logger.info(
+                        f"[{done}/{len(jobs)}] Done: {describe(jobs[index])} at {elapsed:.1f}s"
+                    )
+        return outcomes
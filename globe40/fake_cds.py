@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+import eccodes
+import numpy as np
+from globe40.cost import request_bytes
+from globe40.grib_tools import as_list, request_messages
+from globe40.reanalysis_retriever import ReanalysisRetriever
+
+
+def write_synthetic_grib(path, request, grid=0.25, seed=0):
+    """
+    Writes a GRIB file shaped like the CDS response to a request: one regular
+    lat/lon message per variable, day and time over the request area, holding a
+    smooth synthetic field.
+
+    Parameters:
+    - path (str or Path): The GRIB file to write.
+    - request (dict): A request as built by ReanalysisRetriever.build_request.
+    - grid (float): The grid spacing in degrees, unless the request has one.
+    - seed (int): Seed for the synthetic values.
+
+    Returns:
+    - int: The number of messages written.
+    """
+    if "grid" in request:
+        grid = float(as_list(request["grid"])[0])
+    north, west, south, east = (float(v) for v in request["area"])
+    ni = int(round((east - west) / grid)) + 1
+    nj = int(round((north - south) / grid)) + 1
+    lats = np.linspace(north, south, nj)[:, None]
+    lons = np.linspace(west, east, ni)[None, :]
+    rng = np.random.default_rng(seed)
+
+    prototype = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib1")
+    eccodes.codes_set(prototype, "Ni", ni)
+    eccodes.codes_set(prototype, "Nj", nj)
+    eccodes.codes_set(prototype, "iDirectionIncrementInDegrees", grid)
+    eccodes.codes_set(prototype, "jDirectionIncrementInDegrees", grid)
+    eccodes.codes_set(prototype, "latitudeOfFirstGridPointInDegrees", north)
+    eccodes.codes_set(prototype, "longitudeOfFirstGridPointInDegrees", west)
+    eccodes.codes_set(prototype, "latitudeOfLastGridPointInDegrees", south)
+    eccodes.codes_set(prototype, "longitudeOfLastGridPointInDegrees", east)
+
+    count = 0
+    try:
+        with open(path, "wb") as out:
+            for variable, year, month, day, hour in request_messages(request):
+                gid = eccodes.codes_clone(prototype)
+                try:
+                    eccodes.codes_set(
+                        gid,
+                        "shortName",
+                        ReanalysisRetriever.SHORT_NAMES.get(variable, "2t"),
+                    )
+                    eccodes.codes_set(gid, "dataDate", year * 10000 + month * 100 + day)
+                    eccodes.codes_set(gid, "dataTime", int(hour.replace(":", "")))
+                    phase = rng.uniform(0, 2 * np.pi)
+                    values = 10 + 5 * np.sin(np.radians(lats) * 3 + phase) * np.cos(
+                        np.radians(lons) * 2
+                    )
+                    eccodes.codes_set_values(gid, values.ravel())
+                    eccodes.codes_write(gid, out)
+                finally:
+                    eccodes.codes_release(gid)
+                count += 1
+    finally:
+        eccodes.codes_release(prototype)
+    return count
+
+
+class FakeCDSServer:
+    """
+    An in-process stand-in for the CDS queue. Requests wait in the queue, run at
+    most max_running at a time for the whole user, take processing time in
+    proportion to their field count, fail transiently at failure_rate and return
+    a synthetic GRIB.
+
+    All delays are in simulated seconds and are multiplied by time_scale before
+    sleeping, so a day of queueing can be replayed in a few seconds. Writing the
+    synthetic GRIB is real work that is not scaled, so benchmarks should use a
+    coarse grid to keep it small next to the simulated delays.
+
+    With transfer_grid, downloads take as long as the request would take at that
+    grid, e.g. the native 0.25 degrees, and are recorded at that size, so the
+    transfer time is sized from the request rather than from the coarse
+    synthetic GRIB.
+
+    The queue delay and failure of each attempt are drawn from seed, the request
+    and how many times it was submitted before, not from the order requests
+    arrive in, so runs with the same seed see the same delays and failures
+    however many requests are in flight.
+    """
+
+    def __init__(
+        self,
+        max_running=2,
+        queue_delay=60,
+        seconds_per_field=0.5,
+        bytes_per_second=5e6,
+        failure_rate=0.0,
+        grid=0.25,
+        time_scale=0.001,
+        seed=0,
+        transfer_grid=None,
+    ):
+        self.max_running = max_running
+        self.queue_delay = queue_delay
+        self.seconds_per_field = seconds_per_field
+        self.bytes_per_second = bytes_per_second
+        self.failure_rate = failure_rate
+        self.grid = grid
+        self.time_scale = time_scale
+        self.transfer_grid = transfer_grid
+        self.logger = logging.getLogger(__name__)
+        self._slots = threading.BoundedSemaphore(max_running)
+        self._lock = threading.Lock()
+        self.seed = seed
+        self._attempts = {}
+        self.records = []
+        self.running = 0
+        self.peak_running = 0
+
+    def client(self):
+        """
+        Returns a client bound to this server, a drop-in for cdsapi.Client().
+        """
+        return FakeCDSClient(self)
+
+    def _sleep(self, seconds):
+        time.sleep(seconds * self.time_scale)
+
+    def _simulated(self, wall_seconds):
+        return wall_seconds / self.time_scale
+
+    def submit(self, dataset, request):
+        """
+        Queues and processes a request, returning its result once it has
+        completed at the server, as cdsapi does when no target is given.
+        """
+        key = json.dumps([dataset, request], sort_keys=True)
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+        draws = random.Random(f"{self.seed}:{attempt}:{key}")
+        queue_delay = draws.expovariate(1 / self.queue_delay) if self.queue_delay else 0
+        fails = draws.random() < self.failure_rate
+        seed = draws.randrange(1 << 30)
+        fields = sum(1 for _ in request_messages(request))
+        submitted = time.monotonic()
+
+        self._sleep(queue_delay)
+        with self._slots:
+            started = time.monotonic()
+            self.logger.info("Request is running")
+            with self._lock:
+                self.running += 1
+                self.peak_running = max(self.peak_running, self.running)
+            self._sleep(fields * self.seconds_per_field)
+            with self._lock:
+                self.running -= 1
+        processed = time.monotonic()
+        if fails:
+            self._record(dataset, request, submitted, started, processed, 0, "failed")
+            raise ConnectionError("503 Server Error: Service Unavailable (simulated)")
+        return FakeCDSResult(
+            self, dataset, request, seed, (submitted, started, processed)
+        )
+
+    def retrieve(self, dataset, request, target):
+        self.submit(dataset, request).download(target)
+
+    def _record(self, dataset, request, submitted, started, processed, size, state):
+        finished = time.monotonic()
+        with self._lock:
+            self.records.append(
+                {
+                    "dataset": dataset,
+                    "state": state,
+                    "fields": sum(1 for _ in request_messages(request)),
+                    "bytes": size,
+                    "queue_wait": self._simulated(started - submitted),
+                    "processing": self._simulated(processed - started),
+                    "transfer": self._simulated(finished - processed),
+                    "latency": self._simulated(finished - submitted),
+                    "submitted": submitted,
+                    "finished": finished,
+                }
+            )
+
+
+class FakeCDSResult:
+    """
+    A completed request waiting to be downloaded, like cdsapi's Result.
+    """
+
+    def __init__(self, server, dataset, request, seed, times):
+        self.server = server
+        self.dataset = dataset
+        self.request = request
+        self.seed = seed
+        self.times = times
+
+    def download(self, target):
+        server = self.server
+        write_synthetic_grib(target, self.request, grid=server.grid, seed=self.seed)
+        if server.transfer_grid is None:
+            size = os.path.getsize(target)
+        else:
+            size = request_bytes(
+                sum(1 for _ in request_messages(self.request)),
+                [float(v) for v in self.request["area"]],
+                server.transfer_grid,
+            )
+        server._sleep(size / server.bytes_per_second)
+        server._record(self.dataset, self.request, *self.times, size, "completed")
+        return target
+
+
+class FakeCDSClient:
+    """
+    Implements the part of the cdsapi.Client interface the retriever uses.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def retrieve(self, name, request, target=None):
+        result = self.server.submit(name, request)
+        if target is not None:
+            result.download(target)
+        return result
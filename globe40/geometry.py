@@ -0,0 +1,162 @@
+import numpy as np
+
+# Mean radius of the Earth in nautical miles
+EARTH_RADIUS_NM = 3440.065
+
+# Spacing in nautical miles between points of a densified great circle
+DEFAULT_SPACING_NM = 25.0
+
+# Largest distance in degrees a simplified line may stray from the dense one
+DEFAULT_TOLERANCE = 0.05
+
+
+def to_unit_vectors(lats, lons):
+    """
+    Returns points as unit vectors on the sphere, shaped ... x 3.
+    """
+    lats, lons = np.radians(lats), np.radians(lons)
+    return np.stack(
+        [np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)],
+        axis=-1,
+    )
+
+
+def from_unit_vectors(vectors):
+    """
+    Returns unit vectors as (lats, lons) in degrees, lons in [-180, 180].
+    """
+    x, y, z = np.moveaxis(vectors, -1, 0)
+    return np.degrees(np.arctan2(z, np.hypot(x, y))), np.degrees(np.arctan2(y, x))
+
+
+def great_circle(lat1, lon1, lat2, lon2, spacing_nm=DEFAULT_SPACING_NM):
+    """
+    Returns the great circle from one point to another as points at most
+    spacing_nm apart, all interpolated in one pass.
+
+    Returns:
+    - tuple: (lats, lons) arrays in degrees, including both ends.
+
+    Raises:
+    - ValueError: If the points are antipodal, so no single great circle joins
+      them.
+    """
+    a, b = to_unit_vectors([lat1, lat2], [lon1, lon2])
+    angle = np.arctan2(np.linalg.norm(np.cross(a, b)), np.dot(a, b))
+    if np.pi - angle < 1e-9:
+        raise ValueError("Antipodal points have no single great circle.")
+    n_segments = max(int(np.ceil(angle * EARTH_RADIUS_NM / spacing_nm)), 1)
+    fractions = np.linspace(0.0, 1.0, n_segments + 1)[:, None]
+    if angle < 1e-12:
+        vectors = np.repeat(a[None], n_segments + 1, axis=0)
+    else:
+        vectors = (
+            np.sin((1 - fractions) * angle) * a + np.sin(fractions * angle) * b
+        ) / np.sin(angle)
+    lats, lons = from_unit_vectors(vectors)
+    # Keep the ends exact rather than as they come back from the vectors
+    lats[[0, -1]], lons[[0, -1]] = [lat1, lat2], [lon1, lon2]
+    return lats, lons
+
+
+def unwrap_longitudes(lons):
+    """
+    Returns longitudes made continuous, so a line crossing 180 degrees runs on
+    past it, e.g. 179, 181 instead of 179, -179.
+    """
+    return np.degrees(np.unwrap(np.radians(lons)))
+
+
+def simplify(xs, ys, tolerance=DEFAULT_TOLERANCE):
+    """
+    Returns the indices of the points Douglas-Peucker keeps from a line. Each
+    step measures every point of the span being split at once, so only the
+    number of points kept is looped over.
+
+    Parameters:
+    - xs, ys (array): Coordinates of the line, in the same units as tolerance.
+    - tolerance (float): Largest distance a point may be from the simplified line.
+
+    Returns:
+    - array: Sorted indices of the kept points, always including both ends.
+    """
+    xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    n_points = xs.size
+    if n_points < 3:
+        return np.arange(n_points)
+    keep = np.zeros(n_points, dtype=bool)
+    keep[[0, -1]] = True
+    spans = [(0, n_points - 1)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        dx, dy = xs[last] - xs[first], ys[last] - ys[first]
+        px, py = xs[first + 1 : last] - xs[first], ys[first + 1 : last] - ys[first]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(px * dy - py * dx) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            spans.extend([(first, middle), (middle, last)])
+    return np.flatnonzero(keep)
+
+
+def split_antimeridian_line(lons, lats):
+    """
+    Cuts a line with continuous longitudes, as from unwrap_longitudes, where it
+    crosses 180 degrees, adding the crossing point to both sides.
+
+    Returns:
+    - list: Parts of the line as lists of (lon, lat) with lons in [-180, 180].
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    # Which copy of the globe each point is on; a change is a crossing
+    worlds = np.floor((lons + 180.0) / 360.0).astype(np.int64)
+    crossings = np.flatnonzero(np.diff(worlds))
+    edges = 360.0 * np.maximum(worlds[crossings], worlds[crossings + 1]) - 180.0
+    fractions = (edges - lons[crossings]) / (lons[crossings + 1] - lons[crossings])
+    edge_lats = lats[crossings] + fractions * (lats[crossings + 1] - lats[crossings])
+
+    bounds = np.concatenate([[0], crossings + 1, [lons.size]])
+    parts = []
+    for k in range(bounds.size - 1):
+        part_lons = list(lons[bounds[k] : bounds[k + 1]])
+        part_lats = list(lats[bounds[k] : bounds[k + 1]])
+        if k > 0:
+            part_lons.insert(0, edges[k - 1])
+            part_lats.insert(0, edge_lats[k - 1])
+        if k < crossings.size:
+            part_lons.append(edges[k])
+            part_lats.append(edge_lats[k])
+        shift = 360.0 * worlds[bounds[k]]
+        part = [
+            (float(lon - shift), float(lat)) for lon, lat in zip(part_lons, part_lats)
+        ]
+        # A line ending exactly on 180 degrees leaves a part of one repeated point
+        if len(set(part)) > 1:
+            parts.append(part)
+    return parts
+
+
+def route_line(
+    lat1, lon1, lat2, lon2, spacing_nm=DEFAULT_SPACING_NM, tolerance=DEFAULT_TOLERANCE
+):
+    """
+    Returns the great circle between two points as it should be drawn on a map:
+    densified on the sphere, simplified in degrees so only points where the
+    line visibly bends are kept, and cut at 180 degrees.
+
+    Returns:
+    - list: One or, for a route crossing 180 degrees, two lists of (lon, lat);
+      none when both points are the same.
+    """
+    lats, lons = great_circle(lat1, lon1, lat2, lon2, spacing_nm)
+    lons = unwrap_longitudes(lons)
+    kept = simplify(lons, lats, tolerance)
+    return split_antimeridian_line(lons[kept], lats[kept])
@@ -0,0 +1,481 @@
+import calendar
+import eccodes
+import numpy as np
+import os
+from pathlib import Path
+
+# Tolerance used when comparing grid coordinates to area edges
+GRID_EPSILON = 1e-6
+
+
+class GribIntegrityError(Exception):
+    """
+    Raised for a GRIB file that is cut short, has bytes after its last message or
+    holds a different number of messages than its request asked for.
+    """
+
+
+def iter_grib_handles(path):
+    """
+    Yields an eccodes handle for each message in a GRIB file. Each handle is
+    released once the caller moves on to the next message.
+
+    Parameters:
+    - path (str or Path): The GRIB file to read.
+
+    Yields:
+    - int: An eccodes handle id.
+    """
+    with open(path, "rb") as f:
+        while True:
+            gid = eccodes.codes_grib_new_from_file(f)
+            if gid is None:
+                break
+            try:
+                yield gid
+            finally:
+                eccodes.codes_release(gid)
+
+
+def as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def request_messages(request):
+    """
+    Yields (variable, year, month, day, time) for every field a request covers.
+    Days that do not exist in a month, e.g. 30 February, are skipped as CDS does.
+    """
+    for variable in as_list(request["variable"]):
+        for year in as_list(request["year"]):
+            for month in as_list(request["month"]):
+                last_day = calendar.monthrange(int(year), int(month))[1]
+                for day in as_list(request["day"]):
+                    if int(day) > last_day:
+                        continue
+                    for hour in as_list(request["time"]):
+                        yield variable, int(year), int(month), int(day), hour
+
+
+def grib_message_count(path):
+    """
+    Counts the messages in a GRIB file, checking that every message is complete
+    and that the file ends where its last message does.
+
+    Raises:
+    - GribIntegrityError: If the file is cut short or has trailing bytes.
+    """
+    size = os.path.getsize(path)
+    count = 0
+    end = 0
+    try:
+        for gid in iter_grib_handles(path):
+            count += 1
+            end = int(eccodes.codes_get(gid, "offset")) + eccodes.codes_get(
+                gid, "totalLength"
+            )
+    except eccodes.CodesInternalError as e:
+        raise GribIntegrityError(
+            f"{path} is cut short after {count} complete messages: {e}"
+        ) from e
+    if end != size:
+        raise GribIntegrityError(
+            f"{path} has {size - end} bytes after its last complete message"
+        )
+    return count
+
+
+def verify_grib(path, request=None):
+    """
+    Checks that a GRIB file is complete and, given the request that produced it,
+    holds one message per variable, day and time of the request.
+
+    Returns:
+    - int: The number of messages.
+
+    Raises:
+    - GribIntegrityError: If the file is damaged or has the wrong message count.
+    """
+    count = grib_message_count(path)
+    if request is not None:
+        expected = sum(1 for _ in request_messages(request))
+        if count != expected:
+            raise GribIntegrityError(
+                f"{path} holds {count} messages where {expected} were requested"
+            )
+    return count
+
+
+def message_grid(gid):
+    """
+    Returns the latitudes and longitudes of a regular lat/lon message.
+    """
+    nj = eccodes.codes_get(gid, "Nj")
+    ni = eccodes.codes_get(gid, "Ni")
+    lat0 = eccodes.codes_get(gid, "latitudeOfFirstGridPointInDegrees")
+    lon0 = eccodes.codes_get(gid, "longitudeOfFirstGridPointInDegrees")
+    dlat = eccodes.codes_get(gid, "jDirectionIncrementInDegrees")
+    dlon = eccodes.codes_get(gid, "iDirectionIncrementInDegrees")
+    if eccodes.codes_get(gid, "jScansPositively") == 0:
+        dlat = -dlat
+    return lat0 + dlat * np.arange(nj), lon0 + dlon * np.arange(ni)
+
+
+def message_time(gid):
+    """
+    Returns the valid time of a message as a numpy datetime64.
+    """
+    date = eccodes.codes_get(gid, "dataDate")
+    time = eccodes.codes_get(gid, "dataTime")
+    return np.datetime64(
+        f"{date // 10000:04d}-{date // 100 % 100:02d}-{date % 100:02d}"
+        f"T{time // 100:02d}:{time % 100:02d}",
+        "s",
+    )
+
+
+def message_values(gid):
+    """
+    Returns the values of a message as a float32 (lat, lon) array, with missing
+    points (e.g. land in wave fields) as NaN. The whole message is decoded;
+    cropping happens afterwards.
+    """
+    values = eccodes.codes_get_values(gid).astype(np.float32)
+    if eccodes.codes_get(gid, "bitmapPresent"):
+        values[values == eccodes.codes_get(gid, "missingValue")] = np.nan
+    return values.reshape(eccodes.codes_get(gid, "Nj"), eccodes.codes_get(gid, "Ni"))
+
+
+def area_indexes(lats, lons, area):
+    """
+    Returns the row and column index ranges of a grid that fall inside an area.
+
+    Parameters:
+    - lats, lons (array): The grid coordinates.
+    - area (list): [North, West, South, East] in degrees.
+
+    Returns:
+    - tuple: ((first_row, last_row), (first_col, last_col)), inclusive.
+
+    Raises:
+    - ValueError: If the grid has no points inside the area.
+    """
+    north, west, south, east = area
+    rows = np.nonzero(
+        (lats >= south - GRID_EPSILON) & (lats <= north + GRID_EPSILON)
+    )[0]
+    width = (east - west) % 360
+    if width == 0 and east != west:
+        # A full 360 degree band, e.g. West -180 and East 180
+        width = 360
+    cols = np.nonzero(((lons - west) % 360) <= width + GRID_EPSILON)[0]
+    if rows.size == 0 or cols.size == 0:
+        raise ValueError(f"No grid points of the message fall inside area {area}.")
+    return (rows[0], rows[-1]), (cols[0], cols[-1])
+
+
+def grid_index_ranges(gid, area):
+    """
+    Returns the row and column index ranges of a regular lat/lon message that fall
+    inside an area, as from area_indexes.
+    """
+    return area_indexes(*message_grid(gid), area)
+
+
+def crop_message(gid, area):
+    """
+    Returns a new eccodes handle holding the part of a regular lat/lon message that
+    falls inside an area. The caller is responsible for releasing it.
+    """
+    lats, lons = message_grid(gid)
+    (j0, j1), (i0, i1) = area_indexes(lats, lons, area)
+    values = eccodes.codes_get_values(gid).reshape(lats.size, lons.size)
+    values = values[j0 : j1 + 1, i0 : i1 + 1]
+
+    clone = eccodes.codes_clone(gid)
+    eccodes.codes_set(clone, "Ni", int(i1 - i0 + 1))
+    eccodes.codes_set(clone, "Nj", int(j1 - j0 + 1))
+    eccodes.codes_set(clone, "latitudeOfFirstGridPointInDegrees", lats[j0])
+    eccodes.codes_set(clone, "latitudeOfLastGridPointInDegrees", lats[j1])
+    eccodes.codes_set(clone, "longitudeOfFirstGridPointInDegrees", lons[i0])
+    eccodes.codes_set(clone, "longitudeOfLastGridPointInDegrees", lons[i1])
+    eccodes.codes_set_values(clone, values.ravel())
+    return clone
+
+
+def time_code(value):
+    """
+    Returns the GRIB dataTime of a CDS time such as "06:00", e.g. 600.
+    """
+    return int(str(value).replace(":", ""))
+
+
+def subset_grib(
+    input_path,
+    output_path,
+    days=None,
+    area=None,
+    short_names=None,
+    years=None,
+    months=None,
+    times=None,
+):
+    """
+    Writes the messages of a GRIB file that match a set of dates, times and
+    variables, cropped to an area, into a new GRIB file.
+
+    Parameters:
+    - input_path (str or Path): The GRIB file to read.
+    - output_path (str or Path): The GRIB file to write.
+    - days (list): Days of the month to keep, as ints or strings. None keeps all days.
+    - area (list): [North, West, South, East] to crop to. None keeps the full grid.
+    - short_names (list): GRIB short names to keep. None keeps all variables.
+    - years, months (list): Years and months to keep. None keeps all.
+    - times (list): Times of day to keep, as "HH:MM". None keeps all times.
+
+    Returns:
+    - int: The number of messages written.
+    """
+    filters = {
+        key: {convert(v) for v in values}
+        for key, values, convert in (
+            ("day", days, int),
+            ("month", months, int),
+            ("year", years, int),
+            ("dataTime", times, time_code),
+        )
+        if values is not None
+    }
+    wanted_names = None if short_names is None else set(short_names)
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Written under a temporary name and renamed, so a crash never leaves a
+    # truncated file and an existing hard link is replaced, not written through
+    tmp_path = output_path.with_name(output_path.name + ".part")
+    count = 0
+    with open(tmp_path, "wb") as out:
+        for gid in iter_grib_handles(input_path):
+            if any(
+                eccodes.codes_get(gid, key) not in wanted
+                for key, wanted in filters.items()
+            ):
+                continue
+            if (
+                wanted_names is not None
+                and eccodes.codes_get(gid, "shortName") not in wanted_names
+            ):
+                continue
+            if area is None:
+                eccodes.codes_write(gid, out)
+            else:
+                cropped = crop_message(gid, area)
+                try:
+                    eccodes.codes_write(cropped, out)
+                finally:
+                    eccodes.codes_release(cropped)
+            count += 1
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def stitch_grib(input_paths, output_path, area):
+    """
+    Writes one message per variable, date and time covering an area, pieced
+    together from GRIB files that each hold part of it on the same grid, e.g. a
+    cached file cut to an overlap and the strips fetched around it. Pieces are
+    read back one message at a time by file offset, so only one output field is
+    held in memory. Points no piece covers are written as missing.
+
+    Parameters:
+    - input_paths (list): The GRIB files holding the pieces.
+    - output_path (str or Path): The GRIB file to write.
+    - area (list): [North, West, South, East] of the output grid.
+
+    Returns:
+    - int: The number of messages written.
+    """
+    pieces = {}
+    for path in input_paths:
+        for gid in iter_grib_handles(path):
+            key = tuple(
+                eccodes.codes_get(gid, k) for k in ("shortName", "dataDate", "dataTime")
+            )
+            pieces.setdefault(key, []).append(
+                (path, int(eccodes.codes_get(gid, "offset")))
+            )
+
+    north, west, south, east = area
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + ".part")
+    count = 0
+    with open(tmp_path, "wb") as out:
+        for key_pieces in pieces.values():
+            prototype = None
+            try:
+                for path, offset in key_pieces:
+                    with open(path, "rb") as f:
+                        f.seek(offset)
+                        gid = eccodes.codes_grib_new_from_file(f)
+                    try:
+                        if prototype is None:
+                            prototype = eccodes.codes_clone(gid)
+                            dlat = eccodes.codes_get(
+                                gid, "jDirectionIncrementInDegrees"
+                            )
+                            dlon = eccodes.codes_get(
+                                gid, "iDirectionIncrementInDegrees"
+                            )
+                            missing = eccodes.codes_get(gid, "missingValue")
+                            values = np.full(
+                                (
+                                    int(round((north - south) / dlat)) + 1,
+                                    int(round((east - west) % 360 / dlon)) + 1,
+                                ),
+                                missing,
+                                dtype=float,
+                            )
+                        lats, lons = message_grid(gid)
+                        rows = np.rint((north - lats) / dlat).astype(int)
+                        cols = np.rint(((lons - west) % 360) / dlon).astype(int)
+                        values[np.ix_(rows, cols)] = eccodes.codes_get_values(
+                            gid
+                        ).reshape(lats.size, lons.size)
+                    finally:
+                        eccodes.codes_release(gid)
+
+                nj, ni = values.shape
+                eccodes.codes_set(prototype, "Ni", ni)
+                eccodes.codes_set(prototype, "Nj", nj)
+                eccodes.codes_set(prototype, "latitudeOfFirstGridPointInDegrees", north)
+                eccodes.codes_set(prototype, "latitudeOfLastGridPointInDegrees", south)
+                eccodes.codes_set(prototype, "longitudeOfFirstGridPointInDegrees", west)
+                # Continuous across 180 degrees, e.g. 150 to 290 rather than -70
+                eccodes.codes_set(
+                    prototype,
+                    "longitudeOfLastGridPointInDegrees",
+                    west + (ni - 1) * dlon,
+                )
+                if (values == missing).any():
+                    eccodes.codes_set(prototype, "bitmapPresent", 1)
+                eccodes.codes_set_values(prototype, values.ravel())
+                eccodes.codes_write(prototype, out)
+                count += 1
+            finally:
+                if prototype is not None:
+                    eccodes.codes_release(prototype)
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def iter_messages(path, short_names=None, area=None, start=None, end=None):
+    """
+    Yields the messages of a GRIB file one at a time, so memory use does not grow
+    with the file. Variable and time filters are checked on the message header,
+    so messages they reject are never decoded. Messages that are kept are
+    decoded in full and then cropped to the area; decoding only the points
+    inside it with codes_get_double_elements was no faster.
+
+    Parameters:
+    - path (str or Path): The GRIB file to read.
+    - short_names (list): GRIB short names to keep. None keeps all variables.
+    - area (list): [North, West, South, East] to crop to. None keeps the full grid.
+    - start, end (str or datetime64): Inclusive time range to keep.
+
+    Yields:
+    - dict: short_name, time (datetime64[s]), lats, lons and values (float32,
+      lat x lon, NaN where missing).
+    """
+    filters = message_filters(short_names, start, end)
+    for gid in iter_grib_handles(path):
+        if message_wanted(gid, *filters):
+            yield decode_message(gid, area)
+
+
+def message_filters(short_names=None, start=None, end=None):
+    """
+    Returns the variable and time filters of iter_messages as a set of short
+    names and datetime64 bounds, each None when not given.
+    """
+    return (
+        None if short_names is None else set(short_names),
+        None if start is None else np.datetime64(start, "s"),
+        None if end is None else np.datetime64(end, "s"),
+    )
+
+
+def message_wanted(gid, wanted_names, start, end):
+    """
+    Returns whether a message passes filters from message_filters, reading only
+    its header.
+    """
+    if wanted_names is not None:
+        if eccodes.codes_get(gid, "shortName") not in wanted_names:
+            return False
+    time = message_time(gid)
+    return (start is None or time >= start) and (end is None or time <= end)
+
+
+def decode_message(gid, area=None):
+    """
+    Decodes a message in full and crops it to an area.
+
+    Returns:
+    - dict: short_name, time, lats, lons and values, as yielded by iter_messages.
+    """
+    lats, lons = message_grid(gid)
+    values = message_values(gid)
+    if area is not None:
+        (j0, j1), (i0, i1) = area_indexes(lats, lons, area)
+        lats, lons = lats[j0 : j1 + 1], lons[i0 : i1 + 1]
+        values = values[j0 : j1 + 1, i0 : i1 + 1]
+    return {
+        "short_name": eccodes.codes_get(gid, "shortName"),
+        "time": message_time(gid),
+        "lats": lats,
+        "lons": lons,
+        "values": values,
+    }
+
+
+def iter_time_steps(path, short_names=None, area=None, start=None, end=None):
+    """
+    Yields one time step at a time, in time order, with every variable valid at
+    it. Messages are grouped by their dataDate and dataTime rather than by their
+    order in the file, since CDS files holding several variables list them one
+    variable after another. The headers are read first, then the messages of
+    each step are read back by file offset, so only one time step is held in
+    memory.
+
+    Parameters:
+    - Same as iter_messages.
+
+    Yields:
+    - dict: time, lats, lons and fields, a dictionary of short name to values.
+    """
+    filters = message_filters(short_names, start, end)
+    offsets = {}
+    for gid in iter_grib_handles(path):
+        if message_wanted(gid, *filters):
+            key = tuple(eccodes.codes_get(gid, k) for k in ("dataDate", "dataTime"))
+            offsets.setdefault(key, []).append(int(eccodes.codes_get(gid, "offset")))
+
+    with open(path, "rb") as f:
+        for key in sorted(offsets):
+            step = None
+            for offset in offsets[key]:
+                f.seek(offset)
+                gid = eccodes.codes_grib_new_from_file(f)
+                try:
+                    message = decode_message(gid, area)
+                finally:
+                    eccodes.codes_release(gid)
+                if step is None:
+                    step = {
+                        "time": message["time"],
+                        "lats": message["lats"],
+                        "lons": message["lons"],
+                        "fields": {},
+                    }
+                step["fields"][message["short_name"]] = message["values"]
+            yield step
@@ -0,0 +1,172 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Error message fragments CDS uses for requests that will never succeed
+PERMANENT_ERROR_MARKERS = (
+    "not valid",
+    "invalid",
+    "no data",
+    "not available",
+    "not found",
+)
+
+PENDING = "pending"
+RUNNING = "running"
+RETRYING = "retrying"
+DONE = "done"
+FAILED = "failed"
+
+
+def is_transient_error(error):
+    """
+    Returns True if an error is worth retrying, e.g. a dropped connection or a
+    busy queue, and False for malformed requests or missing data.
+    """
+    if isinstance(error, (ValueError, KeyError, TypeError)):
+        return False
+    message = str(error).lower()
+    return not any(marker in message for marker in PERMANENT_ERROR_MARKERS)
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    Returns the wait before the next attempt, doubling with every failed attempt.
+    """
+    return min(max_delay, base_delay * 2 ** (attempt - 1))
+
+
+class JobJournal:
+    """
+    A SQLite record of every planned retrieval job with its state, attempt count,
+    last error and timings, so an interrupted bulk download can be resumed.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_key TEXT PRIMARY KEY,
+            description TEXT,
+            job TEXT,
+            state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL,
+            duration REAL
+        )
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(self.SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add_job(self, key, job, description=""):
+        """
+        Records a planned job as pending unless the journal already knows it.
+        """
+        self._execute(
+            "INSERT OR IGNORE INTO jobs (job_key, description, job, state, created_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, description, json.dumps(job, default=str), PENDING, time.time()),
+        )
+
+    def reset(self, key):
+        """
+        Marks a job as pending again with a fresh attempt count.
+        """
+        self._execute(
+            "UPDATE jobs SET state = ?, attempts = 0, last_error = NULL WHERE job_key = ?",
+            (PENDING, key),
+        )
+
+    def state(self, key):
+        rows = self._execute("SELECT state FROM jobs WHERE job_key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def get(self, key):
+        """
+        Returns a job's row as a dictionary, or None if it is not in the journal.
+        """
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE job_key = ?", (key,))
+            row = cursor.fetchone()
+            names = [column[0] for column in cursor.description]
+        return None if row is None else dict(zip(names, row))
+
+    def is_finished(self, key):
+        return self.state(key) == DONE
+
+    def summary(self):
+        """
+        Returns the number of jobs in each state.
+        """
+        return dict(self._execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+    def _start(self, key):
+        self._execute(
+            "UPDATE jobs SET state = ?, attempts = attempts + 1, started_at = ?,"
+            " finished_at = NULL WHERE job_key = ?",
+            (RUNNING, time.time(), key),
+        )
+
+    def _finish(self, key, state, error=None):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET state = ?, last_error = ?, finished_at = ?,"
+            " duration = ? - started_at WHERE job_key = ?",
+            (state, error, now, now, key),
+        )
+
+    def run(self, key, func, max_attempts=5, base_delay=60, max_delay=1800, sleep=time.sleep):
+        """
+        Calls func() for a journaled job, retrying transient failures with
+        exponential backoff and recording every attempt.
+
+        Parameters:
+        - key (str): The job key, as passed to add_job.
+        - func (callable): Performs the job and raises on failure.
+        - max_attempts (int): Attempts before the job is marked failed.
+        - base_delay (float): Seconds to wait after the first failure.
+        - max_delay (float): Upper bound on the wait between attempts.
+
+        Returns:
+        - The result of func().
+
+        Raises:
+        - Exception: The last error, once the job is marked failed.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            self._start(key)
+            try:
+                result = func()
+            except Exception as e:
+                retry = attempt < max_attempts and is_transient_error(e)
+                self._finish(key, RETRYING if retry else FAILED, str(e))
+                if not retry:
+                    raise
+                delay = backoff_delay(attempt, base_delay, max_delay)
+                self.logger.warning(
+                    f"Attempt {attempt} of {key[:12]} failed, retrying in {delay:.0f}s. {e}"
+                )
+                sleep(delay)
+            else:
+                self._finish(key, DONE)
+                return result
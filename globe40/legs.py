@@ -0,0 +1,168 @@
+import csv
+from datetime import date, datetime
+
+# Columns every leg table must have
+REQUIRED_COLUMNS = (
+    "leg_name",
+    "start_city",
+    "start_lat",
+    "start_lon",
+    "start_date",
+    "finish_city",
+    "finish_lat",
+    "finish_lon",
+    "approx_finish_date",
+    "bb_left",
+    "bb_bottom",
+    "bb_right",
+    "bb_top",
+)
+
+# Columns parsed to floats, with the range each must fall in
+FLOAT_COLUMNS = {
+    "start_lat": (-90, 90),
+    "start_lon": (-180, 180),
+    "finish_lat": (-90, 90),
+    "finish_lon": (-180, 180),
+    "bb_left": (-180, 180),
+    "bb_bottom": (-90, 90),
+    "bb_right": (-180, 180),
+    "bb_top": (-90, 90),
+}
+
+
+class Leg:
+    """
+    One parsed and validated row of the legs TSV.
+
+    Coordinates and bounding box edges are floats and dates are 'YYYY-MM-DD'
+    strings. A start date written as '2025-08-31 12:00' has its time moved to
+    start_time_utc, which is zero-padded to HH:MM, e.g. '9:00' to '09:00'.
+    Columns without a slot are kept in extra. Legs can be indexed like the
+    csv.DictReader rows the stages were written for, so row["bb_left"] and
+    row.get("minimum_duration_days") keep working.
+    """
+
+    __slots__ = (
+        "leg_name",
+        "leg_color_code",
+        "start_city",
+        "start_lat",
+        "start_lon",
+        "start_date",
+        "start_time_utc",
+        "finish_city",
+        "finish_lat",
+        "finish_lon",
+        "approx_finish_date",
+        "minimum_duration_days",
+        "bb_left",
+        "bb_bottom",
+        "bb_right",
+        "bb_top",
+        "extra",
+    )
+
+    def __init__(self, row):
+        """
+        Parameters:
+        - row (dict): A row as read by csv.DictReader.
+
+        Raises:
+        - ValueError: If a column is missing or out of range, the start time is
+          not a time of day, the dates are not in order or the bounding box is
+          upside down.
+        """
+        missing = [c for c in REQUIRED_COLUMNS if not (row.get(c) or "").strip()]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)}.")
+        self.extra = {k: v for k, v in row.items() if k not in self.__slots__}
+        self.leg_name = row["leg_name"].strip()
+        self.leg_color_code = (row.get("leg_color_code") or "").strip()
+        self.start_city = row["start_city"].strip()
+        self.finish_city = row["finish_city"].strip()
+
+        for column, (low, high) in FLOAT_COLUMNS.items():
+            value = float(row[column])
+            if not low <= value <= high:
+                raise ValueError(f"{column} {value} is outside {low} to {high}.")
+            setattr(self, column, value)
+        if self.bb_bottom >= self.bb_top:
+            raise ValueError("bb_bottom must be south of bb_top.")
+
+        start_date, _, start_time = row["start_date"].strip().partition(" ")
+        self.start_date = date.fromisoformat(start_date).isoformat()
+        start_time = (row.get("start_time_utc") or start_time).strip()
+        try:
+            self.start_time_utc = (
+                datetime.strptime(start_time, "%H:%M").strftime("%H:%M")
+                if start_time
+                else ""
+            )
+        except ValueError:
+            raise ValueError(f"start_time_utc {start_time!r} is not HH:MM.") from None
+        self.approx_finish_date = date.fromisoformat(
+            row["approx_finish_date"].strip()[:10]
+        ).isoformat()
+        if self.start_date > self.approx_finish_date:
+            raise ValueError(
+                "The end date must be greater than or equal to the start date."
+            )
+        duration = (row.get("minimum_duration_days") or "").strip()
+        self.minimum_duration_days = float(duration) if duration else None
+
+    @property
+    def area(self):
+        """
+        Returns the bounding box as [North, West, South, East].
+        """
+        return [self.bb_top, self.bb_left, self.bb_bottom, self.bb_right]
+
+    def __getitem__(self, key):
+        if key in self.__slots__ and key != "extra":
+            return getattr(self, key)
+        return self.extra[key]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"Leg({self.leg_name!r}, {self.start_date} to {self.approx_finish_date})"
+
+
+def read_legs(source):
+    """
+    Reads and validates a legs TSV once, so the stages of a run share the same
+    records instead of parsing the file again.
+
+    Parameters:
+    - source (str, Path or list): The TSV file, or legs already read, which are
+      returned as they are.
+
+    Returns:
+    - list: One Leg per row, in file order.
+
+    Raises:
+    - ValueError: Naming the line of the first invalid row, or a repeated leg name.
+    """
+    if not isinstance(source, (str, bytes)) and not hasattr(source, "__fspath__"):
+        return list(source)
+    legs = []
+    names = set()
+    with open(source, mode="r", newline="", encoding="utf-8") as tsvfile:
+        reader = csv.DictReader(tsvfile, delimiter="\t")
+        for row in reader:
+            try:
+                leg = Leg(row)
+            except ValueError as e:
+                raise ValueError(f"{source} line {reader.line_num}: {e}") from e
+            if leg.leg_name in names:
+                raise ValueError(
+                    f"{source} line {reader.line_num}: leg {leg.leg_name} is repeated."
+                )
+            names.add(leg.leg_name)
+            legs.append(leg)
+    return legs
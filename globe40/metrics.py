@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+# Loggers the CDS clients report request state changes on
+STATE_LOGGERS = ("cdsapi", "cads_api_client", "ecmwf.datastores")
+
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class RunningStateHandler(logging.Handler):
+    """
+    Notes when each thread's CDS request starts running. The clients only report
+    the move from queued to running as a log message, e.g. "Request is running",
+    so the handler listens for those on the CDS clients' loggers.
+    """
+
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self._started = {}
+
+    def emit(self, record):
+        if "running" in record.getMessage().lower():
+            self._started.setdefault(threading.get_ident(), time.monotonic())
+
+    def reset(self):
+        self._started.pop(threading.get_ident(), None)
+
+    def started(self):
+        """
+        Returns when the current thread's request started running, or None.
+        """
+        return self._started.pop(threading.get_ident(), None)
+
+
+_running_state = None
+_running_state_lock = threading.Lock()
+
+
+def running_state_handler():
+    """
+    Returns the shared RunningStateHandler, installing it on the CDS clients'
+    loggers on first use. Their levels are left as the application set them:
+    state changes are logged at INFO, which cdsapi.Client enables unless quiet,
+    and where INFO is filtered out queue waits are recorded as None.
+    """
+    global _running_state
+    with _running_state_lock:
+        if _running_state is None:
+            _running_state = RunningStateHandler()
+            for name in STATE_LOGGERS:
+                logging.getLogger(name).addHandler(_running_state)
+        return _running_state
+
+
+def watch_state_logger(name):
+    """
+    Also listens for request state changes on another logger, e.g. that of a
+    stand-in client such as FakeCDSServer.
+    """
+    logging.getLogger(name).addHandler(running_state_handler())
+
+
+class MetricsLog:
+    """
+    Records the timings of every CDS retrieval: how long it waited in the queue,
+    how long CDS took to process it, how long the download took, its size and
+    throughput and which attempt it was for its request key.
+
+    Each retrieval is appended to a JSONL file at path. With textfile_path, the
+    totals are also kept in a Prometheus text file that node_exporter's textfile
+    collector can scrape, rewritten after every retrieval.
+    """
+
+    def __init__(self, path, textfile_path=None):
+        self.path = Path(path)
+        self.textfile_path = None if textfile_path is None else Path(textfile_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._attempts = Counter()
+        self._requests = Counter()
+        self._totals = Counter()
+        self._last_throughput = 0.0
+        self._last_success = 0.0
+        self._states = running_state_handler()
+
+    def retrieve(self, client, dataset, request, target, key):
+        """
+        Retrieves a request in two steps, waiting for CDS to complete it and then
+        downloading the result to target, and records the timings. Queue wait is
+        None when the client never reported the request as running.
+
+        Returns:
+        - dict: The recorded entry.
+
+        Raises:
+        - Exception: Whatever the client raised, after the failure is recorded.
+        """
+        self._states.reset()
+        submitted = time.monotonic()
+        timings = {"queue_wait": None, "processing": None, "transfer": None}
+        try:
+            result = client.retrieve(dataset, request)
+            completed = time.monotonic()
+            started = self._states.started() or submitted
+            if started > submitted:
+                timings["queue_wait"] = started - submitted
+            timings["processing"] = completed - started
+            result.download(str(target))
+            timings["transfer"] = time.monotonic() - completed
+        except Exception as e:
+            self._states.reset()
+            self.record(key, dataset, FAILED, error=str(e), **timings)
+            raise
+        return self.record(
+            key, dataset, COMPLETED, size=os.path.getsize(target), **timings
+        )
+
+    def record(
+        self,
+        key,
+        dataset,
+        state,
+        queue_wait=None,
+        processing=None,
+        transfer=None,
+        size=0,
+        error=None,
+    ):
+        """
+        Appends one retrieval to the log and updates the text file.
+
+        Returns:
+        - dict: The recorded entry.
+        """
+        throughput = size / transfer if size and transfer else None
+        with self._lock:
+            self._attempts[key] += 1
+            entry = {
+                "time": time.time(),
+                "request_key": key,
+                "dataset": dataset,
+                "state": state,
+                "attempt": self._attempts[key],
+                "queue_wait": queue_wait,
+                "processing": processing,
+                "transfer": transfer,
+                "bytes": size,
+                "throughput": throughput,
+                "error": error,
+            }
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+            self._requests[state] += 1
+            if state == COMPLETED:
+                self._totals["bytes"] += size
+                for name in ("queue_wait", "processing", "transfer"):
+                    self._totals[name] += entry[name] or 0.0
+                self._totals["retried"] += entry["attempt"] > 1
+                if throughput is not None:
+                    self._last_throughput = throughput
+                self._last_success = entry["time"]
+            if self.textfile_path is not None:
+                self._write_textfile()
+        return entry
+
+    def summary(self):
+        """
+        Returns the totals over all retrievals recorded so far.
+        """
+        with self._lock:
+            transfer = self._totals["transfer"]
+            return {
+                "requests": dict(self._requests),
+                "bytes": self._totals["bytes"],
+                "queue_wait": self._totals["queue_wait"],
+                "processing": self._totals["processing"],
+                "transfer": transfer,
+                "retried": self._totals["retried"],
+                "throughput": self._totals["bytes"] / transfer if transfer else 0.0,
+                "last_throughput": self._last_throughput,
+                "last_success": self._last_success,
+            }
+
+    def _write_textfile(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP globe40_cds_{name} {help_text}")
+            lines.append(f"# TYPE globe40_cds_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"globe40_cds_{name}{labels} {value}")
+
+        metric(
+            "requests_total",
+            "counter",
+            "Retrieval attempts by state.",
+            [
+                (f'{{state="{state}"}}', self._requests[state])
+                for state in (COMPLETED, FAILED)
+            ],
+        )
+        metric(
+            "retried_requests_total",
+            "counter",
+            "Completed retrievals that needed more than one attempt.",
+            [("", self._totals["retried"])],
+        )
+        metric(
+            "bytes_total",
+            "counter",
+            "Bytes downloaded.",
+            [("", self._totals["bytes"])],
+        )
+        for name, help_text in (
+            ("queue_wait", "Seconds completed requests waited in the CDS queue."),
+            ("processing", "Seconds CDS spent processing completed requests."),
+            ("transfer", "Seconds spent downloading completed requests."),
+        ):
+            metric(
+                f"{name}_seconds_total",
+                "counter",
+                help_text,
+                [("", self._totals[name])],
+            )
+        metric(
+            "last_throughput_bytes_per_second",
+            "gauge",
+            "Download throughput of the last completed request.",
+            [("", self._last_throughput)],
+        )
+        metric(
+            "last_success_timestamp_seconds",
+            "gauge",
+            "Unix time the last request completed.",
+            [("", self._last_success)],
+        )
+
+        # node_exporter may read at any time, so the file is replaced whole
+        tmp_path = self.textfile_path.with_name(self.textfile_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.textfile_path)
@@ -0,0 +1,197 @@
+from collections import defaultdict
+from globe40.areas import union_longitudes
+from globe40.cost import (
+    CDS_FIELD_LIMIT,
+    NATIVE_GRID,
+    area_grid_points,
+    queue_seconds,
+    request_bytes,
+    request_fields,
+)
+from globe40.reanalysis_retriever import ReanalysisRetriever
+
+# Extra fraction of data a merge may add; at 0 merging never grows the download
+DEFAULT_MERGE_TOLERANCE = 0.0
+
+
+def union_area(area_a, area_b):
+    """
+    Returns the smallest area containing both areas, as [North, West, South, East].
+    Either area may cross 180 degrees, and so may the union.
+    """
+    west, east = union_longitudes(area_a[1], area_a[3], area_b[1], area_b[3])
+    return [
+        max(area_a[0], area_b[0]),
+        west,
+        min(area_a[2], area_b[2]),
+        east,
+    ]
+
+
+def union_days(days_a, days_b):
+    """
+    Returns the sorted union of two lists of day strings.
+    """
+    return ["{}".format(d) for d in sorted({int(d) for d in days_a} | {int(d) for d in days_b})]
+
+
+def request_cost(area, days, grid=NATIVE_GRID):
+    """
+    Returns the relative size of a request as grid points x days. Timesteps and
+    variables are the same for every request in a run, so they are left out.
+    """
+    return area_grid_points(area, grid) * len(days)
+
+
+def group_key(chunk):
+    """
+    Returns the key chunks must share to be fetched by one request.
+    """
+    return (chunk["year"], chunk["month"])
+
+
+def plan_requests(chunks, merge_tolerance=DEFAULT_MERGE_TOLERANCE, grid=NATIVE_GRID):
+    """
+    Merges chunks that share a year and month into combined requests.
+
+    Two requests are merged when fetching the union of their areas and days costs
+    no more than (1 + merge_tolerance) times fetching them separately. With the
+    default of 0, legs whose boxes mostly overlap share a queue slot without
+    the plan downloading more data than the separate requests would.
+
+    Parameters:
+    - chunks (iterable): Dictionaries as yielded by process_row, each with year,
+      month, days, leg_name, area and output_dir.
+    - merge_tolerance (float): Extra fraction of data a merge may add.
+    - grid (float): The grid spacing in degrees the requests are fetched at.
+
+    Returns:
+    - list: Planned requests, each a dictionary with year, month, days, area and
+      members, the list of chunks it covers.
+    """
+    groups = defaultdict(list)
+    for chunk in chunks:
+        groups[group_key(chunk)].append(chunk)
+
+    planned = []
+    for key in groups:
+        merged = []
+        # Widest areas first so smaller boxes get folded into them
+        for chunk in sorted(
+            groups[key], key=lambda c: -request_cost(c["area"], c["days"], grid)
+        ):
+            for request in merged:
+                area = union_area(request["area"], chunk["area"])
+                days = union_days(request["days"], chunk["days"])
+                separate = request_cost(
+                    request["area"], request["days"], grid
+                ) + request_cost(chunk["area"], chunk["days"], grid)
+                if request_cost(area, days, grid) <= (1 + merge_tolerance) * separate:
+                    request["area"] = area
+                    request["days"] = days
+                    request["members"].append(chunk)
+                    break
+            else:
+                merged.append(
+                    {
+                        "year": chunk["year"],
+                        "month": chunk["month"],
+                        "days": list(chunk["days"]),
+                        "area": list(chunk["area"]),
+                        "members": [chunk],
+                    }
+                )
+        planned.extend(merged)
+    return planned
+
+
+def merged_leg_name(request):
+    """
+    Returns the leg name used for the shared file of a merged request.
+    """
+    return "merged_" + "+".join(sorted({m["leg_name"] for m in request["members"]}))
+
+
+def job_size(job, timesteps_key, variable_set_key, grid=NATIVE_GRID):
+    """
+    Returns the estimated (fields, bytes) of a chunk or planned request. Requests
+    over several months fetch every day for every month.
+    """
+    months = job["month"] if isinstance(job["month"], (list, tuple)) else [None]
+    fields = request_fields(
+        len(job["days"]), timesteps_key, variable_set_key, len(months)
+    )
+    return fields, request_bytes(fields, job["area"], grid)
+
+
+def plan_estimate(
+    jobs, timesteps_key, variable_set_key, grid=NATIVE_GRID, max_fields=CDS_FIELD_LIMIT
+):
+    """
+    Estimates what fetching a list of jobs costs without sending anything.
+
+    Each job, a chunk from process_row or a request from plan_requests, is listed
+    in order with its legs, dates, area, variables and timesteps, its estimated
+    field count, bytes and CDS queue time, and whether it is over max_fields,
+    the CDS field limit. Totals are given for the whole plan, per leg and per variable set.
+    Per leg totals count what each leg asked for, so for merged requests they
+    add up to less than the download.
+
+    Returns:
+    - dict: requests, totals, legs and variable_sets.
+    """
+    keys = ReanalysisRetriever.split_key(variable_set_key)
+    requests = []
+    totals = {
+        "requests": 0,
+        "fields": 0,
+        "bytes": 0,
+        "queue_seconds": 0.0,
+        "oversized": 0,
+    }
+    legs = defaultdict(lambda: {"requests": 0, "fields": 0, "bytes": 0})
+    variable_sets = {key: {"fields": 0, "bytes": 0} for key in keys}
+
+    for job in jobs:
+        fields, size = job_size(job, timesteps_key, variable_set_key, grid)
+        seconds = queue_seconds(fields)
+        members = job.get("members", [job])
+        requests.append(
+            {
+                "legs": [m["leg_name"] for m in members],
+                "year": job["year"],
+                "month": job["month"],
+                "days": job["days"],
+                "area": job["area"],
+                "variables": ReanalysisRetriever.variables_for(variable_set_key),
+                "timesteps": ReanalysisRetriever.TIMESTEPS[timesteps_key],
+                "fields": fields,
+                "bytes": size,
+                "queue_seconds": seconds,
+                "oversized": fields > max_fields,
+            }
+        )
+        totals["requests"] += 1
+        totals["fields"] += fields
+        totals["bytes"] += size
+        totals["queue_seconds"] += seconds
+        totals["oversized"] += fields > max_fields
+        for key in keys:
+            key_fields, key_bytes = job_size(job, timesteps_key, key, grid)
+            variable_sets[key]["fields"] += key_fields
+            variable_sets[key]["bytes"] += key_bytes
+        for member in members:
+            member_fields, member_bytes = job_size(
+                member, timesteps_key, variable_set_key, grid
+            )
+            leg = legs[member["leg_name"]]
+            leg["requests"] += 1
+            leg["fields"] += member_fields
+            leg["bytes"] += member_bytes
+
+    return {
+        "requests": requests,
+        "totals": totals,
+        "legs": dict(legs),
+        "variable_sets": variable_sets,
+    }
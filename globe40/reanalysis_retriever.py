@@ -1,6 +1,14 @@
-import cdsapi
 from pathlib import Path
 import logging
+import os
+import shutil
+from globe40.areas import (
+    NATIVE_GRID,
+    crosses_antimeridian,
+    snap_area,
+    split_antimeridian,
+)
+from globe40.cache import canonical_request, request_key
 
 # Configure logging
 logging.basicConfig(
@@ -26,10 +34,162 @@ class ReanalysisRetriever:
         "waves": ['mean_wave_direction', 'mean_wave_period', 'significant_height_of_combined_wind_waves_and_swell']
     }
 
-    def __init__(self, client):
+    # GRIB short names of the CDS variables, used to split combined responses
+    SHORT_NAMES = {
+        "10m_u_component_of_wind": "10u",
+        "10m_v_component_of_wind": "10v",
+        "mean_sea_level_pressure": "msl",
+        "mean_wave_direction": "mwd",
+        "mean_wave_period": "mwp",
+        "significant_height_of_combined_wind_waves_and_swell": "swh",
+    }
+
+    # Joins variable set keys into the key of a combined request, e.g. "mslp+waves"
+    COMBINED_KEY_SEPARATOR = "+"
+
+    DATASET = "reanalysis-era5-single-levels"
+
+    def __init__(
+        self,
+        client,
+        cache=None,
+        raise_errors=False,
+        coverage=None,
+        grid=None,
+        metrics=None,
+    ):
+        """
+        Raises:
+        - ValueError: If coverage is given without a cache, which the files it
+          fills requests from and the remainders it fetches are kept in.
+        """
+        if coverage is not None and cache is None:
+            raise ValueError("A coverage index needs a cache to fill requests from.")
         self.client = client
+        self.cache = cache
+        self.coverage = coverage
+        # MetricsLog recording the timings of every request sent to CDS
+        self.metrics = metrics
+        # Output grid spacing in degrees, None for the native 0.25
+        self.grid = grid
+        self.raise_errors = raise_errors
         self.logger = logging.getLogger(__name__)
 
+    @staticmethod
+    def period_label(year, month, day_range=None, tile=None):
+        """
+        Returns the date part of a file name, e.g. 2021_9, 2021_8-9 for a request
+        covering several months, or 2021_9_1-15 when day_range is given. With
+        tile, one of several areas a leg is fetched as is added, e.g. 2021_9_tile2.
+        """
+        if isinstance(month, (list, tuple)):
+            month = "-".join("{}".format(m) for m in month)
+        label = f"{year}_{month}"
+        if day_range:
+            label += f"_{int(day_range[0])}-{int(day_range[-1])}"
+        if tile is not None:
+            label += f"_tile{tile}"
+        return label
+
+    @classmethod
+    def output_filename(
+        cls,
+        leg_name,
+        variable_set_key,
+        year,
+        month,
+        timesteps_key,
+        period=None,
+        grid=None,
+    ):
+        """
+        Returns the canonical GRIB file name for a leg, variable set and month. A
+        period label from period_label replaces the default year_month part, and
+        a grid other than the native one is added, e.g. __1deg.
+        """
+        period = period or cls.period_label(year, month)
+        name = f"G40_{leg_name}__{variable_set_key}__{period}__{timesteps_key}"
+        if grid is not None:
+            name += "__{:g}deg".format(grid)
+        return name + ".grib"
+
+    @classmethod
+    def combined_key(cls, variable_set_keys):
+        """
+        Returns the key of a request fetching several variable sets at once.
+        """
+        if isinstance(variable_set_keys, str):
+            return variable_set_keys
+        return cls.COMBINED_KEY_SEPARATOR.join(variable_set_keys)
+
+    @classmethod
+    def split_key(cls, variable_set_key):
+        """
+        Returns the variable set keys making up a (possibly combined) key.
+        """
+        if not isinstance(variable_set_key, str):
+            return list(variable_set_key)
+        return variable_set_key.split(cls.COMBINED_KEY_SEPARATOR)
+
+    @classmethod
+    def variables_for(cls, variable_set_key):
+        """
+        Returns the CDS variable names of a variable set or combined key.
+        """
+        return [
+            v for key in cls.split_key(variable_set_key) for v in cls.VARIABLE_SETS[key]
+        ]
+
+    @classmethod
+    def short_names_for(cls, variable_set_key):
+        """
+        Returns the GRIB short names of a variable set or combined key.
+        """
+        return [cls.SHORT_NAMES[v] for v in cls.variables_for(variable_set_key)]
+
+    def build_request(
+        self, year, month, day_range, timesteps_key, variable_set_key, area
+    ):
+        """
+        Returns the dataset name and request dictionary sent to CDS. The area is
+        snapped outward to the grid, which is requested explicitly when it is not
+        the native one.
+        """
+        request = {
+            "product_type": "reanalysis",
+            "variable": self.variables_for(variable_set_key),
+            "year": year,
+            "month": month,
+            "day": day_range,
+            "area": self.snap_area(area),
+            "time": self.TIMESTEPS[timesteps_key],
+            "format": "grib",
+        }
+        if self.grid is not None:
+            request["grid"] = [self.grid, self.grid]
+        return self.DATASET, request
+
+    def snap_area(self, area):
+        """
+        Returns an area snapped outward to this retriever's grid.
+        """
+        return snap_area(area, self.grid or NATIVE_GRID)
+
+    @staticmethod
+    def link_output(source_path, output_path):
+        """
+        Points output_path at source_path with a hard link, falling back to a copy.
+        The link is created under a temporary name and renamed into place, so an
+        existing file at output_path is replaced rather than written through.
+        """
+        tmp_path = output_path.with_name(output_path.name + ".link")
+        tmp_path.unlink(missing_ok=True)
+        try:
+            os.link(source_path, tmp_path)
+        except OSError:
+            shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, output_path)
+
     def retrieve_reanalysis_grib(
         self,
         year,
@@ -40,43 +200,328 @@ class ReanalysisRetriever:
         leg_name,
         area,
         output_dir,
+        period=None,
     ):
-        variable_set = self.VARIABLE_SETS[variable_set_key]
-        timesteps = self.TIMESTEPS[timesteps_key]
+        """
+        Retrieves one request into output_dir under its canonical name. With a cache,
+        the file is kept under the hash of the full request and a hit returns the
+        cached path without contacting CDS. With a coverage index, a miss is
+        filled from cached files covering part of the request, so only the rest
+        is fetched.
+
+        Areas crossing 180 degrees are fetched as their two halves and stitched
+        back together, see retrieve_across_antimeridian.
+
+        Returns:
+        - Path: The retrieved (or cached) file, or None if the retrieval failed.
+          With raise_errors set, failures are logged and re-raised instead.
+        """
+        if crosses_antimeridian(area):
+            return self.retrieve_across_antimeridian(
+                year,
+                month,
+                day_range,
+                timesteps_key,
+                variable_set_key,
+                leg_name,
+                area,
+                output_dir,
+                period,
+            )
+
+        dataset, request = self.build_request(
+            year, month, day_range, timesteps_key, variable_set_key, area
+        )
 
         # Create the output directory if it doesn't exist
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
 
-        output_filename = (
-            f"G40_{leg_name}__{variable_set_key}__{year}_{month}__{timesteps_key}.grib"
+        variable_set_key = self.combined_key(variable_set_key)
+        full_output_path = output_path / self.output_filename(
+            leg_name, variable_set_key, year, month, timesteps_key, period, self.grid
         )
-        full_output_path = output_path / output_filename
+
+        if self.cache is not None:
+            key = request_key(dataset, request)
+            cached_path = self.lookup_cache(key, request)
+            if cached_path is not None:
+                self.link_output(cached_path, full_output_path)
+                self.logger.info(f"Cache hit: {full_output_path} is {cached_path}")
+                return cached_path
+            download_path = self.cache.path_for(key).with_suffix(".part")
+        else:
+            # Renamed into place once complete, never written through a hard link
+            download_path = full_output_path.with_name(full_output_path.name + ".part")
 
         try:
+            if self.coverage is not None:
+                cached_path = self.fill_from_cache(dataset, request, key)
+                if cached_path is not None:
+                    self.link_output(cached_path, full_output_path)
+                    self.logger.info(
+                        f"Filled from cache: {full_output_path} is {cached_path}"
+                    )
+                    return cached_path
+
             # Perform the retrieval
-            self.client.retrieve(
-                "reanalysis-era5-single-levels",
-                {
-                    "product_type": "reanalysis",
-                    "variable": variable_set,
-                    "year": year,
-                    "month": month,
-                    "day": day_range,
-                    "area": area,
-                    "time": timesteps,
-                    "format": "grib",
-                },
-                str(full_output_path),  # convert Path object to string
-            )
+            self.download(dataset, request, download_path)
+            if self.cache is not None:
+                cached_path = self.cache.store(key, dataset, request, download_path)
+                self.link_output(cached_path, full_output_path)
+                self.logger.info(
+                    f"Success: Data retrieved and saved to {full_output_path} (cached as {cached_path})"
+                )
+                return cached_path
+            os.replace(download_path, full_output_path)
             self.logger.info(f"Success: Data retrieved and saved to {full_output_path}")
+            return full_output_path
         except Exception as e:
+            # A failed or interrupted download never leaves a partial file behind
+            download_path.unlink(missing_ok=True)
             # Report error
             self.logger.error(f"Error: Failed to retrieve data. {e}")
+            if self.raise_errors:
+                raise
+            return None
+
+    def retrieve_across_antimeridian(
+        self,
+        year,
+        month,
+        day_range,
+        timesteps_key,
+        variable_set_key,
+        leg_name,
+        area,
+        output_dir,
+        period=None,
+    ):
+        """
+        Retrieves an area crossing 180 degrees, e.g. West 150 and East -70, as the
+        two halves either side of it rather than one near global request, and
+        stitches them into one file whose longitudes run continuously east from
+        the West edge (150 to 290). Each half goes through the cache on its own.
+
+        Returns:
+        - Path: The stitched file, or None if either half failed.
+        """
+        from globe40.grib_tools import stitch_grib
+
+        dataset, request = self.build_request(
+            year, month, day_range, timesteps_key, variable_set_key, area
+        )
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        full_output_path = output_path / self.output_filename(
+            leg_name,
+            self.combined_key(variable_set_key),
+            year,
+            month,
+            timesteps_key,
+            period,
+            self.grid,
+        )
+        if self.cache is not None:
+            key = request_key(dataset, request)
+            cached_path = self.lookup_cache(key, request)
+            if cached_path is not None:
+                self.link_output(cached_path, full_output_path)
+                self.logger.info(f"Cache hit: {full_output_path} is {cached_path}")
+                return cached_path
+
+        halves_dir = output_path / "_antimeridian"
+        halves = []
+        for half in split_antimeridian(area):
+            half_path = self.retrieve_reanalysis_grib(
+                year,
+                month,
+                day_range,
+                timesteps_key,
+                variable_set_key,
+                leg_name,
+                half,
+                halves_dir / "{:g}".format(half[1]),
+                period,
+            )
+            if half_path is None:
+                return None
+            halves.append(half_path)
+
+        try:
+            if self.cache is None:
+                full_output_path.unlink(missing_ok=True)
+                stitch_grib(halves, full_output_path, area)
+                stitched_path = full_output_path
+            else:
+                stitch_path = self.cache.path_for(key).with_suffix(".part")
+                stitch_grib(halves, stitch_path, area)
+                stitched_path = self.cache.store(key, dataset, request, stitch_path)
+                self.link_output(stitched_path, full_output_path)
+        except Exception as e:
+            self.logger.error(f"Error: Failed to stitch {full_output_path}. {e}")
+            if self.raise_errors:
+                raise
+            return None
+        finally:
+            # The halves are kept in the cache, if any, and are not needed here
+            for half_path in halves_dir.glob("*/" + full_output_path.name):
+                half_path.unlink()
+        self.logger.info(f"Success: Stitched both halves of {full_output_path}")
+        return stitched_path
+
+    def download(self, dataset, request, target, key=None):
+        """
+        Sends one request to CDS and saves the result to target, recording its
+        queue, processing and transfer times when the retriever has metrics.
+        The file is checked to be complete and to hold one message per variable,
+        day and time; a damaged download is deleted and GribIntegrityError raised,
+        which the job journal retries like a dropped connection.
+        """
+        from globe40.grib_tools import GribIntegrityError, verify_grib
+
+        if self.metrics is None:
+            self.client.retrieve(dataset, request, str(target))
+        else:
+            self.metrics.retrieve(
+                self.client,
+                dataset,
+                request,
+                target,
+                key or request_key(dataset, request),
+            )
+        try:
+            verify_grib(target, request)
+        except GribIntegrityError:
+            Path(target).unlink(missing_ok=True)
+            raise
+
+    def lookup_cache(self, key, request):
+        """
+        Returns the cached file for a request, or None when there is none or it
+        is damaged, so a damaged file is fetched again and replaced.
+        """
+        from globe40.grib_tools import GribIntegrityError, verify_grib
+
+        cached_path = self.cache.lookup(key)
+        if cached_path is None:
+            return None
+        try:
+            verify_grib(cached_path, request)
+        except GribIntegrityError as e:
+            self.logger.warning(f"Fetching again: {e}")
+            return None
+        return cached_path
+
+    def fill_from_cache(self, dataset, request, key):
+        """
+        Builds a request from the parts of it already in the cache, fetching only
+        the parts no cached file covers. The remainders and the assembled file
+        are stored in the cache like any other download.
+
+        Returns:
+        - Path: The cached file, or None when no cached file covers any of it.
+        """
+        from globe40.grib_tools import verify_grib
+
+        sources, missing = self.coverage.plan(dataset, request)
+        if not sources:
+            return None
+        self.logger.info(
+            f"Cache covers {len(sources)} part(s), fetching {len(missing)} remainder(s)"
+        )
+        # Files stored in the cache are moved away; any left here are partial
+        part_paths = []
+        try:
+            for missing_dataset, missing_request in missing:
+                missing_key = request_key(missing_dataset, missing_request)
+                download_path = self.cache.path_for(missing_key).with_suffix(".part")
+                part_paths.append(download_path)
+                self.download(
+                    missing_dataset, missing_request, download_path, missing_key
+                )
+                path = self.cache.store(
+                    missing_key, missing_dataset, missing_request, download_path
+                )
+                sources.append(
+                    (path, canonical_request(missing_dataset, missing_request))
+                )
+            assembled_path = self.cache.path_for(key).with_suffix(".part")
+            part_paths.append(assembled_path)
+            self.coverage.assemble(sources, assembled_path, request.get("area"))
+            verify_grib(assembled_path, request)
+            return self.cache.store(key, dataset, request, assembled_path)
+        finally:
+            for part_path in part_paths:
+                part_path.unlink(missing_ok=True)
+
+    def retrieve_variable_sets(
+        self,
+        year,
+        month,
+        day_range,
+        timesteps_key,
+        variable_set_keys,
+        leg_name,
+        area,
+        output_dir,
+        period=None,
+    ):
+        """
+        Retrieves several variable sets with a single request and splits the
+        response into the usual one file per variable set.
+
+        Returns:
+        - dict: The file in output_dir of each variable set key, or None if the
+          retrieval failed.
+        """
+        from globe40.grib_tools import subset_grib
+
+        variable_set_keys = self.split_key(variable_set_keys)
+        combined_path = self.retrieve_reanalysis_grib(
+            year,
+            month,
+            day_range,
+            timesteps_key,
+            variable_set_keys,
+            leg_name,
+            area,
+            output_dir,
+            period,
+        )
+        if combined_path is None:
+            return None
+        # With a cache the retrieval returns the cached file; the leg's copy is
+        # under the canonical name in output_dir
+        combined_output_path = Path(output_dir) / self.output_filename(
+            leg_name,
+            self.combined_key(variable_set_keys),
+            year,
+            month,
+            timesteps_key,
+            period,
+            self.grid,
+        )
+        if len(variable_set_keys) == 1:
+            return {variable_set_keys[0]: combined_output_path}
+
+        output_paths = {}
+        for key in variable_set_keys:
+            output_paths[key] = Path(output_dir) / self.output_filename(
+                leg_name, key, year, month, timesteps_key, period, self.grid
+            )
+            subset_grib(
+                combined_path, output_paths[key], short_names=self.short_names_for(key)
+            )
+        # The combined file is kept in the cache, if any, and is not needed here
+        combined_output_path.unlink(missing_ok=True)
+        return output_paths
 
 
 # Example usage
 if __name__ == "__main__":
+    import cdsapi
+
     client = cdsapi.Client()
     retriever = ReanalysisRetriever(client)
     leg_name = "test_leg"
@@ -0,0 +1,474 @@
+import re
+from datetime import datetime
+import numpy as np
+from globe40.climatology import wind_direction
+from globe40.geometry import EARTH_RADIUS_NM
+from globe40.scenarios import DEFAULT_YEAR_SHIFTS
+from globe40.utils import extend_interval
+
+MS_TO_KNOTS = 1.943844
+
+
+def haversine_nm(lat1, lon1, lat2, lon2):
+    """
+    Returns the great circle distance in nautical miles, element-wise.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    """
+    Returns the initial great circle bearing in degrees from the first point to
+    the second, element-wise.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.mod(np.degrees(np.arctan2(y, x)), 360.0)
+
+
+def destination(lat, lon, bearing, distance_nm):
+    """
+    Returns the point reached by sailing a great circle from (lat, lon) on an
+    initial bearing for a distance, element-wise. Longitudes are in [-180, 180).
+    """
+    lat, lon, bearing = map(np.radians, (lat, lon, bearing))
+    delta = np.asarray(distance_nm) / EARTH_RADIUS_NM
+    lat2 = np.arcsin(
+        np.sin(lat) * np.cos(delta) + np.cos(lat) * np.sin(delta) * np.cos(bearing)
+    )
+    lon2 = lon + np.arctan2(
+        np.sin(bearing) * np.sin(delta) * np.cos(lat),
+        np.cos(delta) - np.sin(lat) * np.sin(lat2),
+    )
+    return np.degrees(lat2), np.mod(np.degrees(lon2) + 180.0, 360.0) - 180.0
+
+
+class BoatPolar:
+    """
+    Boat speed in knots by true wind angle and true wind speed, interpolated
+    bilinearly and clamped to the table edges.
+    """
+
+    def __init__(self, twa, tws, speeds):
+        self.twa = np.asarray(twa, dtype=float)
+        self.tws = np.asarray(tws, dtype=float)
+        self.speeds = np.asarray(speeds, dtype=float)
+        if self.speeds.shape != (self.twa.size, self.tws.size):
+            raise ValueError("Polar speeds must be shaped TWA x TWS.")
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Reads a polar in the usual TWA\\TWS table format: a header row of wind
+        speeds and one row per wind angle, separated by semicolons or tabs.
+        """
+        with open(path, encoding="utf-8") as f:
+            rows = [re.split(r"[;\t]", line.strip()) for line in f if line.strip()]
+        tws = [float(v) for v in rows[0][1:]]
+        twa = [float(row[0]) for row in rows[1:]]
+        speeds = [[float(v or 0) for v in row[1:]] for row in rows[1:]]
+        return cls(twa, tws, speeds)
+
+    def speed(self, twa, tws):
+        """
+        Returns boat speeds for arrays of true wind angle (degrees, either tack)
+        and true wind speed (knots), broadcast together.
+        """
+        twa = np.abs(np.mod(np.asarray(twa) + 180.0, 360.0) - 180.0)
+        twa, tws = np.broadcast_arrays(twa, np.asarray(tws, dtype=float))
+        a = np.clip(np.interp(twa, self.twa, np.arange(self.twa.size)), 0, None)
+        s = np.clip(np.interp(tws, self.tws, np.arange(self.tws.size)), 0, None)
+        a0 = np.minimum(a.astype(int), self.twa.size - 2)
+        s0 = np.minimum(s.astype(int), self.tws.size - 2)
+        fa, fs = a - a0, s - s0
+        table = self.speeds
+        return (
+            table[a0, s0] * (1 - fa) * (1 - fs)
+            + table[a0 + 1, s0] * fa * (1 - fs)
+            + table[a0, s0 + 1] * (1 - fa) * fs
+            + table[a0 + 1, s0 + 1] * fa * fs
+        )
+
+
+class FieldSampler:
+    """
+    Samples a time x lat x lon field on a regular grid at arbitrary points,
+    linearly in time and bilinearly in space. Points off the grid give NaN.
+    """
+
+    def __init__(self, times, lats, lons, values):
+        self.times = np.asarray(times, dtype="datetime64[s]")
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.values = np.asarray(values, dtype=np.float32)
+        self.dlat = self.lats[1] - self.lats[0] if self.lats.size > 1 else 1.0
+        self.dlon = self.lons[1] - self.lons[0] if self.lons.size > 1 else 1.0
+
+    @classmethod
+    def from_store(cls, store, leg_name, short_name, start, end):
+        """
+        Returns a sampler of a stored field from start to end, including the
+        steps either side so times between steps, e.g. a 09:00 start between
+        06:00 and 12:00, can be interpolated.
+        """
+        field = store.open(leg_name, short_name)
+        steps = field.times
+        if steps.size:
+            first = np.searchsorted(steps, np.datetime64(start, "s"), side="right")
+            last = np.searchsorted(steps, np.datetime64(end, "s"), side="left")
+            start = steps[min(max(first - 1, 0), steps.size - 1)]
+            end = steps[min(last, steps.size - 1)]
+        times, values = field.sel(start, end)
+        return cls(times, field.lats, field.lons, values)
+
+    def time_slice(self, time):
+        """
+        Returns the field interpolated to one time, or None outside the data.
+        """
+        time = np.datetime64(time, "s")
+        if self.times.size == 0 or not self.times[0] <= time <= self.times[-1]:
+            return None
+        k = min(
+            np.searchsorted(self.times, time, side="right") - 1, len(self.times) - 2
+        )
+        if k < 0:
+            return self.values[0]
+        span = (self.times[k + 1] - self.times[k]).astype(float)
+        f = (time - self.times[k]).astype(float) / span if span else 0.0
+        return (1 - f) * self.values[k] + f * self.values[k + 1]
+
+    def grid_position(self, lats, lons):
+        """
+        Returns fractional row and column positions of points on the grid and
+        whether each point is inside it.
+        """
+        y = (np.asarray(lats) - self.lats[0]) / self.dlat
+        x = np.mod(np.asarray(lons) - self.lons[0], 360.0) / self.dlon
+        inside = (y >= 0) & (y <= self.lats.size - 1) & (x >= 0)
+        inside &= x <= self.lons.size - 1
+        return y, x, inside
+
+    def grid_corners(self, lats, lons):
+        """
+        Returns the grid cell around each point as its first row and column,
+        its last row and column, the point's fractions across it, and whether
+        the point is on the grid at all.
+        """
+        y, x, inside = self.grid_position(lats, lons)
+        nj, ni = self.lats.size, self.lons.size
+        y = np.where(inside, y, 0.0)
+        x = np.where(inside, x, 0.0)
+        j0 = np.minimum(y.astype(int), max(nj - 2, 0))
+        i0 = np.minimum(x.astype(int), max(ni - 2, 0))
+        j1 = np.minimum(j0 + 1, nj - 1)
+        i1 = np.minimum(i0 + 1, ni - 1)
+        return j0, i0, j1, i1, y - j0, x - i0, inside
+
+    def sample_grid(self, grid, lats, lons):
+        """
+        Bilinearly interpolates one lat x lon grid at the given points.
+        """
+        j0, i0, j1, i1, fy, fx, inside = self.grid_corners(lats, lons)
+        result = (
+            grid[j0, i0] * (1 - fy) * (1 - fx)
+            + grid[j1, i0] * fy * (1 - fx)
+            + grid[j0, i1] * (1 - fy) * fx
+            + grid[j1, i1] * fy * fx
+        )
+        return np.where(inside, result, np.nan)
+
+    def time_position(self, times):
+        """
+        Returns the time step before each time, its fraction of the way to the
+        next step, and whether the time is within the data.
+        """
+        times = np.asarray(times, dtype="datetime64[s]")
+        if self.times.size == 0:
+            return (
+                np.zeros(times.shape, dtype=np.int64),
+                np.zeros(times.shape),
+                np.zeros(times.shape, dtype=bool),
+            )
+        inside = (times >= self.times[0]) & (times <= self.times[-1])
+        k = np.searchsorted(self.times, times, side="right") - 1
+        k = np.clip(k, 0, max(self.times.size - 2, 0))
+        k1 = np.minimum(k + 1, self.times.size - 1)
+        span = (self.times[k1] - self.times[k]).astype(np.float64)
+        elapsed = (times - self.times[k]).astype(np.float64)
+        f = np.divide(elapsed, span, out=np.zeros(span.shape), where=span > 0)
+        return k, np.where(inside, f, 0.0), inside
+
+    def sample(self, times, lats, lons):
+        """
+        Interpolates the field at points each with its own time, linearly in time
+        and bilinearly in space. The eight surrounding values of every point are
+        gathered from the time x lat x lon array at once, so a memory mapped
+        field only reads the cells the points fall in.
+
+        Parameters:
+        - times (array): datetime64 or ISO strings, one per point.
+        - lats, lons (array): Positions in degrees.
+
+        Returns:
+        - array: float32 values, NaN for points off the grid or outside the data.
+        """
+        k0, ft, in_time = self.time_position(times)
+        k1 = np.minimum(k0 + 1, max(self.times.size - 1, 0))
+        j0, i0, j1, i1, fy, fx, in_space = self.grid_corners(lats, lons)
+        inside = in_time & in_space
+        if not inside.any():
+            return np.full(inside.shape, np.nan, dtype=np.float32)
+        k0, k1, ft = k0[inside], k1[inside], ft[inside]
+        j0, i0, j1, i1 = j0[inside], i0[inside], j1[inside], i1[inside]
+        fy, fx = fy[inside], fx[inside]
+        ks = np.stack([k0, k1])[:, None, None]
+        js = np.stack([j0, j1])[None, :, None]
+        is_ = np.stack([i0, i1])[None, None, :]
+        # 2 x 2 x 2 x points, weighted by time, then row, then column
+        corners = self.values[ks, js, is_]
+        weights = (
+            np.stack([1 - ft, ft])[:, None, None]
+            * np.stack([1 - fy, fy])[None, :, None]
+            * np.stack([1 - fx, fx])[None, None, :]
+        )
+        result = np.full(inside.shape, np.nan, dtype=np.float32)
+        result[inside] = (corners * weights).sum(axis=(0, 1, 2))
+        return result
+
+    def __call__(self, time, lats, lons):
+        grid = self.time_slice(time)
+        if grid is None:
+            return np.full(np.shape(lats), np.nan)
+        return self.sample_grid(grid, lats, lons)
+
+
+def wave_speed_factor(swh):
+    """
+    Returns the fraction of polar speed kept in a sea state: full speed up to
+    2 m significant wave height, then 5% less per metre, never below half.
+    """
+    return np.clip(1.0 - 0.05 * np.maximum(np.asarray(swh) - 2.0, 0.0), 0.5, 1.0)
+
+
+def isochrone_route(
+    start,
+    finish,
+    start_time,
+    polar,
+    u,
+    v,
+    swh=None,
+    step_hours=1.0,
+    n_headings=72,
+    sector_degrees=1.0,
+    max_hours=24 * 60,
+):
+    """
+    Finds the fastest route between two points by isochrone expansion.
+
+    Every step, each point of the frontier is advanced on n_headings headings at
+    once, using the polar speed for the wind sampled at the points (and the wave
+    penalty when swh is given). The candidates are then pruned to the one
+    farthest from the start in each sector of bearing from the start. Points off
+    the wind grid are dropped, as are points where the wave field is missing,
+    which is land in ERA5.
+
+    Parameters:
+    - start, finish (tuple): (lat, lon) in degrees.
+    - start_time (str or datetime64): The start time in UTC.
+    - polar (BoatPolar): The boat polar.
+    - u, v (FieldSampler): 10 m wind components in m/s.
+    - swh (FieldSampler): Significant wave height in metres, optional.
+    - step_hours (float): The isochrone time step.
+    - n_headings (int): Headings tried from each frontier point.
+    - sector_degrees (float): Width of the pruning sectors.
+    - max_hours (float): Give up after this long.
+
+    Returns:
+    - dict: reached (bool), elapsed_hours, and the route as times, lats and lons
+      from the start to the finish (or to the point closest to it).
+    """
+    start_time = np.datetime64(start_time, "s")
+    step = np.timedelta64(int(round(step_hours * 3600)), "s")
+    headings = np.arange(n_headings) * (360.0 / n_headings)
+    n_sectors = int(round(360.0 / sector_degrees))
+
+    lats = np.array([float(start[0])])
+    lons = np.array([float(start[1])])
+    history = [(lats, lons, np.array([-1]))]
+    finish_point = (np.array([float(finish[0])]), np.array([float(finish[1])]))
+    elapsed = None
+
+    for k in range(int(np.ceil(max_hours / step_hours))):
+        time = start_time + k * step
+        wind_u = u(time, lats, lons)
+        wind_v = v(time, lats, lons)
+        tws = np.hypot(wind_u, wind_v) * MS_TO_KNOTS
+        twd = wind_direction(wind_u, wind_v)
+        factor = 1.0 if swh is None else wave_speed_factor(swh(time, lats, lons))
+
+        # Can any frontier point reach the finish within this step?
+        to_finish = haversine_nm(lats, lons, finish[0], finish[1])
+        bearing = initial_bearing(lats, lons, finish[0], finish[1])
+        direct = polar.speed(bearing - twd, tws) * factor
+        with np.errstate(invalid="ignore", divide="ignore"):
+            hours = np.where(direct > 0, to_finish / direct, np.inf)
+        hours = np.where(np.isnan(hours), np.inf, hours)
+        best = int(np.argmin(hours))
+        if hours[best] <= step_hours:
+            history.append((*finish_point, np.array([best])))
+            elapsed = k * step_hours + hours[best]
+            break
+
+        speed = polar.speed(headings[None, :] - twd[:, None], tws[:, None])
+        speed = speed * np.reshape(factor, (-1, 1))
+        new_lats, new_lons = destination(
+            lats[:, None], lons[:, None], headings[None, :], speed * step_hours
+        )
+        new_lats, new_lons = new_lats.ravel(), new_lons.ravel()
+        parents = np.repeat(np.arange(lats.size), n_headings)
+
+        keep = (speed.ravel() > 0) & u.grid_position(new_lats, new_lons)[2]
+        if swh is not None:
+            keep &= ~np.isnan(swh(time + step, new_lats, new_lons))
+        if not keep.any():
+            break
+        new_lats, new_lons, parents = new_lats[keep], new_lons[keep], parents[keep]
+
+        # An upwind finish is rarely on a direct line from the frontier, so also
+        # stop when a heading passes within half a step of it
+        passing = haversine_nm(new_lats, new_lons, finish[0], finish[1])
+        nearest = int(np.argmin(passing))
+        if passing[nearest] <= 0.5 * np.nanmax(speed) * step_hours:
+            history.append((*finish_point, parents[[nearest]]))
+            elapsed = (k + 1) * step_hours
+            break
+
+        sector = (
+            initial_bearing(start[0], start[1], new_lats, new_lons) / sector_degrees
+        ).astype(int) % n_sectors
+        reach = haversine_nm(start[0], start[1], new_lats, new_lons)
+        order = np.lexsort((-reach, sector))
+        _, first = np.unique(sector[order], return_index=True)
+        chosen = order[first]
+
+        lats, lons = new_lats[chosen], new_lons[chosen]
+        history.append((lats, lons, parents[chosen]))
+
+    reached = elapsed is not None
+    if reached:
+        index = 0
+    else:
+        index = int(np.argmin(haversine_nm(lats, lons, finish[0], finish[1])))
+        elapsed = (len(history) - 1) * step_hours
+
+    route_lats, route_lons = [], []
+    for step_lats, step_lons, step_parents in reversed(history):
+        route_lats.append(step_lats[index])
+        route_lons.append(step_lons[index])
+        index = step_parents[index]
+    route_lats.reverse()
+    route_lons.reverse()
+    times = start_time + np.arange(len(route_lats)) * step
+    if reached:
+        times[-1] = start_time + np.timedelta64(int(round(elapsed * 3600)), "s")
+
+    return {
+        "reached": reached,
+        "elapsed_hours": float(elapsed),
+        "times": times,
+        "lats": np.array(route_lats),
+        "lons": np.array(route_lons),
+    }
+
+
+def route_leg(
+    store, row, polar, year_shifts=DEFAULT_YEAR_SHIFTS, max_hours=None, **kwargs
+):
+    """
+    Routes a leg from its TSV row for each historical year shift, using the wind
+    (and wave, when ingested) fields of the leg in the FieldStore.
+
+    Parameters:
+    - store (FieldStore): The store holding the leg's fields.
+    - row (dict): A row of the legs TSV.
+    - polar (BoatPolar): The boat polar.
+    - year_shifts (iterable): Years to shift the start date by.
+    - max_hours (float): Give up after this long. Defaults to three times the
+      leg's minimum duration.
+    - kwargs: Passed on to isochrone_route.
+
+    Returns:
+    - list: One isochrone_route result per year shift, with year_shift and
+      start_time added.
+    """
+    leg_name = row["leg_name"]
+    start = (float(row["start_lat"]), float(row["start_lon"]))
+    finish = (float(row["finish_lat"]), float(row["finish_lon"]))
+    if max_hours is None:
+        max_hours = 3 * 24 * float(row.get("minimum_duration_days") or 20)
+    has_waves = "swh" in store.variables(leg_name)
+    # Times such as '9:00' are not ISO 8601, so parse and zero-pad them
+    clock = datetime.strptime(
+        (row.get("start_time_utc") or "12:00").strip(), "%H:%M"
+    ).strftime("%H:%M")
+
+    results = []
+    for year_shift in year_shifts:
+        start_date, _ = extend_interval(
+            row["start_date"][:10],
+            row["approx_finish_date"][:10],
+            year_shift=year_shift,
+        )
+        start_time = np.datetime64(f"{start_date}T{clock}", "s")
+        end_time = start_time + np.timedelta64(int(max_hours) + 1, "h")
+        samplers = {
+            name: FieldSampler.from_store(store, leg_name, name, start_time, end_time)
+            for name in (["10u", "10v"] + (["swh"] if has_waves else []))
+        }
+        result = isochrone_route(
+            start,
+            finish,
+            start_time,
+            polar,
+            samplers["10u"],
+            samplers["10v"],
+            swh=samplers.get("swh"),
+            max_hours=max_hours,
+            **kwargs,
+        )
+        result["year_shift"] = year_shift
+        result["start_time"] = start_time
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    from globe40.legs import read_legs
+    from globe40.store import FieldStore
+
+    if len(sys.argv) != 5:
+        print(
+            "Usage: python -m globe40.routing <legs_tsv> <leg_name> <store_dir> <polar>"
+        )
+        print(
+            "Example: python -m globe40.routing globe_40_legs_2026.split_leg_4.tsv"
+            " leg_2 ./store class40.pol"
+        )
+        sys.exit(1)
+
+    rows = {leg.leg_name: leg for leg in read_legs(sys.argv[1])}
+    polar = BoatPolar.from_file(sys.argv[4])
+    for result in route_leg(FieldStore(sys.argv[3]), rows[sys.argv[2]], polar):
+        status = "finished" if result["reached"] else "did not finish"
+        print(
+            f"{result['start_time']}: {status} in {result['elapsed_hours'] / 24:.2f}"
+            f" days over {result['lats'].size} points"
+        )
@@ -0,0 +1,262 @@
+import itertools
+import numpy as np
+from globe40.areas import NATIVE_GRID
+from globe40.cost import request_bytes, request_fields
+
+# Year shifts process_row_into_intervals uses by default
+DEFAULT_YEAR_SHIFTS = (-6, -5, -4, -3, -2)
+
+
+def shift_years(dates, shifts):
+    """
+    Shifts datetime64[D] dates by whole years element-wise, moving 29 February
+    to the 28th in common years as relativedelta does.
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    day_index = (dates - months.astype("datetime64[D]")).astype(np.int64)
+    shifted = months + np.asarray(shifts, dtype=np.int64) * 12
+    month_days = ((shifted + 1).astype("datetime64[D]") - shifted).astype(np.int64)
+    return shifted.astype("datetime64[D]") + np.minimum(day_index, month_days - 1)
+
+
+def extend_intervals(
+    start_dates, end_dates, percentage_to_change=0, days_either_end=0, year_shift=-2
+):
+    """
+    Array version of extend_interval. Every argument broadcasts against the
+    others, so a whole grid of parameters is evaluated in one pass.
+
+    Parameters:
+    - start_dates (array): Start dates as datetime64[D] or 'YYYY-MM-DD' strings.
+    - end_dates (array): End dates as datetime64[D] or 'YYYY-MM-DD' strings.
+    - percentage_to_change (array): The percentage change in duration.
+    - days_either_end (array): Number of days to pad the interval with at either end.
+    - year_shift (array): Number of years to shift the interval by.
+
+    Returns:
+    - tuple: The adjusted start and end dates as datetime64[D] arrays.
+
+    Raises:
+    - ValueError: If any start date is after its end date.
+    """
+    start = np.asarray(start_dates, dtype="datetime64[D]")
+    end = np.asarray(end_dates, dtype="datetime64[D]")
+    if np.any(start > end):
+        raise ValueError(
+            "The end date must be greater than or equal to the start date."
+        )
+    start = shift_years(start, year_shift)
+    end = shift_years(end, year_shift)
+
+    duration = (end - start).astype(np.int64)
+    change_factor = 1.0 + np.asarray(percentage_to_change, dtype=np.float64) / 100
+    new_duration = np.where(
+        change_factor < 1,
+        np.floor(duration * change_factor),
+        np.ceil(duration * change_factor),
+    ).astype(np.int64)
+    padding = np.asarray(days_either_end, dtype=np.int64)
+    return start - padding, start + new_duration + padding
+
+
+def row_area(row):
+    return [
+        float(row["bb_top"]),
+        float(row["bb_left"]),
+        float(row["bb_bottom"]),
+        float(row["bb_right"]),
+    ]
+
+
+def scenario_intervals(
+    rows, percentages, paddings, year_shifts, departure_offsets=(0,)
+):
+    """
+    Returns the extended intervals of every leg under every combination of
+    parameters, as (new_start, new_end) arrays shaped
+    leg x percentage x padding x year shift x departure offset.
+    """
+    starts = np.array([row["start_date"][:10] for row in rows], dtype="datetime64[D]")
+    ends = np.array(
+        [row["approx_finish_date"][:10] for row in rows], dtype="datetime64[D]"
+    )
+    offsets = np.asarray(departure_offsets, dtype=np.int64).astype("timedelta64[D]")
+    offsets = offsets[None, None, None, None, :]
+    return extend_intervals(
+        starts[:, None, None, None, None] + offsets,
+        ends[:, None, None, None, None] + offsets,
+        np.asarray(percentages, dtype=np.float64)[None, :, None, None, None],
+        np.asarray(paddings, dtype=np.int64)[None, None, :, None, None],
+        np.asarray(year_shifts, dtype=np.int64)[None, None, None, :, None],
+    )
+
+
+def union_day_masks(new_start, new_end):
+    """
+    Returns, for each leg along the first axis, its earliest date and a boolean
+    mask of the days from there covered by any of its intervals. The masks come
+    from one difference array, so overlapping scenarios cost nothing extra.
+    """
+    new_start, new_end = np.broadcast_arrays(new_start, new_end)
+    n_legs = new_start.shape[0]
+    starts = new_start.reshape(n_legs, -1)
+    ends = new_end.reshape(n_legs, -1)
+    first = starts.min(axis=1)
+    span = int((ends.max(axis=1) - first).astype(np.int64).max()) + 2
+    delta = np.zeros((n_legs, span), dtype=np.int64)
+    legs = np.broadcast_to(np.arange(n_legs)[:, None], starts.shape)
+    np.add.at(delta, (legs, (starts - first[:, None]).astype(np.int64)), 1)
+    np.add.at(delta, (legs, (ends - first[:, None]).astype(np.int64) + 1), -1)
+    covered = np.cumsum(delta, axis=1)[:, :-1] > 0
+    return list(zip(first, covered))
+
+
+def plan_scenarios(
+    rows,
+    percentages=(25,),
+    paddings=(14,),
+    year_shift_sets=(DEFAULT_YEAR_SHIFTS,),
+    departure_offsets=(0,),
+    timesteps_key="6_hourly",
+    variable_set_key="waves",
+    grid=NATIVE_GRID,
+):
+    """
+    Prices every combination of duration stretch, padding, set of year shifts
+    and departure offset across all legs at once, along with the deduplicated
+    download that would answer all of them.
+
+    Parameters:
+    - rows (list): Leg rows as read from the TSV.
+    - percentages (list): Duration stretches in percent.
+    - paddings (list): Days of padding at either end.
+    - year_shift_sets (list): Sets of year shifts, e.g. [(-2,), (-4, -3, -2)].
+    - departure_offsets (list): Days to move each leg's start and finish by.
+    - timesteps_key (str): Key of ReanalysisRetriever.TIMESTEPS.
+    - variable_set_key (str or list): Key or keys of ReanalysisRetriever.VARIABLE_SETS.
+    - grid (float): The grid spacing in degrees.
+
+    Returns:
+    - dict: scenarios, one entry per combination with its parameters and the
+      days, fields and bytes it needs over all legs; union, the days and bytes
+      per leg covered by any scenario; and total_bytes of the union.
+    """
+    rows = list(rows)
+    shifts = sorted({s for shift_set in year_shift_sets for s in shift_set})
+    membership = np.array(
+        [[s in shift_set for s in shifts] for shift_set in year_shift_sets],
+        dtype=np.int64,
+    )
+    new_start, new_end = scenario_intervals(
+        rows, percentages, paddings, shifts, departure_offsets
+    )
+    new_start, new_end = np.broadcast_arrays(new_start, new_end)
+    days = (new_end - new_start).astype(np.int64) + 1
+
+    day_fields = request_fields(1, timesteps_key, variable_set_key)
+    day_bytes = np.array(
+        [request_bytes(day_fields, row_area(row), grid) for row in rows],
+        dtype=np.float64,
+    )
+    # Summed over legs and over the shifts in each set: pct x pad x set x offset
+    scenario_days = np.einsum("lpdso,ks->pdko", days, membership)
+    scenario_bytes = np.einsum("lpdso,l,ks->pdko", days, day_bytes, membership)
+
+    scenarios = []
+    for index in itertools.product(*(range(n) for n in scenario_days.shape)):
+        p, d, k, o = index
+        scenarios.append(
+            {
+                "percentage_to_change": percentages[p],
+                "days_either_end": paddings[d],
+                "year_shifts": list(year_shift_sets[k]),
+                "departure_offset": departure_offsets[o],
+                "days": int(scenario_days[index]),
+                "fields": int(scenario_days[index]) * day_fields,
+                "bytes": float(scenario_bytes[index]),
+            }
+        )
+
+    union = {}
+    for row, (_, mask), leg_bytes in zip(
+        rows, union_day_masks(new_start, new_end), day_bytes
+    ):
+        n_days = int(mask.sum())
+        union[row["leg_name"]] = {"days": n_days, "bytes": n_days * float(leg_bytes)}
+    return {
+        "scenarios": scenarios,
+        "union": union,
+        "total_bytes": sum(leg["bytes"] for leg in union.values()),
+    }
+
+
+def union_requests(
+    rows,
+    percentages=(25,),
+    paddings=(14,),
+    year_shift_sets=(DEFAULT_YEAR_SHIFTS,),
+    departure_offsets=(0,),
+):
+    """
+    Returns the deduplicated requests that answer every scenario: the days of
+    each leg covered by any combination, grouped by calendar month into the same
+    dictionaries process_row yields, so they can be fed to plan_requests.
+    """
+    rows = list(rows)
+    shifts = sorted({s for shift_set in year_shift_sets for s in shift_set})
+    new_start, new_end = scenario_intervals(
+        rows, percentages, paddings, shifts, departure_offsets
+    )
+    requests = []
+    for row, (first, mask) in zip(rows, union_day_masks(new_start, new_end)):
+        dates = first + np.flatnonzero(mask).astype("timedelta64[D]")
+        months = dates.astype("datetime64[M]")
+        for month in np.unique(months):
+            day_numbers = (dates[months == month] - month.astype("datetime64[D]")) + 1
+            year_number, month_number = (int(v) for v in str(month).split("-"))
+            requests.append(
+                {
+                    "year": year_number,
+                    "month": month_number,
+                    "days": ["{}".format(d) for d in day_numbers.astype(np.int64)],
+                    "leg_name": row["leg_name"],
+                    "area": row_area(row),
+                    "output_dir": f"./gribs/{row['leg_name']}",
+                    "period": None,
+                }
+            )
+    return requests
+
+
+if __name__ == "__main__":
+    import csv
+    import sys
+    import time
+
+    if len(sys.argv) != 2:
+        print("Usage: python -m globe40.scenarios <legs_tsv>")
+        print("Example: python -m globe40.scenarios globe_40_legs_2026.tsv")
+        sys.exit(1)
+
+    with open(sys.argv[1], newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+    began = time.perf_counter()
+    plan = plan_scenarios(
+        rows,
+        percentages=(0, 10, 25, 50),
+        paddings=(0, 7, 14, 21),
+        year_shift_sets=[(-2,), (-3, -2), (-4, -3, -2), DEFAULT_YEAR_SHIFTS],
+        departure_offsets=(-7, 0, 7),
+    )
+    elapsed = (time.perf_counter() - began) * 1000
+    for scenario in sorted(plan["scenarios"], key=lambda s: s["bytes"]):
+        print(
+            f"{scenario['percentage_to_change']:>4}% +/-{scenario['days_either_end']:>2}d"
+            f" shifts {scenario['year_shifts']} offset {scenario['departure_offset']:>3}d:"
+            f" {scenario['days']} leg days, {scenario['bytes'] / 2**20:.1f} MiB"
+        )
+    print(
+        f"{len(plan['scenarios'])} scenarios in {elapsed:.1f} ms, union of all"
+        f" {plan['total_bytes'] / 2**20:.1f} MiB"
+    )
@@ -0,0 +1,574 @@
+import json
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+import eccodes
+import numpy as np
+from globe40.areas import union_longitudes
+from globe40.grib_tools import (
+    iter_grib_handles,
+    iter_messages,
+    message_grid,
+    message_time,
+)
+
+INDEX_NAME = "index.json"
+
+# Tile number a file name's period ends with when a leg is fetched in tiles
+TILE_LABEL = re.compile(r"_tile\d+$")
+
+
+def decode_grib(path):
+    """
+    Decodes a GRIB file into one time x lat x lon array per variable.
+
+    Parameters:
+    - path (str or Path): The GRIB file to decode.
+
+    Returns:
+    - dict: For each GRIB short name, a dictionary with times (datetime64[s]),
+      values (float32, time x lat x lon, sorted by time), lats and lons.
+    """
+    fields = {}
+    for message in iter_messages(path):
+        name = message["short_name"]
+        if name not in fields:
+            fields[name] = {
+                "times": [],
+                "values": [],
+                "lats": message["lats"],
+                "lons": message["lons"],
+            }
+        fields[name]["times"].append(message["time"])
+        fields[name]["values"].append(message["values"])
+
+    for field in fields.values():
+        order = np.argsort(field["times"], kind="stable")
+        field["times"] = np.array(field["times"])[order]
+        field["values"] = np.stack(field["values"])[order]
+    return fields
+
+
+def grib_layout(path):
+    """
+    Reads only the message headers of a GRIB file, so the shape of each variable
+    is known before any values are decoded.
+
+    Returns:
+    - dict: For each GRIB short name, a dictionary with the short_name, times
+      (datetime64[s], in file order), lats and lons.
+    """
+    layout = {}
+    for gid in iter_grib_handles(path):
+        name = eccodes.codes_get(gid, "shortName")
+        if name not in layout:
+            lats, lons = message_grid(gid)
+            layout[name] = {"short_name": name, "times": [], "lats": lats, "lons": lons}
+        layout[name]["times"].append(message_time(gid))
+    for field in layout.values():
+        field["times"] = np.array(field["times"], dtype="datetime64[s]")
+    return layout
+
+
+def chunk_name_for(path):
+    """
+    Returns the chunk a GRIB file is stored as: its name without any tile
+    number, e.g. G40_leg_2__waves__2021_9__6_hourly for both
+    G40_leg_2__waves__2021_9_tile1__6_hourly.grib and its _tile2, so the tiles
+    of a period end up in one chunk.
+    """
+    parts = Path(path).stem.split("__")
+    if len(parts) > 2:
+        parts[2] = TILE_LABEL.sub("", parts[2])
+    return "__".join(parts)
+
+
+def grid_step(values):
+    return abs(float(values[1] - values[0])) if values.size > 1 else None
+
+
+def grid_spacing(lats, lons):
+    """
+    Returns the (lat, lon) spacing of a grid rounded to 1e-6 degrees, or None
+    for a single point.
+    """
+    dlat, dlon = grid_step(lats), grid_step(lons)
+    if dlat is None and dlon is None:
+        return None
+    dlat = dlon if dlat is None else dlat
+    dlon = dlat if dlon is None else dlon
+    return round(dlat, 6), round(dlon, 6)
+
+
+def grid_group(short_name, spacing):
+    """
+    Returns the name a variable on a secondary grid is stored under, e.g. 10u__1deg.
+    """
+    return "{}__{:g}deg".format(short_name, max(spacing))
+
+
+def union_grid(grids):
+    """
+    Returns the smallest regular grid holding every (lats, lons) grid given, in
+    the latitude order and longitude convention of the first. The grids must
+    share their spacing and line up with each other.
+
+    Raises:
+    - ValueError: If the grids' spacings differ or their points do not line up.
+    """
+    lats, lons = grids[0]
+    if all(
+        np.array_equal(g_lats, lats) and np.array_equal(g_lons, lons)
+        for g_lats, g_lons in grids[1:]
+    ):
+        return lats, lons
+
+    steps = {(grid_step(g_lats), grid_step(g_lons)) for g_lats, g_lons in grids}
+    dlat = {step for step, _ in steps if step is not None}
+    dlon = {step for _, step in steps if step is not None}
+    if len(dlat) > 1 or len(dlon) > 1:
+        raise ValueError("Grids with different spacings cannot be combined.")
+    dlat = dlat.pop() if dlat else dlon.pop()
+    dlon = dlon.pop() if dlon else dlat
+
+    north = max(float(g_lats.max()) for g_lats, _ in grids)
+    south = min(float(g_lats.min()) for g_lats, _ in grids)
+    west, east = float(lons[0]), float(lons[-1])
+    for _, g_lons in grids[1:]:
+        west, east = union_longitudes(west, east, float(g_lons[0]), float(g_lons[-1]))
+    n_lats = int(round((north - south) / dlat)) + 1
+    n_lons = int(round(((east - west) % 360) / dlon)) + 1
+    union_lats = north - dlat * np.arange(n_lats)
+    if lats.size > 1 and lats[1] > lats[0]:
+        union_lats = union_lats[::-1]
+    # Longitudes continue from the first grid's, e.g. 150 to 290 across 180
+    start = float(lons[0]) - ((float(lons[0]) - west) % 360)
+    union_lons = start + dlon * np.arange(n_lons)
+    for g_lats, g_lons in grids:
+        grid_indexes(g_lats, g_lons, union_lats, union_lons)
+    return union_lats.astype(lats.dtype), union_lons.astype(lons.dtype)
+
+
+def grid_indexes(lats, lons, grid_lats, grid_lons):
+    """
+    Returns the rows and columns of a grid's points in a larger grid.
+
+    Raises:
+    - ValueError: If a point is not on the larger grid.
+    """
+    dlat = (grid_step(grid_lats) or 1.0) * (
+        -1 if grid_lats.size > 1 and grid_lats[1] < grid_lats[0] else 1
+    )
+    dlon = grid_step(grid_lons) or 1.0
+    rows = (lats - grid_lats[0]) / dlat
+    cols = ((lons - grid_lons[0]) % 360) / dlon
+    for offsets, size in ((rows, grid_lats.size), (cols, grid_lons.size)):
+        if (
+            np.abs(offsets - np.rint(offsets)).max() > 1e-3
+            or np.rint(offsets).min() < 0
+            or np.rint(offsets).max() >= size
+        ):
+            raise ValueError("Grid points do not line up with the leg grid.")
+    return np.rint(rows).astype(np.int64), np.rint(cols).astype(np.int64)
+
+
+class FieldArray:
+    """
+    One variable of one leg in the store: a time index, the grid, and the time
+    chunks opened as read-only memory maps.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / INDEX_NAME, encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.lats = np.load(self.directory / "lats.npy")
+        self.lons = np.load(self.directory / "lons.npy")
+        self.chunks = [
+            {
+                "name": chunk["name"],
+                "times": np.load(self.directory / f"{chunk['name']}.times.npy"),
+                "values": np.load(
+                    self.directory / f"{chunk['name']}.npy", mmap_mode="r"
+                ),
+            }
+            for chunk in sorted(self.index["chunks"], key=lambda c: c["start"])
+        ]
+
+    @property
+    def times(self):
+        return np.concatenate([c["times"] for c in self.chunks])
+
+    def sel(self, start, end):
+        """
+        Returns the times and values from start to end inclusive. When the range
+        falls inside one chunk the values are a view of the memory map, so nothing
+        is read until it is used.
+
+        Parameters:
+        - start, end (str or datetime64): The time range.
+
+        Returns:
+        - tuple: (times, values) with values shaped time x lat x lon.
+        """
+        start = np.datetime64(start, "s")
+        end = np.datetime64(end, "s")
+        times, values = [], []
+        for chunk in self.chunks:
+            first = np.searchsorted(chunk["times"], start, side="left")
+            last = np.searchsorted(chunk["times"], end, side="right")
+            if last > first:
+                times.append(chunk["times"][first:last])
+                values.append(chunk["values"][first:last])
+        if not values:
+            return np.array([], dtype="datetime64[s]"), np.empty(
+                (0, self.lats.size, self.lons.size), dtype=np.float32
+            )
+        if len(values) == 1:
+            return times[0], values[0]
+        return np.concatenate(times), np.concatenate(values)
+
+
+class FieldStore:
+    """
+    A directory of decoded ERA5 fields laid out as <leg>/<short name>/, each
+    holding lats.npy, lons.npy, an index.json and one .npy chunk (plus its
+    .times.npy) per ingested GRIB file.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+
+    def legs(self):
+        return sorted(p.name for p in self.store_dir.iterdir() if p.is_dir())
+
+    def variables(self, leg_name):
+        return sorted(
+            p.name
+            for p in (self.store_dir / leg_name).iterdir()
+            if (p / INDEX_NAME).exists()
+        )
+
+    def open(self, leg_name, short_name):
+        return FieldArray(self.store_dir / leg_name / short_name)
+
+    def _variable_index(self, leg_name, short_name, chunk_name, lats, lons):
+        """
+        Returns the directory and index of a variable, creating them on first use.
+        When the grid has grown past the stored one, e.g. after a leg's area is
+        widened, the stored chunks are first rebuilt on it.
+
+        Raises:
+        - ValueError: If the stored grid does not line up with the new one.
+        """
+        directory = self.store_dir / leg_name / short_name
+        directory.mkdir(parents=True, exist_ok=True)
+        index_path = directory / INDEX_NAME
+        if index_path.exists():
+            with open(index_path, encoding="utf-8") as f:
+                index = json.load(f)
+            stored_lats = np.load(directory / "lats.npy")
+            stored_lons = np.load(directory / "lons.npy")
+            if not (
+                np.array_equal(stored_lats, lats) and np.array_equal(stored_lons, lons)
+            ):
+                try:
+                    placement = np.ix_(
+                        *grid_indexes(stored_lats, stored_lons, lats, lons)
+                    )
+                except ValueError:
+                    raise ValueError(
+                        f"Grid of {chunk_name} does not match {leg_name}/{short_name}."
+                    ) from None
+                self._regrid_chunks(directory, index, placement, lats, lons)
+        else:
+            index = {"leg_name": leg_name, "short_name": short_name, "chunks": []}
+            np.save(directory / "lats.npy", lats)
+            np.save(directory / "lons.npy", lons)
+        return directory, index
+
+    def _regrid_chunks(self, directory, index, placement, lats, lons):
+        """
+        Rebuilds every chunk of a variable on a larger grid, one time step at a
+        time, with NaN where the old grid has no points, then saves the new grid.
+        """
+        for chunk in index["chunks"]:
+            chunk_path = directory / f"{chunk['name']}.npy"
+            tmp_path = directory / f"{chunk['name']}.npy.part"
+            old = np.load(chunk_path, mmap_mode="r")
+            values = np.lib.format.open_memmap(
+                tmp_path,
+                mode="w+",
+                dtype=np.float32,
+                shape=(old.shape[0], lats.size, lons.size),
+            )
+            values[:] = np.nan
+            for step in range(old.shape[0]):
+                values[step][placement] = old[step]
+            values.flush()
+            del values, old
+            os.replace(tmp_path, chunk_path)
+        np.save(directory / "lats.npy", lats)
+        np.save(directory / "lons.npy", lons)
+
+    def _record_chunk(self, directory, index, chunk_name, times):
+        """
+        Saves a chunk's times and records the chunk in the variable index.
+        """
+        np.save(directory / f"{chunk_name}.times.npy", times)
+        index["chunks"] = [c for c in index["chunks"] if c["name"] != chunk_name]
+        index["chunks"].append(
+            {
+                "name": chunk_name,
+                "start": str(times[0]),
+                "end": str(times[-1]),
+                "length": int(times.size),
+            }
+        )
+        index_path = directory / INDEX_NAME
+        tmp_path = index_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, index_path)
+        return directory / f"{chunk_name}.npy"
+
+    def write_chunk(self, leg_name, short_name, chunk_name, field):
+        """
+        Writes one decoded field as a chunk and records it in the variable index.
+
+        Raises:
+        - ValueError: If the field's grid differs from the chunks already stored.
+        """
+        directory, index = self._variable_index(
+            leg_name, short_name, chunk_name, field["lats"], field["lons"]
+        )
+        np.save(directory / f"{chunk_name}.npy", field["values"])
+        return self._record_chunk(directory, index, chunk_name, field["times"])
+
+    def stored_spacing(self, leg_name, short_name):
+        directory = self.store_dir / leg_name / short_name
+        if not (directory / INDEX_NAME).exists():
+            return None
+        return grid_spacing(
+            np.load(directory / "lats.npy"), np.load(directory / "lons.npy")
+        )
+
+    def group_layouts(self, leg_name, layouts):
+        """
+        Renames the variables of layouts on a secondary grid, so each variable of
+        a leg is stored on one spacing. A variable keeps its short name on the
+        spacing it is stored on, or on the finest spacing when nothing is stored
+        yet; on any other spacing, such as a 1° overview fetched into the same leg
+        directory, it goes to a group of its own, see grid_group.
+
+        Parameters:
+        - layouts (dict): The grib_layout of each GRIB file, by path.
+
+        Returns:
+        - dict: The layouts keyed by the name each variable is stored under.
+        """
+        spacings = defaultdict(set)
+        for layout in layouts.values():
+            for short_name, field in layout.items():
+                spacing = grid_spacing(field["lats"], field["lons"])
+                if spacing is not None:
+                    spacings[short_name].add(spacing)
+        primary = {}
+        for short_name, found in spacings.items():
+            primary[short_name] = self.stored_spacing(leg_name, short_name) or min(
+                found
+            )
+
+        grouped = {}
+        for path, layout in layouts.items():
+            grouped[path] = {}
+            for short_name, field in layout.items():
+                spacing = grid_spacing(field["lats"], field["lons"])
+                if spacing is None or spacing == primary[short_name]:
+                    grouped[path][short_name] = field
+                else:
+                    grouped[path][grid_group(short_name, spacing)] = field
+        return grouped
+
+    def leg_grids(self, leg_name, layouts):
+        """
+        Returns the grid of each variable of a leg: the union of the grids of
+        the layouts, as from grib_layout, and of any chunks already stored.
+        """
+        grids = defaultdict(list)
+        for layout in layouts:
+            for short_name, field in layout.items():
+                directory = self.store_dir / leg_name / short_name
+                if not grids[short_name] and (directory / INDEX_NAME).exists():
+                    grids[short_name].append(
+                        (
+                            np.load(directory / "lats.npy"),
+                            np.load(directory / "lons.npy"),
+                        )
+                    )
+                grids[short_name].append((field["lats"], field["lons"]))
+        return {name: union_grid(name_grids) for name, name_grids in grids.items()}
+
+    def ingest_grib(self, path, leg_name):
+        """
+        Streams a GRIB file into the store, one chunk per variable.
+
+        The headers are read first to size each chunk, then values are decoded one
+        message at a time straight into its time-sorted slot of a memory-mapped
+        .npy file, so memory use stays at one message however large the leg area
+        or period is. Chunks are written under a temporary name and renamed once
+        complete. A file covering part of the leg's stored grid is placed on it,
+        with NaN elsewhere.
+
+        Returns:
+        - list: The chunk files written.
+
+        Raises:
+        - ValueError: If the file's grid does not line up with the leg's stored
+          grid.
+        """
+        layouts = self.group_layouts(leg_name, {Path(path): grib_layout(path)})
+        return self.ingest_tiles(
+            layouts,
+            leg_name,
+            Path(path).stem,
+            self.leg_grids(leg_name, layouts.values()),
+        )
+
+    def ingest_tiles(self, layouts, leg_name, chunk_name, grids):
+        """
+        Streams GRIB files holding parts of the same period, such as the tiles a
+        leg is fetched as, into one chunk per variable on the leg's grid, as
+        ingest_grib does for a single file. Points no file covers are NaN.
+
+        Parameters:
+        - layouts (dict): The grib_layout of each GRIB file, by path, as from
+          group_layouts.
+        - leg_name (str): The leg the files belong to.
+        - chunk_name (str): The name of the chunk to write.
+        - grids (dict): (lats, lons) of each variable, as from leg_grids.
+
+        Returns:
+        - list: The chunk files written.
+        """
+        targets = {}
+        for short_name in {name for layout in layouts.values() for name in layout}:
+            lats, lons = grids[short_name]
+            directory, index = self._variable_index(
+                leg_name, short_name, chunk_name, lats, lons
+            )
+            times = np.unique(
+                np.concatenate(
+                    [
+                        layout[short_name]["times"]
+                        for layout in layouts.values()
+                        if short_name in layout
+                    ]
+                )
+            )
+            tmp_path = directory / f"{chunk_name}.npy.part"
+            values = np.lib.format.open_memmap(
+                tmp_path,
+                mode="w+",
+                dtype=np.float32,
+                shape=(times.size, lats.size, lons.size),
+            )
+            placements = {}
+            for path, layout in layouts.items():
+                if short_name not in layout:
+                    continue
+                field = layout[short_name]
+                if np.array_equal(field["lats"], lats) and np.array_equal(
+                    field["lons"], lons
+                ):
+                    placements[path] = None
+                else:
+                    placements[path] = np.ix_(
+                        *grid_indexes(field["lats"], field["lons"], lats, lons)
+                    )
+            if len(layouts) > 1 or any(p is not None for p in placements.values()):
+                values[:] = np.nan
+            targets[short_name] = {
+                "directory": directory,
+                "index": index,
+                "times": times,
+                "placements": placements,
+                "tmp_path": tmp_path,
+                "values": values,
+            }
+
+        for path, layout in layouts.items():
+            names = {field["short_name"]: name for name, field in layout.items()}
+            for message in iter_messages(path):
+                target = targets[names[message["short_name"]]]
+                slot = np.searchsorted(target["times"], message["time"])
+                placement = target["placements"][path]
+                if placement is None:
+                    target["values"][slot] = message["values"]
+                else:
+                    target["values"][slot][placement] = message["values"]
+
+        written = []
+        for target in targets.values():
+            target["values"].flush()
+            del target["values"]
+            os.replace(target["tmp_path"], target["directory"] / f"{chunk_name}.npy")
+            written.append(
+                self._record_chunk(
+                    target["directory"], target["index"], chunk_name, target["times"]
+                )
+            )
+        return written
+
+    def ingest_directory(self, grib_dir, leg_name=None):
+        """
+        Ingests every GRIB file in a leg directory such as ./gribs/leg_2. The leg
+        name defaults to the directory name.
+
+        Files covering different areas of the leg, such as corridor windows or
+        tiles, are all placed on one grid per variable spanning them, and the
+        tiles of a period are stitched into one chunk, see chunk_name_for. When
+        the grid grows past the stored one the stored chunks are rebuilt on it,
+        and files on another spacing are stored apart, see group_layouts.
+        """
+        grib_dir = Path(grib_dir)
+        leg_name = leg_name or grib_dir.name
+        layouts = self.group_layouts(
+            leg_name,
+            {path: grib_layout(path) for path in sorted(grib_dir.glob("*.grib"))},
+        )
+        grids = self.leg_grids(leg_name, layouts.values())
+        chunks = defaultdict(dict)
+        for path, layout in layouts.items():
+            chunks[chunk_name_for(path)][path] = layout
+        written = []
+        for chunk_name, chunk_layouts in chunks.items():
+            written.extend(
+                self.ingest_tiles(chunk_layouts, leg_name, chunk_name, grids)
+            )
+        return written
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "grib_dirs", nargs="+", help="Leg directories of GRIBs, e.g. ./gribs/leg_2"
+    )
+    parser.add_argument("--store", default="./store", help="FieldStore directory")
+
+
+def run(args):
+    store = FieldStore(args.store)
+    for grib_dir in args.grib_dirs:
+        for chunk_path in store.ingest_directory(grib_dir):
+            print(f"Wrote {chunk_path}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Decode leg GRIB directories into a FieldStore."
+    )
+    add_arguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,171 @@
+import numpy as np
+from globe40.areas import NATIVE_GRID, area_width, normalise_longitude, snap_area
+from globe40.corridor import DEFAULT_MARGIN_NM, leg_track, parse_waypoints
+from globe40.routing import haversine_nm
+
+# Largest number of rectangles a leg's corridor is covered with
+DEFAULT_MAX_TILES = 4
+
+# Size in degrees of the cells the corridor is rasterised on
+TILE_CELL = 1.0
+
+# Share of the bounding box a further tile must save to be worth a request
+DEFAULT_MIN_SAVING = 0.05
+
+
+def corridor_mask(row, margin_nm=DEFAULT_MARGIN_NM, cell=TILE_CELL):
+    """
+    Rasterises the leg's track, buffered by margin_nm, onto cells of the leg's
+    bounding box. A cell is in the corridor when its centre is within margin_nm
+    plus half its diagonal of a track point, so no buffered point is missed.
+
+    Returns:
+    - array: Boolean mask shaped rows x columns, from the box's North West
+      corner.
+    """
+    bounding_box = [
+        float(row["bb_top"]),
+        float(row["bb_left"]),
+        float(row["bb_bottom"]),
+        float(row["bb_right"]),
+    ]
+    north, west, south, _ = bounding_box
+    n_rows = int(np.ceil((north - south) / cell))
+    n_cols = int(np.ceil(area_width(bounding_box) / cell))
+    centre_lats = north - (np.arange(n_rows) + 0.5) * cell
+    centre_lons = west + (np.arange(n_cols) + 0.5) * cell
+
+    lats, lons, _ = leg_track(row)
+    reach = margin_nm + 60.0 * cell * np.sqrt(2) / 2
+    mask = np.zeros((n_rows, n_cols), dtype=bool)
+    # One row of cells at a time keeps memory at columns x track points
+    for r, lat in enumerate(centre_lats):
+        distances = haversine_nm(lat, centre_lons[:, None], lats, lons)
+        mask[r] = distances.min(axis=1) <= reach
+    return mask
+
+
+def span_costs(first, last):
+    """
+    Returns the cells of the smallest rectangle covering the corridor in each
+    run of columns, shaped first column x last column, where first and last are
+    the first and last corridor row of each column, or -1 for none.
+    """
+    n = first.size
+    lower = np.where(first < 0, np.iinfo(np.int64).max, first)
+    upper = np.where(last < 0, -1, last)
+    costs = np.full((n, n), np.inf)
+    for i in range(n):
+        top = np.minimum.accumulate(lower[i:])
+        bottom = np.maximum.accumulate(upper[i:])
+        height = np.where(bottom >= 0, bottom - top + 1, 0)
+        costs[i, i:] = height * np.arange(1, n - i + 1)
+    return costs
+
+
+def partition_columns(mask, max_tiles, overhead):
+    """
+    Splits the columns of a corridor mask into runs, each covered by one
+    rectangle, minimising the rectangles' total cells plus overhead per
+    rectangle. Each added rectangle is one pass over all runs at once.
+
+    Returns:
+    - tuple: (cost, runs) with runs as (first column, last column) pairs.
+    """
+    occupied = mask.any(axis=0)
+    rows = np.arange(mask.shape[0])[:, None]
+    first = np.where(occupied, np.where(mask, rows, mask.shape[0]).min(axis=0), -1)
+    last = np.where(occupied, np.where(mask, rows, -1).max(axis=0), -1)
+    costs = span_costs(first, last)
+    n = first.size
+
+    # best[j] is the cheapest cover of columns 0..j with k runs and starts[k][j]
+    # the first column of its last run
+    best = costs[0]
+    starts = [np.zeros(n, dtype=np.int64)]
+    results = [(best[-1] + overhead, 1)]
+    for k in range(2, min(max_tiles, n) + 1):
+        candidates = np.full((n, n), np.inf)
+        candidates[1:] = best[:-1, None] + costs[1:]
+        starts.append(np.argmin(candidates, axis=0))
+        best = candidates[starts[-1], np.arange(n)]
+        results.append((best[-1] + k * overhead, k))
+
+    cost, n_runs = min(results)
+    runs = []
+    end = n - 1
+    for k in range(n_runs - 1, -1, -1):
+        start = int(starts[k][end])
+        runs.append((start, end))
+        end = start - 1
+    return cost, runs[::-1]
+
+
+def corridor_tiles(
+    row,
+    margin_nm=DEFAULT_MARGIN_NM,
+    max_tiles=DEFAULT_MAX_TILES,
+    min_saving=DEFAULT_MIN_SAVING,
+    cell=TILE_CELL,
+    grid=NATIVE_GRID,
+):
+    """
+    Covers a leg's corridor, its track buffered by margin_nm, with up to
+    max_tiles rectangles of the least total area. The corridor is split into
+    runs of columns or runs of rows, whichever is cheaper, and a rectangle is
+    only added if it saves min_saving of the bounding box. Legs without
+    waypoints keep their bounding box, as for corridor_windows.
+
+    Returns:
+    - list: Areas [North, West, South, East] snapped outward to grid and kept
+      within the bounding box, from West to East or North to South.
+    """
+    bounding_box = [
+        float(row["bb_top"]),
+        float(row["bb_left"]),
+        float(row["bb_bottom"]),
+        float(row["bb_right"]),
+    ]
+    north, west, south, _ = bounding_box
+    if not parse_waypoints(row.get("waypoints")):
+        return [bounding_box]
+    east = west + area_width(bounding_box)
+    mask = corridor_mask(row, margin_nm, cell)
+    if not mask.any():
+        return [bounding_box]
+    overhead = min_saving * mask.size
+
+    by_columns = partition_columns(mask, max_tiles, overhead)
+    by_rows = partition_columns(mask.T, max_tiles, overhead)
+    tiles = []
+    if by_columns[0] <= by_rows[0]:
+        for start, end in by_columns[1]:
+            covered = np.flatnonzero(mask[:, start : end + 1].any(axis=1))
+            if covered.size:
+                tiles.append((covered[0], covered[-1], start, end))
+    else:
+        for start, end in by_rows[1]:
+            covered = np.flatnonzero(mask[start : end + 1].any(axis=0))
+            if covered.size:
+                tiles.append((start, end, covered[0], covered[-1]))
+
+    areas = []
+    for top, bottom, left, right in tiles:
+        tile_north, tile_west, tile_south, tile_east = snap_area(
+            [
+                min(north - top * cell, north),
+                max(west + left * cell, west),
+                max(north - (bottom + 1) * cell, south),
+                min(west + (right + 1) * cell, east),
+            ],
+            grid,
+        )
+        areas.append(
+            [
+                float(min(tile_north, north)),
+                normalise_longitude(float(max(tile_west, west))),
+                float(max(tile_south, south)),
+                normalise_longitude(float(min(tile_east, east))),
+            ]
+        )
+    return areas
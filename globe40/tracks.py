@@ -0,0 +1,172 @@
+import csv
+import itertools
+import sys
+from pathlib import Path
+import numpy as np
+from globe40.routing import FieldSampler
+
+# Columns of a tracker export holding each position
+DEFAULT_POSITION_COLUMNS = ("lat", "lon", "time")
+
+# Delimiters a tracker export may use
+DELIMITERS = "\t,;"
+
+# Lines csv.Sniffer looks at to find the delimiter
+SNIFF_LINES = 20
+
+
+def parse_times(values):
+    """
+    Parses ISO 8601 times such as '2021-09-01T06:30' or '2021-09-01 06:30:00Z'
+    into datetime64[s], all at once. Times are taken to be UTC.
+    """
+    return np.array([v.strip().rstrip("Zz") for v in values], dtype="datetime64[s]")
+
+
+def sniff_delimiter(sample, path):
+    """
+    Returns the delimiter of a tracker export found by csv.Sniffer from its
+    first lines, so a tab inside a quoted column name does not make a comma
+    separated file look tab separated. When the lines do not settle it, e.g. a
+    single column, the extension decides: comma for .csv, tab otherwise.
+    """
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        return "," if Path(path).suffix.lower() == ".csv" else "\t"
+
+
+def read_positions(path, columns=DEFAULT_POSITION_COLUMNS):
+    """
+    Reads a tab, comma or semicolon separated tracker export into columns. The
+    delimiter is found by sniff_delimiter.
+
+    Parameters:
+    - path (str): The file, with a header row.
+    - columns (tuple): Names of its latitude, longitude and time columns.
+
+    Returns:
+    - tuple: (header, rows, times, lats, lons) with rows as lists of strings.
+
+    Raises:
+    - ValueError: If a column is missing from the header.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        sample = "".join(itertools.islice(f, SNIFF_LINES))
+        f.seek(0)
+        reader = csv.reader(f, delimiter=sniff_delimiter(sample, path))
+        header = next(reader)
+        missing = [c for c in columns if c not in header]
+        if missing:
+            raise ValueError(f"Columns {', '.join(missing)} are not in {path}.")
+        rows = list(reader)
+    lat_index, lon_index, time_index = (header.index(c) for c in columns)
+    lats = np.array([row[lat_index] for row in rows], dtype=np.float64)
+    lons = np.array([row[lon_index] for row in rows], dtype=np.float64)
+    times = parse_times([row[time_index] for row in rows])
+    return header, rows, times, lats, lons
+
+
+def covering_steps(field_times, times):
+    """
+    Returns the first and last time steps needed to interpolate at times: the
+    step at or before the earliest and the step at or after the latest.
+    """
+    first = np.searchsorted(field_times, times.min(), side="right") - 1
+    last = np.searchsorted(field_times, times.max(), side="left")
+    first = min(max(first, 0), field_times.size - 1)
+    last = min(max(last, 0), field_times.size - 1)
+    return field_times[first], field_times[last]
+
+
+def join_track(store, leg_name, times, lats, lons, short_names=None):
+    """
+    Interpolates a leg's stored fields at each position of a track, linearly in
+    time and bilinearly in space, one array operation per variable. Only the
+    time steps spanning the track are read from the store.
+
+    Parameters:
+    - store (FieldStore): The store holding the leg's decoded fields.
+    - leg_name (str): The leg whose fields are sampled.
+    - times (array): datetime64 time of each position.
+    - lats, lons (array): Each position in degrees.
+    - short_names (list): Variables to sample. None samples all of the leg's.
+
+    Returns:
+    - dict: float32 arrays keyed by short name, NaN where a position is outside
+      the stored area or times.
+    """
+    times = np.asarray(times, dtype="datetime64[s]")
+    if short_names is None:
+        short_names = store.variables(leg_name)
+    joined = {}
+    for short_name in short_names:
+        field = store.open(leg_name, short_name)
+        field_times = field.times
+        if times.size == 0 or field_times.size == 0:
+            joined[short_name] = np.full(times.shape, np.nan, dtype=np.float32)
+            continue
+        start, end = covering_steps(field_times, times)
+        step_times, values = field.sel(start, end)
+        sampler = FieldSampler(step_times, field.lats, field.lons, values)
+        joined[short_name] = sampler.sample(times, lats, lons)
+    return joined
+
+
+def write_joined(outfile, header, rows, joined, precision=3):
+    """
+    Writes the track's rows as TSV with a column per joined variable, left
+    empty where the variable could not be interpolated.
+    """
+    number_format = "{:.%df}" % precision
+    columns = [
+        [
+            "" if np.isnan(v) else number_format.format(v)
+            for v in values.astype(np.float64).tolist()
+        ]
+        for values in joined.values()
+    ]
+    writer = csv.writer(outfile, delimiter="\t", lineterminator="\n")
+    writer.writerow(header + list(joined))
+    writer.writerows(row + list(extra) for row, extra in zip(rows, zip(*columns)))
+
+
+def add_arguments(parser):
+    parser.add_argument("track_file", help="Tracker export with a row per position")
+    parser.add_argument("leg", help="Leg whose stored fields are sampled")
+    parser.add_argument("--store", default="./store", help="FieldStore directory")
+    parser.add_argument(
+        "--variables", nargs="+", help="Short names to join (default: all stored)"
+    )
+    parser.add_argument(
+        "--columns",
+        nargs=3,
+        default=list(DEFAULT_POSITION_COLUMNS),
+        metavar=("LAT", "LON", "TIME"),
+        help="Latitude, longitude and time columns of the track",
+    )
+    parser.add_argument("--output", help="TSV file to write (default: stdout)")
+
+
+def run(args):
+    from globe40.store import FieldStore
+
+    header, rows, times, lats, lons = read_positions(args.track_file, args.columns)
+    joined = join_track(
+        FieldStore(args.store), args.leg, times, lats, lons, args.variables
+    )
+    if args.output is None:
+        write_joined(sys.stdout, header, rows, joined)
+    else:
+        with open(args.output, "w", newline="", encoding="utf-8") as out:
+            write_joined(out, header, rows, joined)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Join a leg's stored fields onto a tracker export."
+    )
+    add_arguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,208 @@
+import shutil
+import tempfile
+import unittest
+import warnings
+from pathlib import Path
+import numpy as np
+from globe40.accumulators import (
+    CellStatistics,
+    leg_statistics,
+    streaming_climatology,
+    update_leg_statistics,
+)
+from globe40.climatology import WAVE_HEIGHT_BINS, leg_climatology
+from globe40.store import FieldStore
+
+LATS = np.arange(45.0, 43.75, -0.5)
+LONS = np.arange(-10.0, -8.25, 0.5)
+
+
+def store_year(store, year, rng, days=10, lats=LATS):
+    """Stores random wind, waves and pressure for September of a year."""
+    times = np.datetime64(f"{year}-09-01T00", "s") + np.arange(0, days * 24, 6) * 3600
+    shape = (times.size, lats.size, LONS.size)
+    fields = {
+        "10u": rng.normal(3, 6, shape),
+        "10v": rng.normal(-2, 6, shape),
+        "swh": rng.gamma(3, 0.8, shape),
+        "msl": rng.normal(101300, 800, shape),
+    }
+    fields["swh"][:, 0, 0] = np.nan
+    for short_name, values in fields.items():
+        store.write_chunk(
+            "leg_1",
+            short_name,
+            f"{year}-09",
+            {
+                "times": times,
+                "lats": lats,
+                "lons": LONS,
+                "values": values.astype(np.float32),
+            },
+        )
+    return (f"{year}-09-01", f"{year}-09-{days:02d}")
+
+
+class TestCellStatistics(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.a = rng.gamma(2, 2, (40, 2, 3))
+        self.b = rng.gamma(2, 2, (60, 2, 3))
+        self.b[:10, 1, 1] = np.nan
+        self.bins = (*np.arange(0.0, 30.5, 0.5), np.inf)
+
+    def test_merge_matches_one_pass(self):
+        """Test that merged windows give the statistics of all their data."""
+        merged = CellStatistics((2, 3), self.bins, (4.0, 8.0)).update(self.a, 6)
+        merged.merge(CellStatistics((2, 3), self.bins, (4.0, 8.0)).update(self.b, 6))
+        data = np.concatenate([self.a, self.b])
+        np.testing.assert_array_equal(merged.count, np.sum(~np.isnan(data), axis=0))
+        np.testing.assert_allclose(merged.means(), np.nanmean(data, axis=0))
+        np.testing.assert_allclose(merged.variance(), np.nanvar(data, axis=0, ddof=1))
+        np.testing.assert_allclose(merged.maximum, np.nanmax(data, axis=0))
+        self.assertEqual(merged.histogram.sum(), np.sum(~np.isnan(data)))
+        np.testing.assert_allclose(
+            merged.mean_hours_above()[0],
+            ((self.a > 4).sum(axis=0) + (self.b > 4).sum(axis=0)) * 6 / 2,
+        )
+        self.assertEqual((merged.windows, merged.steps), (2, 100))
+
+    def test_percentiles_follow_the_data(self):
+        statistics = CellStatistics((2, 3), self.bins).update(self.b, 6)
+        result = statistics.percentiles([0, 50, 90, 100])
+        expected = np.nanpercentile(self.b, [0, 50, 90, 100], axis=0)
+        np.testing.assert_allclose(result, expected, atol=0.5)
+        np.testing.assert_array_less(np.nanmin(self.b, axis=0), result[0] + 1e-12)
+        np.testing.assert_array_less(result[3], np.nanmax(self.b, axis=0) + 1e-12)
+
+    def test_save_and_load(self):
+        statistics = CellStatistics((2, 3), self.bins, (4.0,)).update(self.a, 6)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "stats.npz"
+            statistics.save(path)
+            loaded = CellStatistics.load(path)
+        np.testing.assert_array_equal(loaded.histogram, statistics.histogram)
+        np.testing.assert_array_equal(loaded.m2, statistics.m2)
+        self.assertEqual(loaded.shape, (2, 3))
+        self.assertEqual(loaded.windows, 1)
+
+    def test_rebin(self):
+        statistics = CellStatistics((2, 3), self.bins).update(self.a, 6)
+        coarse = statistics.rebin((0.0, 5.0, 10.0, np.inf))
+        self.assertEqual(coarse.shape, (3, 2, 3))
+        np.testing.assert_array_equal(
+            coarse[1], ((self.a >= 5) & (self.a < 10)).sum(axis=0)
+        )
+        with self.assertRaises(ValueError):
+            statistics.rebin((0.0, 5.1, np.inf))
+
+    def test_mismatched_statistics_do_not_merge(self):
+        statistics = CellStatistics((2, 3), self.bins)
+        with self.assertRaises(ValueError):
+            statistics.merge(CellStatistics((2, 3), (0.0, 1.0, np.inf)))
+        with self.assertRaises(ValueError):
+            statistics.merge(CellStatistics((3, 3), self.bins))
+
+
+class TestStreamingClimatology(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = FieldStore(self.tmp.name)
+        rng = np.random.default_rng(7)
+        self.windows = [store_year(self.store, year, rng) for year in (2020, 2021)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_matches_leg_climatology(self):
+        """Test that the results agree with reading every field at once."""
+        with warnings.catch_warnings():
+            # A cell without waves has no percentiles
+            warnings.simplefilter("ignore", RuntimeWarning)
+            expected = leg_climatology(self.store, "leg_1", self.windows)
+        result = streaming_climatology(self.store, "leg_1", self.windows)
+        for name in (
+            "wind_rose",
+            "wind_exceedance_hours",
+            "wave_height_distribution",
+            "wave_exceedance_hours",
+        ):
+            np.testing.assert_allclose(result[name], expected[name], rtol=1e-5)
+        # leg_climatology averages pressure in float32
+        np.testing.assert_allclose(
+            result["mslp_anomaly"], expected["mslp_anomaly"], atol=0.05
+        )
+        for name in ("wind_speed_percentiles", "wave_height_percentiles"):
+            np.testing.assert_allclose(result[name][:-1], expected[name][:-1], atol=0.5)
+        for name in ("wind_lats", "wind_lons", "wave_lats", "mslp_lons"):
+            np.testing.assert_array_equal(result[name], expected[name])
+        self.assertEqual(
+            result["wave_height_distribution"].shape[0], len(WAVE_HEIGHT_BINS) - 1
+        )
+
+    def test_mslp_anomaly_has_a_row_per_window(self):
+        """Test that a window without data keeps its row of the anomaly maps."""
+        windows = [self.windows[0], ("2019-09-01", "2019-09-10"), self.windows[1]]
+        result = streaming_climatology(self.store, "leg_1", windows)
+        self.assertEqual(result["mslp_anomaly"].shape, (3, LATS.size, LONS.size))
+        self.assertTrue(np.isnan(result["mslp_anomaly"][1]).all())
+        self.assertTrue(np.isfinite(result["mslp_anomaly"][[0, 2]]).all())
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            expected = leg_climatology(self.store, "leg_1", windows)
+        np.testing.assert_allclose(
+            result["mslp_anomaly"], expected["mslp_anomaly"], atol=0.05
+        )
+
+    def test_only_new_windows_are_read(self):
+        """Test that adding a year summarises only that year's window."""
+        written = update_leg_statistics(self.store, "leg_1", self.windows)
+        self.assertEqual(len(written), 4 * 2)
+        self.assertEqual(update_leg_statistics(self.store, "leg_1", self.windows), [])
+
+        window = store_year(self.store, 2022, np.random.default_rng(8))
+        written = update_leg_statistics(self.store, "leg_1", self.windows + [window])
+        self.assertEqual(len(written), 4)
+        self.assertTrue(all("2022-09-01" in path.name for path in written))
+
+    def test_window_with_new_steps_is_updated(self):
+        """Test that a window is summarised again once more of it is ingested."""
+        window = ("2020-09-01", "2020-09-12")
+        self.assertEqual(len(update_leg_statistics(self.store, "leg_1", [window])), 4)
+        self.assertEqual(update_leg_statistics(self.store, "leg_1", [window]), [])
+        store_year(self.store, 2020, np.random.default_rng(9), days=12)
+        written = update_leg_statistics(self.store, "leg_1", [window])
+        self.assertEqual(len(written), 4)
+        statistics = leg_statistics(self.store, "leg_1", [window])
+        self.assertEqual(statistics["wind_speed"][0].steps, 12 * 4)
+
+    def test_window_ingested_again_is_updated(self):
+        """Test that new data with the same steps and grid is summarised again."""
+        update_leg_statistics(self.store, "leg_1", self.windows)
+        before = leg_statistics(self.store, "leg_1", self.windows[:1])
+        store_year(self.store, 2020, np.random.default_rng(10))
+        written = update_leg_statistics(self.store, "leg_1", self.windows)
+        self.assertEqual(len(written), 4)
+        self.assertTrue(all("2020-09-01" in path.name for path in written))
+        after = leg_statistics(self.store, "leg_1", self.windows[:1])
+        self.assertFalse(np.allclose(before["msl"][0].means(), after["msl"][0].means()))
+
+    def test_moved_grid_is_updated(self):
+        """Test that a grid of the same shape at another origin is summarised
+        again."""
+        update_leg_statistics(self.store, "leg_1", self.windows)
+        for short_name in ("10u", "10v", "swh", "msl"):
+            shutil.rmtree(Path(self.tmp.name) / "leg_1" / short_name)
+        rng = np.random.default_rng(7)
+        for year in (2020, 2021):
+            store_year(self.store, year, rng, lats=LATS - 0.5)
+        written = update_leg_statistics(self.store, "leg_1", self.windows)
+        self.assertEqual(len(written), 4 * 2)
+        result = streaming_climatology(self.store, "leg_1", self.windows)
+        np.testing.assert_array_equal(result["wind_lats"], LATS - 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+from create_g40_bb_geojson import process_row_into_area_feature
+from globe40.areas import (
+    area_width,
+    snap_area,
+    split_antimeridian,
+    union_longitudes,
+)
+from globe40.cache import GribCache
+from globe40.cost import area_grid_points
+from globe40.fake_cds import FakeCDSServer
+from globe40.grib_tools import iter_messages
+from globe40.planner import union_area
+from globe40.reanalysis_retriever import ReanalysisRetriever
+
+# Leg 4, Sydney to Valparaiso, as [North, West, South, East]
+PACIFIC = [-25, 150, -45, -70]
+
+
+class TestAntimeridianAreas(unittest.TestCase):
+
+    def test_width_and_points(self):
+        """Test that a box across 180 degrees is measured the short way."""
+        self.assertEqual(area_width(PACIFIC), 140)
+        self.assertEqual(area_grid_points(PACIFIC, grid=1.0), 21 * 141)
+
+    def test_split(self):
+        """Test that only boxes across 180 degrees are split in two."""
+        self.assertEqual(
+            split_antimeridian(PACIFIC), [[-25, 150, -45, 180], [-25, -180, -45, -70]]
+        )
+        self.assertEqual(split_antimeridian([48, -15, 35, -2]), [[48, -15, 35, -2]])
+
+    def test_union(self):
+        """Test unions that cross, or come to cross, 180 degrees."""
+        self.assertEqual(union_longitudes(150, 180, -180, -70), (150, -70))
+        self.assertEqual(union_longitudes(170, -170, -175, -160), (170, -160))
+        self.assertEqual(
+            union_area(PACIFIC, [-20, 140, -30, 160]), [-20, 140, -45, -70]
+        )
+
+    def test_snap_area(self):
+        """Test that edges move outward to the grid and aligned edges stay."""
+        self.assertEqual(snap_area([47.3, -14.6, 35.1, -2.2], 1), [48, -15, 35, -2])
+        self.assertEqual(snap_area([47.3, -14.6, 35.1, -2.2], 0.5), [47.5, -15, 35, -2])
+        self.assertEqual(snap_area([48, -15, 35, -2], 1), [48, -15, 35, -2])
+        self.assertEqual(snap_area([89.9, 0, -89.9, 10], 1), [90, 0, -90, 10])
+
+    def test_geojson_is_cut_at_180(self):
+        """Test that a box across 180 degrees becomes two polygons."""
+        row = {
+            "leg_name": "leg_4",
+            "start_city": "Sydney",
+            "finish_city": "Valparaiso",
+            "leg_color_code": "#0000FF",
+            "bb_left": "150",
+            "bb_bottom": "-45",
+            "bb_right": "-70",
+            "bb_top": "-25",
+        }
+        geometry = process_row_into_area_feature(row)["geometry"]
+        self.assertEqual(geometry["type"], "MultiPolygon")
+        self.assertEqual(
+            [[p[0] for p in polygon[0]] for polygon in geometry["coordinates"]],
+            [[150, 150, 180, 180, 150], [-180, -180, -70, -70, -180]],
+        )
+
+
+class TestAntimeridianRetrieval(unittest.TestCase):
+
+    def test_halves_are_fetched_and_stitched(self):
+        """Test two half requests stitched onto one continuous longitude axis."""
+        server = FakeCDSServer(
+            queue_delay=0, seconds_per_field=0, time_scale=1e-6, grid=1.0
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            retriever = ReanalysisRetriever(
+                server.client(), cache=GribCache(root / "cache"), raise_errors=True
+            )
+            path = retriever.retrieve_reanalysis_grib(
+                2026, 1, ["1"], "daily_noon", "mslp", "leg_4", PACIFIC, root / "leg_4"
+            )
+            messages = list(iter_messages(path))
+            leftovers = list((root / "leg_4" / "_antimeridian").glob("*/*.grib"))
+
+        self.assertEqual([r["fields"] for r in server.records], [1, 1])
+        self.assertEqual(len(messages), 1)
+        lons = messages[0]["lons"]
+        self.assertEqual((lons[0], lons[-1], lons.size), (150, 290, 141))
+        self.assertTrue(np.all(np.diff(lons) == 1))
+        self.assertFalse(np.isnan(messages[0]["values"]).any())
+        self.assertEqual(leftovers, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
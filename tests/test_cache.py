@@ -0,0 +1,156 @@
+import unittest
+import tempfile
+from pathlib import Path
+from globe40.cache import GribCache, request_key
+from globe40.fake_cds import write_synthetic_grib
+from globe40.grib_tools import GribIntegrityError
+from globe40.reanalysis_retriever import ReanalysisRetriever
+
+
+class CountingClient:
+    """
+    Stands in for cdsapi.Client, writing a coarse synthetic GRIB for the request.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def retrieve(self, dataset, request, target):
+        self.calls += 1
+        write_synthetic_grib(target, request, grid=5.0)
+
+
+class TruncatingClient(CountingClient):
+    """
+    Drops the connection ten bytes before the end of the response.
+    """
+
+    def retrieve(self, dataset, request, target):
+        super().retrieve(dataset, request, target)
+        with open(target, "r+b") as f:
+            f.truncate(Path(target).stat().st_size - 10)
+
+
+class DroppingClient(CountingClient):
+    """
+    Writes part of the response, then loses the connection.
+    """
+
+    def retrieve(self, dataset, request, target):
+        Path(target).write_bytes(b"GRIB")
+        raise ConnectionError("Connection reset by peer")
+
+
+class TestGribCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def retrieve(self, retriever, day_range=["1", "2"], area=[50, -10, 40, 10]):
+        return retriever.retrieve_reanalysis_grib(
+            year=2021,
+            month=9,
+            day_range=day_range,
+            timesteps_key="6_hourly",
+            variable_set_key="mslp",
+            leg_name="test_leg",
+            area=area,
+            output_dir=str(self.root / "test_leg"),
+        )
+
+    def test_request_key_is_normalised(self):
+        """Test that zero padding and int/str differences give the same key."""
+        a = {"year": 2021, "month": "09", "day": ["01", "2"], "area": [50, -10, 40, 10]}
+        b = {"year": "2021", "month": 9, "day": ["1", "02"], "area": [50.0, -10.0, 40, 10]}
+        self.assertEqual(request_key("ds", a), request_key("ds", b))
+        self.assertNotEqual(request_key("ds", a), request_key("other", a))
+
+    def test_hit_skips_network(self):
+        """Test that a repeated request is served from the cache."""
+        client = CountingClient()
+        retriever = ReanalysisRetriever(client, cache=GribCache(self.root / "cache"))
+        first = self.retrieve(retriever)
+        second = self.retrieve(retriever)
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(first, second)
+        output = self.root / "test_leg" / "G40_test_leg__mslp__2021_9__6_hourly.grib"
+        self.assertEqual(output.read_bytes(), first.read_bytes())
+
+    def test_changed_days_or_area_miss(self):
+        """Test that different days or areas are fetched and cached separately."""
+        client = CountingClient()
+        retriever = ReanalysisRetriever(client, cache=GribCache(self.root / "cache"))
+        first = self.retrieve(retriever)
+        second = self.retrieve(retriever, day_range=["1", "2", "3"])
+        third = self.retrieve(retriever, area=[55, -10, 40, 10])
+        self.assertEqual(client.calls, 3)
+        self.assertEqual(len({first, second, third}), 3)
+        self.assertTrue(first.exists())
+
+    def test_manifest_survives_reload(self):
+        """Test that a new cache instance reads the manifest written by another."""
+        retriever = ReanalysisRetriever(
+            CountingClient(), cache=GribCache(self.root / "cache")
+        )
+        path = self.retrieve(retriever)
+        cache = GribCache(self.root / "cache")
+        key = path.stem
+        self.assertEqual(cache.lookup(key, verify=True), path)
+        self.assertEqual(cache.manifest[key]["size"], path.stat().st_size)
+        self.assertEqual(cache.manifest[key]["request"]["day"], ["1", "2"])
+        entries = cache.entries()
+        self.assertEqual(list(entries), [key])
+        entries.clear()
+        self.assertIn(key, cache.manifest)
+
+    def test_truncated_file_is_a_miss(self):
+        """Test that a file whose size no longer matches is not returned."""
+        retriever = ReanalysisRetriever(
+            CountingClient(), cache=GribCache(self.root / "cache")
+        )
+        path = self.retrieve(retriever)
+        path.write_bytes(b"GRIB")
+        self.assertIsNone(GribCache(self.root / "cache").lookup(path.stem))
+
+    def test_truncated_download_is_not_kept(self):
+        """Test that a cut short download never reaches the cache or output."""
+        for cache in (None, GribCache(self.root / "cache")):
+            retriever = ReanalysisRetriever(
+                TruncatingClient(), cache=cache, raise_errors=True
+            )
+            with self.assertRaises(GribIntegrityError):
+                self.retrieve(retriever)
+            self.assertEqual(list((self.root / "test_leg").iterdir()), [])
+        self.assertEqual(list((self.root / "cache").glob("*.grib")), [])
+        self.assertEqual(list((self.root / "cache").glob("*.part")), [])
+
+    def test_dropped_download_leaves_no_part_file(self):
+        """Test that a download failing with any error removes its .part file."""
+        for cache in (None, GribCache(self.root / "cache")):
+            retriever = ReanalysisRetriever(
+                DroppingClient(), cache=cache, raise_errors=True
+            )
+            with self.assertRaises(ConnectionError):
+                self.retrieve(retriever)
+            self.assertEqual(list((self.root / "test_leg").iterdir()), [])
+        self.assertEqual(list((self.root / "cache").glob("*.part")), [])
+
+    def test_damaged_cache_file_is_fetched_again(self):
+        """Test that a cached file cut short in place is replaced on the next hit."""
+        client = CountingClient()
+        retriever = ReanalysisRetriever(client, cache=GribCache(self.root / "cache"))
+        path = self.retrieve(retriever)
+        size = path.stat().st_size
+        # Same size, so the manifest check passes and only the GRIB check fails
+        path.write_bytes(path.read_bytes()[:-10] + bytes(10))
+        self.assertEqual(self.retrieve(retriever), path)
+        self.assertEqual(client.calls, 2)
+        self.assertEqual(path.stat().st_size, size)
+
+
+if __name__ == "__main__":
+    unittest.main()
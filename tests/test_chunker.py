@@ -0,0 +1,101 @@
+import unittest
+from globe40.chunker import chunk_interval, fetched_days, split_days
+from globe40.cost import area_grid_points, request_bytes, request_fields
+
+PROLOGUE_AREA = [48, -15, 35, -2]
+LEG_2_AREA = [20, -50, -45, 60]
+
+
+class TestCostModel(unittest.TestCase):
+
+    def test_request_fields(self):
+        """Test fields as months x days x timesteps x variables."""
+        self.assertEqual(request_fields(10, "6_hourly", "waves"), 10 * 4 * 3)
+        self.assertEqual(
+            request_fields(10, "daily_noon", ["mslp", "ten_metre_wind"], n_months=2),
+            2 * 10 * 1 * 3,
+        )
+
+    def test_request_bytes(self):
+        """Test that bytes grow with fields and grid points."""
+        points = area_grid_points(PROLOGUE_AREA)
+        self.assertEqual(points, 53 * 53)
+        self.assertGreater(request_bytes(2, PROLOGUE_AREA), 2 * points * 2)
+        self.assertLess(
+            request_bytes(1, PROLOGUE_AREA, grid=1.0), request_bytes(1, PROLOGUE_AREA)
+        )
+
+
+class TestChunkInterval(unittest.TestCase):
+
+    def test_split_days_evenly(self):
+        """Test that days are split into even contiguous runs."""
+        days = ["{}".format(d) for d in range(1, 32)]
+        pieces = split_days(days, 6)
+        self.assertEqual([len(p) for p in pieces], [6, 5, 5, 5, 5, 5])
+        self.assertEqual(sum(pieces, []), days)
+
+    def test_large_requests_are_split(self):
+        """Test that an hourly waves month over leg_2's box is split by days."""
+        chunks = chunk_interval(
+            "2019-10-01",
+            "2019-10-31",
+            "hourly",
+            "waves",
+            LEG_2_AREA,
+            target_bytes=100 * 2**20,
+        )
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(month == 10 for _, month, _ in chunks))
+        day_bytes = request_bytes(request_fields(1, "hourly", "waves"), LEG_2_AREA)
+        for _, _, days in chunks:
+            self.assertLessEqual(len(days) * day_bytes, 100 * 2**20)
+        self.assertEqual(sum(len(days) for _, _, days in chunks), 31)
+
+    def test_fetched_days(self):
+        """Test that the product skips days a month does not have."""
+        days = ["{}".format(d) for d in range(1, 32)]
+        self.assertEqual(fetched_days(2019, (8, 9), days), 61)
+        self.assertEqual(fetched_days(2020, (2,), ["28", "29", "30"]), 2)
+
+    def test_small_requests_merge_across_months(self):
+        """Test that small neighbouring months share one request."""
+        chunks = chunk_interval(
+            "2019-08-01", "2019-09-30", "daily_noon", "mslp", PROLOGUE_AREA
+        )
+        self.assertEqual(len(chunks), 1)
+        year, months, days = chunks[0]
+        self.assertEqual((year, months), (2019, (8, 9)))
+        self.assertEqual(len(days), 31)
+        self.assertEqual(fetched_days(year, months, days), 61)
+
+    def test_partial_months_are_not_merged(self):
+        """Test that half months are not merged into a product of whole months."""
+        chunks = chunk_interval(
+            "2019-08-17", "2019-09-19", "daily_noon", "mslp", PROLOGUE_AREA
+        )
+        self.assertEqual([(y, m) for y, m, _ in chunks], [(2019, 8), (2019, 9)])
+        self.assertEqual(sum(len(days) for _, _, days in chunks), 34)
+
+    def test_overfetch_limit(self):
+        """Test that merges fetching too many unwanted days are refused."""
+        chunks = chunk_interval(
+            "2019-08-30",
+            "2019-09-02",
+            "daily_noon",
+            "mslp",
+            PROLOGUE_AREA,
+            max_overfetch=0.5,
+        )
+        self.assertEqual(chunks, [(2019, 8, ["30", "31"]), (2019, 9, ["1", "2"])])
+
+    def test_no_merge_across_years(self):
+        """Test that December and January are never merged."""
+        chunks = chunk_interval(
+            "2019-12-20", "2020-01-10", "daily_noon", "mslp", PROLOGUE_AREA
+        )
+        self.assertEqual([(y, m) for y, m, _ in chunks], [(2019, 12), (2020, 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
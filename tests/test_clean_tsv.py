@@ -0,0 +1,105 @@
+import io
+import math
+import unittest
+from clean_tsv import clean_stream, convert_to_decimal, parse_coordinates
+
+
+class TestParseCoordinates(unittest.TestCase):
+
+    def test_formats(self):
+        """Test that each supported notation gives the same decimal degrees."""
+        values = [
+            "47° 15.00’ N",
+            "47°15′N",
+            "47° 15' N",
+            "47° 15’ 0″ N",
+            "47.25",
+            "+47.25° N",
+        ]
+        decimals, errors = parse_coordinates(values, latitude=True)
+        self.assertEqual(errors, {})
+        for value in decimals:
+            self.assertAlmostEqual(value, 47.25, places=4)
+
+    def test_southern_and_western_values_are_negative(self):
+        decimals, errors = parse_coordinates(
+            ["122° 30.00’ W", "-122.5", "122° 30′ 00″ W", "122.5 W"], latitude=False
+        )
+        self.assertEqual(errors, {})
+        self.assertEqual(decimals.tolist(), [-122.5] * 4)
+
+    def test_invalid_values_are_reported(self):
+        """Test that each invalid value is NaN with its reason, and the rest parse."""
+        decimals, errors = parse_coordinates(
+            ["47° 15’ E", "95° 0’ N", "47° 61’ N", "abc", "", "47° 15’ S"],
+            latitude=True,
+        )
+        self.assertEqual(sorted(errors), [0, 1, 2, 3, 4])
+        self.assertIn("wrong hemisphere", errors[0])
+        self.assertIn("beyond 90", errors[1])
+        self.assertIn("60 or more", errors[2])
+        self.assertIn("not in a known coordinate format", errors[3])
+        self.assertTrue(all(math.isnan(v) for v in decimals[:5]))
+        self.assertEqual(decimals[5], -47.25)
+
+
+class TestConvertToDecimal(unittest.TestCase):
+
+    def test_returns_three_decimal_places(self):
+        self.assertEqual(convert_to_decimal("47° 41.76’ N"), "47.696")
+        self.assertEqual(convert_to_decimal("3° 22.62’ W"), "-3.377")
+
+    def test_raises_on_bad_input(self):
+        with self.assertRaises(ValueError):
+            convert_to_decimal("forty seven north")
+
+
+class TestCleanStream(unittest.TestCase):
+
+    HEADER = "leg_name\tstart_lat\tstart_lon\tnote\n"
+
+    def test_rows_are_converted_across_batches(self):
+        """Test that batching does not change the output."""
+        rows = [f"leg_{i}\t{i}° 30’ N\t{i}° 15’ W\tx\n" for i in range(10)]
+        outputs = []
+        for batch_size in (3, 100):
+            out = io.StringIO()
+            report = clean_stream(
+                io.StringIO(self.HEADER + "".join(rows)), out, batch_size=batch_size
+            )
+            self.assertEqual(report["rows"], 10)
+            self.assertEqual(report["written"], 10)
+            outputs.append(out.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+        lines = outputs[0].splitlines()
+        self.assertEqual(lines[0], self.HEADER.strip())
+        self.assertEqual(lines[3], "leg_2\t2.500\t-2.250\tx")
+
+    def test_bad_rows_are_left_out_and_reported_with_their_line(self):
+        text = (
+            self.HEADER
+            + "a\t10° 0’ N\t20° 0’ E\tx\n"
+            + "b\t10° 0’ E\t20° 0’ E\tx\n"
+            + "c\t10° 0’ N\t200° 0’ E\tx\n"
+            + "d\t-10.5\t20\tx\n"
+        )
+        out = io.StringIO()
+        report = clean_stream(io.StringIO(text), out, batch_size=2, max_errors=1)
+        self.assertEqual(report["rows"], 4)
+        self.assertEqual(report["written"], 2)
+        self.assertEqual(report["errors"], 2)
+        self.assertEqual(len(report["details"]), 1)
+        line, column, reason = report["details"][0]
+        self.assertEqual((line, column), (3, "start_lat"))
+        self.assertEqual(
+            out.getvalue().splitlines()[1:],
+            ["a\t10.000\t20.000\tx", "d\t-10.500\t20.000\tx"],
+        )
+
+    def test_missing_columns_raise(self):
+        with self.assertRaises(ValueError):
+            clean_stream(io.StringIO(self.HEADER), io.StringIO(), columns=["lat"])
+
+
+if __name__ == "__main__":
+    unittest.main()
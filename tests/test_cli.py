@@ -0,0 +1,104 @@
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from globe40.cli import main
+
+ROOT = Path(__file__).parent.parent
+LEGS_TSV = ROOT / "test_leg_info.tsv"
+
+
+class TestCLI(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bbox_writes_geojson(self):
+        output = self.root / "legs.geojson"
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(["bbox", str(LEGS_TSV), "--output", str(output)])
+        with open(output) as f:
+            collection = json.load(f)
+        self.assertEqual(collection["type"], "FeatureCollection")
+        self.assertEqual(collection["features"][0]["properties"]["title"], "prologue")
+        self.assertEqual(collection["features"][2]["geometry"]["type"], "LineString")
+
+    def test_compact_bbox_is_smaller(self):
+        """Test that compact output drops indentation and rounds coordinates."""
+        sizes = {}
+        for args in ([], ["--compact"]):
+            output = self.root / f"legs{len(args)}.geojson"
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(["bbox", str(LEGS_TSV), "--output", str(output), *args])
+            sizes[len(args)] = output.stat().st_size
+            text = output.read_text()
+        self.assertNotIn("\n", text)
+        route = json.loads(text)["features"][2]["geometry"]["coordinates"]
+        self.assertTrue(all(round(v, 4) == v for point in route for v in point))
+        self.assertLess(sizes[1], sizes[0] / 2)
+
+    def test_plan_fetches_nothing(self):
+        plan_path = self.root / "plan.json"
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(["plan", str(LEGS_TSV), "--plan", str(plan_path), "--no-cache"])
+        with open(plan_path) as f:
+            plan = json.load(f)
+        self.assertGreater(plan["totals"]["requests"], 0)
+        self.assertFalse((self.root / "gribs").exists())
+
+    def loaded_modules(self, args):
+        """Runs a command in a fresh interpreter and returns its output and which
+        of cdsapi, eccodes and geojson it loaded."""
+        script = (
+            "import sys\n"
+            "from globe40.cli import main\n"
+            f"main({args!r})\n"
+            "print(sorted(m for m in ('cdsapi', 'eccodes', 'geojson') if m in sys.modules))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        lines = result.stdout.splitlines()
+        return lines[:-1], lines[-1]
+
+    def test_commands_import_only_their_module(self):
+        """Test that cleaning a table loads neither cdsapi nor the GRIB stack."""
+        tsv = self.root / "dms.tsv"
+        tsv.write_text(
+            "leg_name\tstart_lat\tstart_lon\n" "prologue\t47° 41.76’ N\t3° 22.62’ W\n",
+            encoding="utf-8",
+        )
+        lines, loaded = self.loaded_modules(["clean", str(tsv)])
+        self.assertEqual(lines[1].split("\t")[1:], ["47.696", "-3.377"])
+        self.assertEqual(loaded, "[]")
+
+    def test_bbox_loads_only_geojson(self):
+        output = self.root / "legs.geojson"
+        _, loaded = self.loaded_modules(
+            ["bbox", str(LEGS_TSV), "--output", str(output)]
+        )
+        self.assertEqual(loaded, "['geojson']")
+
+    def test_plan_loads_neither_cdsapi_nor_eccodes(self):
+        plan_path = self.root / "plan.json"
+        _, loaded = self.loaded_modules(
+            ["plan", str(LEGS_TSV), "--plan", str(plan_path), "--no-cache"]
+        )
+        self.assertTrue(plan_path.exists())
+        self.assertEqual(loaded, "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
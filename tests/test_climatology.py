@@ -0,0 +1,121 @@
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+from globe40.climatology import (
+    WAVE_HEIGHT_BINS,
+    WIND_THRESHOLDS,
+    cell_histogram,
+    leg_climatology,
+    window_blocks,
+    wind_direction,
+    wind_rose_codes,
+    wind_speed,
+)
+from globe40.fake_cds import write_synthetic_grib
+from globe40.reanalysis_retriever import ReanalysisRetriever
+from globe40.store import FieldStore
+
+WINDOWS = [("2020-09-01", "2020-09-03"), ("2021-09-01", "2021-09-03")]
+
+
+class TestClimatology(unittest.TestCase):
+
+    def test_wind_direction(self):
+        """Test that directions are where the wind blows from."""
+        u = np.array([0.0, -5.0, 0.0, 5.0])
+        v = np.array([-5.0, 0.0, 5.0, 0.0])
+        np.testing.assert_allclose(wind_direction(u, v), [0, 90, 180, 270])
+
+    def test_cell_histogram_ignores_nan(self):
+        """Test per-cell bin counts with missing values."""
+        data = np.array([[[0.5, np.nan]], [[1.5, 2.5]], [[1.2, 9.0]]])
+        counts = cell_histogram(data, [0, 1, 2, np.inf])
+        np.testing.assert_array_equal(counts[:, 0, 0], [1, 2, 0])
+        np.testing.assert_array_equal(counts[:, 0, 1], [0, 0, 2])
+
+    def test_wind_rose_codes(self):
+        """Test that a northerly falls in sector 0 of its speed bin."""
+        u = np.array([0.0, 0.0, np.nan])
+        v = np.array([-8.0, -12.0, 1.0])
+        codes = wind_rose_codes(u, v, n_sectors=8, speed_bins=(0, 5, 10, np.inf))
+        np.testing.assert_array_equal(codes[:2], [1, 2])
+        self.assertTrue(np.isnan(codes[2]))
+
+
+class TestLegClimatology(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.store = FieldStore(root / "store")
+        # Waves on a coarser grid than wind and pressure, as from CDS
+        for year in (2020, 2021):
+            for key in ("ten_metre_wind", "mslp", "waves"):
+                _, request = ReanalysisRetriever(None).build_request(
+                    year, 9, ["1", "2", "3"], "6_hourly", key, [48, -15, 35, -2]
+                )
+                path = root / f"G40_leg__{key}__{year}_9__6_hourly.grib"
+                grid = 2.0 if key == "waves" else 1.0
+                write_synthetic_grib(path, request, grid=grid, seed=year)
+                self.store.ingest_grib(path, "leg")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def stacked(self, short_name):
+        """Reads every window of a variable at once, shift x time x lat x lon."""
+        field = self.store.open("leg", short_name)
+        return np.stack(
+            [field.sel(start, f"{end}T23:59:59")[1] for start, end in WINDOWS]
+        )
+
+    def test_window_blocks(self):
+        """Test that a window is read in blocks covering each step once."""
+        field = self.store.open("leg", "swh")
+        blocks = list(window_blocks([field, field], WINDOWS[0], block_steps=5))
+        self.assertEqual([len(b[0]) for b in blocks], [5, 5, 2])
+        np.testing.assert_array_equal(
+            np.concatenate([b[1] for b in blocks]), self.stacked("swh")[0]
+        )
+
+    def test_leg_climatology_from_store(self):
+        """Test a full pass over two year-shifted windows in a store."""
+        results = leg_climatology(self.store, "leg", WINDOWS)
+
+        self.assertEqual(results["wind_speed_percentiles"].shape, (7, 14, 14))
+        self.assertEqual(results["wind_rose"].shape, (16, 5, 14, 14))
+        np.testing.assert_allclose(results["wind_rose"].sum(axis=(0, 1)), 1.0)
+        self.assertEqual(results["wind_exceedance_hours"].shape, (4, 14, 14))
+        self.assertEqual(results["wave_height_distribution"].sum(axis=0)[0, 0], 24)
+        self.assertEqual(results["mslp_anomaly"].shape, (2, 14, 14))
+        self.assertEqual(results["wind_lats"].size, 14)
+        self.assertEqual(results["wind_lons"][1] - results["wind_lons"][0], 1)
+        self.assertEqual(results["mslp_lats"].size, 14)
+        waves = results["wave_height_percentiles"]
+        self.assertEqual(
+            waves.shape[1:], (results["wave_lats"].size, results["wave_lons"].size)
+        )
+        self.assertEqual(results["wave_lons"][1] - results["wave_lons"][0], 2)
+        self.assertEqual(results["wave_lats"][0], 48)
+
+    def test_blocks_match_all_at_once(self):
+        """Test that reducing in blocks gives the counts of the whole data."""
+        results = leg_climatology(self.store, "leg", WINDOWS, block_steps=5)
+        speed = wind_speed(self.stacked("10u"), self.stacked("10v"))
+        above = speed[None] > np.array(WIND_THRESHOLDS)[:, None, None, None, None]
+        np.testing.assert_allclose(
+            results["wind_exceedance_hours"], above.sum(axis=2).mean(axis=1) * 6
+        )
+        swh = self.stacked("swh")
+        np.testing.assert_array_equal(
+            results["wave_height_distribution"], cell_histogram(swh, WAVE_HEIGHT_BINS)
+        )
+        msl = np.nanmean(self.stacked("msl"), axis=1)
+        np.testing.assert_allclose(
+            results["mslp_anomaly"], msl - msl.mean(axis=0), atol=0.05
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from pathlib import Path
+import numpy as np
+from globe40.corridor import (
+    corridor_area,
+    corridor_windows,
+    leg_track,
+    parse_waypoints,
+    progress_bounds,
+)
+from globe40.cost import area_grid_points
+from globe40.legs import read_legs
+
+LEGS_TSV = Path(__file__).resolve().parent / "globe_40_legs_2026.waypoints.tsv"
+
+LEG_2 = {
+    "leg_name": "leg_2",
+    "start_lat": "16.886",
+    "start_lon": "-24.988",
+    "finish_lat": "-20.936",
+    "finish_lon": "55.478",
+    "minimum_duration_days": "30",
+    "bb_left": "-50",
+    "bb_bottom": "-45",
+    "bb_right": "60",
+    "bb_top": "20",
+    "waypoints": "-10 -30; -30 -25; -40 -5; -40 20; -35 40",
+}
+
+LEG_4 = {
+    "leg_name": "leg_4",
+    "start_lat": "-33.733",
+    "start_lon": "151.2",
+    "finish_lat": "-33.045",
+    "finish_lon": "-71.62",
+    "minimum_duration_days": "30",
+    "bb_left": "150",
+    "bb_bottom": "-45",
+    "bb_right": "-70",
+    "bb_top": "-25",
+    "waypoints": "-33.5 174; -38 -170; -41 -140; -41 -110; -37 -80",
+}
+
+
+def grid_point_days(windows):
+    return sum(
+        area_grid_points(area)
+        * (int((np.datetime64(end) - np.datetime64(start)).astype(int)) + 1)
+        for start, end, area in windows
+    )
+
+
+class TestTrack(unittest.TestCase):
+
+    def test_waypoints_are_parsed(self):
+        self.assertEqual(parse_waypoints("-35 18; -40,60;"), [(-35, 18), (-40, 60)])
+        self.assertEqual(parse_waypoints(None), [])
+
+    def test_track_through_waypoint(self):
+        """Test that the track passes the waypoint with its share of the distance."""
+        lats, lons, fractions = leg_track({**LEG_2, "waypoints": "-38 20"})
+        self.assertEqual(fractions[0], 0)
+        self.assertEqual(fractions[-1], 1)
+        self.assertTrue(np.all(np.diff(fractions) > 0))
+        self.assertAlmostEqual(lats.min(), -38, places=3)
+
+    def test_track_across_antimeridian_is_continuous(self):
+        _, lons, _ = leg_track(LEG_4)
+        self.assertGreaterEqual(lons.min(), 150)
+        self.assertAlmostEqual(lons[-1], -71.62 + 360)
+        self.assertLess(np.abs(np.diff(lons)).max(), 5)
+
+
+class TestCorridorWindows(unittest.TestCase):
+
+    def test_progress_bounds(self):
+        """Test the fleet's possible share of the track on days around the start."""
+        least, most = progress_bounds([-7, 0, 10, 40], [-1, 4, 14, 46], 20, 40)
+        np.testing.assert_allclose(least, [0, 0, 0.25, 1])
+        np.testing.assert_allclose(most, [0, 0.25, 0.75, 1])
+
+    def test_area_stays_in_bounding_box(self):
+        area = corridor_area((10, -30, 5, -20), [20, -25, -45, 60], margin_nm=300)
+        self.assertEqual(area, [15.0, -25.0, 0.0, -14.75])
+
+    def test_windows_follow_the_fleet(self):
+        """Test that windows cover the interval and move from start to finish."""
+        windows = corridor_windows(LEG_2, "2023-09-18", "2023-11-23", 14)
+        self.assertEqual(windows[0][0], "2023-09-18")
+        self.assertEqual(windows[-1][1], "2023-11-23")
+        for (_, end, _), (start, _, _) in zip(windows[:-1], windows[1:]):
+            self.assertEqual(np.datetime64(end) + 1, np.datetime64(start))
+        north, west, south, east = windows[0][2]
+        self.assertTrue(south < 16.886 < north and west < -24.988 < east)
+        north, west, south, east = windows[-1][2]
+        self.assertTrue(south < -20.936 < north and west < 55.478 < east)
+
+        box = [[20.0, -50.0, -45.0, 60.0]]
+        full = grid_point_days([("2023-09-18", "2023-11-23", box[0])])
+        self.assertLess(grid_point_days(windows), full / 4)
+
+    def test_leg_2_windows_round_the_cape(self):
+        """Test that leg 2's windows cover the route South of the Cape."""
+        leg = next(l for l in read_legs(LEGS_TSV) if l.leg_name == "leg_2")
+        windows = corridor_windows(leg, "2023-09-18", "2023-11-23", 14)
+        # 40 South 20 East, South of Cape Agulhas, and the Cape of Good Hope
+        for lat, lon in ((-40.0, 20.0), (-34.36, 18.47)):
+            self.assertTrue(
+                any(
+                    south <= lat <= north and west <= lon <= east
+                    for _, _, (north, west, south, east) in windows
+                )
+            )
+
+    def test_legs_without_waypoints_keep_the_bounding_box(self):
+        row = {k: v for k, v in LEG_2.items() if k != "waypoints"}
+        self.assertEqual(
+            corridor_windows(row, "2023-09-18", "2023-11-23", 14),
+            [("2023-09-18", "2023-11-23", [20.0, -50.0, -45.0, 60.0])],
+        )
+
+    def test_windows_across_antimeridian(self):
+        windows = corridor_windows(LEG_4, "2023-12-18", "2024-02-22", 14)
+        self.assertTrue(any(area[1] > area[3] for _, _, area in windows))
+        self.assertEqual(windows[0][2][1], 150.0)
+        self.assertEqual(windows[-1][2][3], -70.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+import tempfile
+from pathlib import Path
+import eccodes
+import numpy as np
+from globe40.cache import GribCache, canonical_request
+from globe40.coverage import CoverageIndex, area_remainder, split_request
+from globe40.fake_cds import FakeCDSServer
+from globe40.grib_tools import iter_grib_handles, iter_messages
+from globe40.reanalysis_retriever import ReanalysisRetriever
+
+
+class DroppingClient:
+    """
+    Writes part of every response, then loses the connection.
+    """
+
+    def retrieve(self, dataset, request, target):
+        Path(target).write_bytes(b"GRIB")
+        raise ConnectionError("Connection reset by peer")
+
+
+def canonical(days=("1", "2"), times=("00:00", "12:00"), area=(40, -10, 39, -9)):
+    return canonical_request(
+        "ds",
+        {
+            "variable": ["mean_sea_level_pressure"],
+            "year": 2021,
+            "month": 9,
+            "day": list(days),
+            "time": list(times),
+            "area": list(area),
+        },
+    )
+
+
+class TestSplitRequest(unittest.TestCase):
+
+    def test_superset_covers(self):
+        """Test that a longer, denser and wider entry covers a request outright."""
+        entry = canonical(
+            ("1", "2", "3"), ("00:00", "06:00", "12:00"), (45, -15, 35, 0)
+        )
+        self.assertEqual(split_request(entry, canonical()), (canonical(), []))
+
+    def test_split_on_days(self):
+        """Test that only the days the entry lacks are left over."""
+        covered, remainders = split_request(canonical(("1",)), canonical(("1", "2")))
+        self.assertEqual(covered["day"], ["1"])
+        self.assertEqual([r["day"] for r in remainders], [["2"]])
+
+    def test_split_on_area(self):
+        """Test that a wider area leaves strips one grid step outside the entry."""
+        entry = canonical(area=(40, -10, 39, -9))
+        covered, remainders = split_request(entry, canonical(area=(41, -10, 39, -8)))
+        self.assertEqual(covered["area"], ["40", "-10", "39", "-9"])
+        self.assertEqual(
+            [r["area"] for r in remainders],
+            [["41", "-10", "40.25", "-8"], ["40", "-8.75", "39", "-8"]],
+        )
+
+    def test_no_split_on_two_keys(self):
+        """Test that an entry differing in days and times is not used."""
+        entry = canonical(("1",), ("00:00",))
+        self.assertIsNone(split_request(entry, canonical()))
+
+    def test_other_dataset(self):
+        """Test that entries of another dataset never match."""
+        entry = dict(canonical(), dataset="other")
+        self.assertIsNone(split_request(entry, canonical()))
+
+    def test_area_remainder(self):
+        """Test the strips around an overlap in the middle of an area."""
+        strips = area_remainder([50, -20, 30, 0], [45, -15, 35, -5], grid=1)
+        self.assertEqual(
+            strips,
+            [[50, -20, 46, 0], [34, -20, 30, 0], [45, -20, 35, -16], [45, -4, 35, 0]],
+        )
+
+
+class TestCoverageRetrieval(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.server = FakeCDSServer(
+            queue_delay=0, seconds_per_field=0, time_scale=1e-6, grid=0.25
+        )
+        cache = GribCache(self.root / "cache")
+        self.retriever = ReanalysisRetriever(
+            self.server.client(),
+            cache=cache,
+            raise_errors=True,
+            coverage=CoverageIndex(cache, ReanalysisRetriever.SHORT_NAMES),
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def retrieve(self, days, timesteps_key="6_hourly", area=(40, -10, 39, -9)):
+        return self.retriever.retrieve_reanalysis_grib(
+            2021, 9, days, timesteps_key, "mslp", "leg", list(area), self.root / "leg"
+        )
+
+    def fields_fetched(self):
+        return [r["fields"] for r in self.server.records]
+
+    def test_coverage_needs_a_cache(self):
+        """Test that a coverage index without a cache is refused up front."""
+        coverage = CoverageIndex(GribCache(self.root / "other"), {})
+        with self.assertRaises(ValueError):
+            ReanalysisRetriever(self.server.client(), coverage=coverage)
+
+    def test_subset_served_locally(self):
+        """Test that fewer days and sparser times are cut from a cached file."""
+        self.retrieve(["1", "2", "3"])
+        path = self.retrieve(["1", "2"], "12_hourly", area=(40, -10, 39.5, -9.5))
+        self.assertEqual(self.fields_fetched(), [12])
+        messages = list(iter_messages(path))
+        self.assertEqual(len(messages), 4)
+        self.assertEqual(messages[0]["values"].shape, (3, 3))
+
+    def test_only_missing_days_fetched(self):
+        """Test that a longer period only fetches the days not on disk."""
+        self.retrieve(["1", "2", "3"])
+        path = self.retrieve(["1", "2", "3", "4", "5"])
+        self.assertEqual(self.fields_fetched(), [12, 8])
+        days = sorted(
+            {eccodes.codes_get(gid, "day") for gid in iter_grib_handles(path)}
+        )
+        self.assertEqual(days, [1, 2, 3, 4, 5])
+
+    def test_failed_remainder_leaves_no_part_files(self):
+        """Test that a remainder failing to download leaves nothing partial."""
+        self.retrieve(["1", "2", "3"])
+        self.retriever.client = DroppingClient()
+        with self.assertRaises(ConnectionError):
+            self.retrieve(["1", "2", "3", "4", "5"])
+        cache_dir = self.root / "cache"
+        self.assertEqual(list(cache_dir.glob("*.part")), [])
+        self.assertEqual(list(cache_dir.glob("*.piece")), [])
+        self.assertEqual(len(list(cache_dir.glob("*.grib"))), 1)
+
+    def test_wider_area_stitched(self):
+        """Test that a wider area fetches a strip and stitches one grid per field."""
+        first = self.retrieve(["1"])
+        original = list(iter_messages(first))
+        path = self.retrieve(["1"], area=(41, -10, 39, -9))
+        self.assertEqual(self.fields_fetched(), [4, 4])
+        messages = list(iter_messages(path))
+        self.assertEqual(len(messages), 4)
+        self.assertEqual(messages[0]["values"].shape, (9, 5))
+        self.assertFalse(np.isnan(messages[0]["values"]).any())
+        np.testing.assert_allclose(
+            messages[0]["values"][4:], original[0]["values"], rtol=1e-4
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
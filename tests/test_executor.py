@@ -0,0 +1,59 @@
+import threading
+import time
+import unittest
+from globe40.executor import RetrievalExecutor
+
+
+class TestRetrievalExecutor(unittest.TestCase):
+
+    def test_in_flight_is_bounded(self):
+        """Test that no more than max_in_flight jobs run at once."""
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def fetch(retriever, job):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.02)
+            with lock:
+                state["running"] -= 1
+            return job * 2
+
+        executor = RetrievalExecutor(object, max_in_flight=3)
+        outcomes = executor.run(range(12), fetch)
+
+        self.assertEqual(state["peak"], 3)
+        self.assertEqual([o["result"] for o in outcomes], [j * 2 for j in range(12)])
+
+    def test_one_retriever_per_thread(self):
+        """Test that each worker thread builds and reuses its own retriever."""
+        seen = {}
+
+        def fetch(retriever, job):
+            seen.setdefault(threading.get_ident(), set()).add(id(retriever))
+            time.sleep(0.01)
+
+        RetrievalExecutor(object, max_in_flight=2).run(range(8), fetch)
+        self.assertTrue(all(len(ids) == 1 for ids in seen.values()))
+
+    def test_errors_are_collected(self):
+        """Test that a failing job is reported without stopping the others."""
+
+        def fetch(retriever, job):
+            if job == 1:
+                raise RuntimeError("queue rejected")
+            return job
+
+        outcomes = RetrievalExecutor(object, max_in_flight=2).run(range(3), fetch)
+        self.assertIsInstance(outcomes[1]["error"], RuntimeError)
+        self.assertEqual([outcomes[0]["result"], outcomes[2]["result"]], [0, 2])
+
+    def test_invalid_max_in_flight(self):
+        """Test that max_in_flight below one is rejected."""
+        with self.assertRaises(ValueError):
+            RetrievalExecutor(object, max_in_flight=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
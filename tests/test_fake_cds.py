@@ -0,0 +1,250 @@
+import contextlib
+import json
+import os
+import unittest
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import eccodes
+import numpy as np
+import get_g40_course_gribs as g40
+from globe40.cost import request_bytes
+from globe40.fake_cds import FakeCDSServer, write_synthetic_grib
+from globe40.grib_tools import iter_grib_handles, verify_grib
+from globe40.legs import read_legs
+from globe40.reanalysis_retriever import ReanalysisRetriever
+from globe40.store import FieldStore
+from globe40.tiling import corridor_tiles
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# The legs with the waypoints of their sailed route, for the corridor fetches
+WAYPOINTS_TSV = REPO_DIR / "tests" / "globe_40_legs_2026.waypoints.tsv"
+
+
+class TestFakeCDS(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        _, self.request = ReanalysisRetriever(None).build_request(
+            2021, 9, ["1", "2"], "6_hourly", "ten_metre_wind", [48, -15, 35, -2]
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_synthetic_grib_matches_request(self):
+        """Test one message per variable, day and time over the request area."""
+        path = self.root / "synthetic.grib"
+        self.assertEqual(write_synthetic_grib(path, self.request, grid=1.0), 16)
+        names = set()
+        for gid in iter_grib_handles(path):
+            names.add(eccodes.codes_get(gid, "shortName"))
+            self.assertEqual(eccodes.codes_get(gid, "Ni"), 14)
+            self.assertEqual(eccodes.codes_get(gid, "Nj"), 14)
+        self.assertEqual(names, {"10u", "10v"})
+
+    def test_concurrency_limit(self):
+        """Test that the server never runs more than max_running requests."""
+        server = FakeCDSServer(max_running=2, queue_delay=0, grid=5.0, time_scale=0.01)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            for n in range(6):
+                pool.submit(
+                    server.client().retrieve,
+                    "reanalysis-era5-single-levels",
+                    self.request,
+                    str(self.root / f"{n}.grib"),
+                )
+        self.assertEqual(server.peak_running, 2)
+        self.assertEqual(len(server.records), 6)
+
+    def test_draws_do_not_depend_on_arrival_order(self):
+        """Test that each request fails the same way whichever is submitted first."""
+        # Each request has a different number of days, so records tell them apart
+        requests = [
+            {**self.request, "day": [str(day) for day in range(1, n + 1)]}
+            for n in range(1, 9)
+        ]
+        failed = []
+        for order in (requests, requests[::-1]):
+            server = FakeCDSServer(
+                failure_rate=0.5, queue_delay=0, grid=5.0, time_scale=1e-6, seed=7
+            )
+            for request in order:
+                with contextlib.suppress(ConnectionError):
+                    server.client().retrieve("ds", request, str(self.root / "x.grib"))
+            failed.append(
+                sorted(r["fields"] for r in server.records if r["state"] == "failed")
+            )
+        self.assertTrue(failed[0])
+        self.assertEqual(failed[0], failed[1])
+
+    def test_transfer_is_timed_at_the_transfer_grid(self):
+        server = FakeCDSServer(
+            queue_delay=0, grid=5.0, time_scale=1e-6, transfer_grid=1.0
+        )
+        server.client().retrieve("ds", self.request, str(self.root / "x.grib"))
+        self.assertEqual(
+            server.records[0]["bytes"], request_bytes(16, self.request["area"], 1.0)
+        )
+
+    def test_transient_failure(self):
+        """Test that a simulated failure raises a transient error."""
+        server = FakeCDSServer(failure_rate=1.0, queue_delay=0, time_scale=1e-6)
+        with self.assertRaises(ConnectionError):
+            server.client().retrieve("ds", self.request, str(self.root / "x.grib"))
+
+    def test_pipeline_end_to_end(self):
+        """Test process_tsv against the fake server with retries and the cache."""
+        server = FakeCDSServer(
+            queue_delay=1, failure_rate=0.2, grid=1.0, time_scale=0.0001, seed=3
+        )
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        try:
+            g40.process_tsv(
+                str(REPO_DIR / "test_leg_info.tsv"),
+                25,
+                14,
+                "daily_noon",
+                "mslp",
+                max_in_flight=2,
+                retry_delay=0,
+                make_client=server.client,
+            )
+        finally:
+            os.chdir(cwd)
+        leg_files = sorted((self.root / "gribs" / "prologue").glob("*.grib"))
+        # Half of August and half of September are fetched apart, not as the
+        # product of both whole months, once per year shift
+        self.assertEqual(len(leg_files), 10)
+        self.assertEqual(
+            leg_files[0].name, "G40_prologue__mslp__2019_8__daily_noon.grib"
+        )
+        completed = [r for r in server.records if r["state"] == "completed"]
+        self.assertEqual(len(completed), 10)
+
+    def test_resume_refetches_damaged_files(self):
+        """Test that resuming fetches again only the job whose file was damaged."""
+        server = FakeCDSServer(queue_delay=0, grid=2.0, time_scale=1e-6)
+
+        def run():
+            g40.process_tsv(
+                str(REPO_DIR / "test_leg_info.tsv"),
+                25,
+                14,
+                "daily_noon",
+                "mslp",
+                cache_dir=None,
+                resume=True,
+                retry_delay=0,
+                make_client=server.client,
+            )
+
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        try:
+            run()
+            fetched = len(server.records)
+            damaged = sorted((self.root / "gribs" / "prologue").glob("*.grib"))[0]
+            damaged.write_bytes(damaged.read_bytes()[:-10])
+            run()
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(len(server.records), fetched + 1)
+        self.assertGreater(verify_grib(damaged), 0)
+
+    def test_plan_mode_fetches_nothing(self):
+        """Test that a dry run writes the plan and sends no requests."""
+        server = FakeCDSServer(queue_delay=0, time_scale=0)
+        plan_path = self.root / "plan.json"
+        g40.process_tsv(
+            str(REPO_DIR / "test_leg_info.tsv"),
+            25,
+            14,
+            "daily_noon",
+            "mslp",
+            cache_dir=None,
+            journal_path=None,
+            make_client=server.client,
+            plan_path=plan_path,
+        )
+        self.assertEqual(server.records, [])
+        plan = json.loads(plan_path.read_text())
+        self.assertEqual(plan["totals"]["requests"], len(plan["requests"]))
+        self.assertEqual(plan["requests"][0]["variables"], ["mean_sea_level_pressure"])
+        self.assertIn("prologue", plan["legs"])
+
+    def test_corridor_windows_fetch_less(self):
+        """Test that corridor mode fetches less than the bounding box."""
+        legs = read_legs(WAYPOINTS_TSV)[:1]
+        fetched = {}
+        for corridor_days in (None, 7):
+            server = FakeCDSServer(queue_delay=0, grid=1.0, time_scale=1e-6)
+            run_dir = self.root / f"corridor_{corridor_days}"
+            run_dir.mkdir()
+            cwd = os.getcwd()
+            os.chdir(run_dir)
+            try:
+                g40.process_tsv(
+                    legs,
+                    25,
+                    14,
+                    "daily_noon",
+                    "mslp",
+                    cache_dir=None,
+                    retry_delay=0,
+                    make_client=server.client,
+                    corridor_days=corridor_days,
+                    corridor_margin_nm=120,
+                )
+            finally:
+                os.chdir(cwd)
+            fetched[corridor_days] = sum(r["bytes"] for r in server.records)
+            for path in (run_dir / "gribs" / "prologue").glob("*.grib"):
+                self.assertGreater(verify_grib(path), 0)
+        self.assertLess(fetched[7], fetched[None] * 0.75)
+
+    def test_tiles_are_fetched_and_stitched(self):
+        """Test that a tiled leg is fetched per tile and ingested as one grid."""
+        server = FakeCDSServer(queue_delay=0, grid=1.0, time_scale=1e-6)
+        legs = read_legs(WAYPOINTS_TSV)[2:3]
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        try:
+            g40.process_tsv(
+                legs,
+                0,
+                0,
+                "daily_noon",
+                "mslp",
+                cache_dir=None,
+                retry_delay=0,
+                make_client=server.client,
+                year_shifts=[-2],
+                corridor_margin_nm=300,
+                max_tiles=3,
+            )
+        finally:
+            os.chdir(cwd)
+        paths = sorted((self.root / "gribs" / "leg_2").glob("*.grib"))
+        tiles = corridor_tiles(legs[0], 300, 3, grid=1.0)
+        self.assertGreater(len(tiles), 1)
+        # Each tile is fetched for October and for 1 November
+        self.assertEqual(len(paths), 2 * len(tiles))
+        self.assertEqual([p.name.count("_tile") for p in paths], [1] * len(paths))
+
+        store = FieldStore(self.root / "store")
+        store.ingest_directory(self.root / "gribs" / "leg_2")
+        field = store.open("leg_2", "msl")
+        # The tiles of each month are stitched into one chunk
+        self.assertEqual(len(field.chunks), 2)
+        _, values = field.sel("2023-10-02", "2023-11-02")
+        self.assertEqual(values.shape[0], 31)
+        self.assertTrue(np.isnan(values).any())
+        self.assertTrue(np.isfinite(values).any(axis=0).sum() > values[0].size / 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+from globe40.geometry import (
+    great_circle,
+    route_line,
+    simplify,
+    split_antimeridian_line,
+)
+from globe40.routing import haversine_nm
+
+
+class TestGreatCircle(unittest.TestCase):
+
+    def test_points_are_evenly_spaced_on_the_route(self):
+        """Test that densified points keep to spacing and sum to the distance."""
+        lats, lons = great_circle(16.9, -25.0, -20.9, 55.5, spacing_nm=50)
+        steps = haversine_nm(lats[:-1], lons[:-1], lats[1:], lons[1:])
+        self.assertLessEqual(steps.max(), 50 + 1e-6)
+        self.assertAlmostEqual(
+            steps.sum(), float(haversine_nm(16.9, -25.0, -20.9, 55.5)), places=3
+        )
+        self.assertEqual((lats[0], lons[-1]), (16.9, 55.5))
+
+    def test_antipodal_points_are_rejected(self):
+        with self.assertRaises(ValueError):
+            great_circle(10, 20, -10, -160)
+
+
+class TestSimplify(unittest.TestCase):
+
+    def test_straight_line_keeps_its_ends(self):
+        xs = np.linspace(0, 10, 50)
+        np.testing.assert_array_equal(simplify(xs, 2 * xs, 0.01), [0, 49])
+
+    def test_points_beyond_tolerance_are_kept(self):
+        """Test that no dropped point is further than tolerance from the line."""
+        xs = np.linspace(0, 2 * np.pi, 200)
+        ys = np.sin(xs)
+        kept = simplify(xs, ys, 0.01)
+        self.assertLess(kept.size, 40)
+        segment = np.searchsorted(kept, np.arange(xs.size), side="right") - 1
+        first = kept[np.minimum(segment, kept.size - 2)]
+        last = kept[np.minimum(segment, kept.size - 2) + 1]
+        dx, dy = xs[last] - xs[first], ys[last] - ys[first]
+        distances = np.abs((xs - xs[first]) * dy - (ys - ys[first]) * dx) / np.hypot(
+            dx, dy
+        )
+        self.assertLessEqual(distances.max(), 0.01)
+
+
+class TestRouteLine(unittest.TestCase):
+
+    def test_antimeridian_crossing_is_split(self):
+        """Test that a route across 180 degrees is cut into two parts at 180."""
+        parts = split_antimeridian_line([170.0, 190.0], [10.0, 20.0])
+        self.assertEqual(
+            parts, [[(170.0, 10.0), (180.0, 15.0)], [(-180.0, 15.0), (-170.0, 20.0)]]
+        )
+
+    def test_route_from_auckland_to_valparaiso(self):
+        parts = route_line(-36.8, 174.8, -33.0, -71.6)
+        self.assertEqual(len(parts), 2)
+        self.assertEqual(parts[0][-1][0], 180.0)
+        self.assertEqual(parts[1][0][0], -180.0)
+        self.assertAlmostEqual(parts[1][-1][0], -71.6)
+        for part in parts:
+            lons = np.array(part)[:, 0]
+            self.assertTrue(np.all((lons >= -180) & (lons <= 180)))
+
+    def test_route_not_crossing_is_one_line(self):
+        parts = route_line(47.7, -3.4, 36.55, -6.3)
+        self.assertEqual(len(parts), 1)
+        self.assertEqual(parts[0][0], (-3.4, 47.7))
+
+    def test_same_start_and_finish_has_no_route(self):
+        self.assertEqual(route_line(10, 10, 10, 10), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
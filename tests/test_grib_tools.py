@@ -0,0 +1,174 @@
+import unittest
+import tempfile
+from pathlib import Path
+import eccodes
+import numpy as np
+from globe40.fake_cds import write_synthetic_grib
+from globe40.grib_tools import (
+    GribIntegrityError,
+    iter_grib_handles,
+    iter_messages,
+    iter_time_steps,
+    subset_grib,
+    verify_grib,
+)
+
+
+def write_test_grib(path, days, area, grid=1.0):
+    """
+    Writes one message per day on a regular grid covering area, with values that
+    encode their row and column so crops can be checked.
+    """
+    north, west, south, east = area
+    ni = int(round((east - west) / grid)) + 1
+    nj = int(round((north - south) / grid)) + 1
+    with open(path, "wb") as out:
+        for day in days:
+            gid = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib1")
+            eccodes.codes_set(gid, "Ni", ni)
+            eccodes.codes_set(gid, "Nj", nj)
+            eccodes.codes_set(gid, "iDirectionIncrementInDegrees", grid)
+            eccodes.codes_set(gid, "jDirectionIncrementInDegrees", grid)
+            eccodes.codes_set(gid, "latitudeOfFirstGridPointInDegrees", north)
+            eccodes.codes_set(gid, "longitudeOfFirstGridPointInDegrees", west)
+            eccodes.codes_set(gid, "latitudeOfLastGridPointInDegrees", south)
+            eccodes.codes_set(gid, "longitudeOfLastGridPointInDegrees", east)
+            eccodes.codes_set(gid, "dataDate", 20210900 + day)
+            values = np.arange(nj)[:, None] * 1000 + np.arange(ni)[None, :]
+            eccodes.codes_set_values(gid, values.ravel().astype(float))
+            eccodes.codes_write(gid, out)
+            eccodes.codes_release(gid)
+
+
+class TestSubsetGrib(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = Path(self.tmp.name) / "merged.grib"
+        write_test_grib(self.source, [1, 2, 3, 4], [48, -30, 15, -2])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_subset_days(self):
+        """Test that only the requested days are kept."""
+        output = Path(self.tmp.name) / "leg" / "days.grib"
+        self.assertEqual(subset_grib(self.source, output, days=["2", "4"]), 2)
+        days = [eccodes.codes_get(gid, "day") for gid in iter_grib_handles(output)]
+        self.assertEqual(days, [2, 4])
+
+    def test_subset_area(self):
+        """Test that messages are cropped to the requested area."""
+        output = Path(self.tmp.name) / "area.grib"
+        subset_grib(self.source, output, days=["1"], area=[40, -15, 35, -5])
+        for gid in iter_grib_handles(output):
+            self.assertEqual(eccodes.codes_get(gid, "Ni"), 11)
+            self.assertEqual(eccodes.codes_get(gid, "Nj"), 6)
+            self.assertEqual(
+                eccodes.codes_get(gid, "longitudeOfFirstGridPointInDegrees"), -15
+            )
+            values = eccodes.codes_get_values(gid).reshape(6, 11)
+        # Row 8 (40N) and column 15 (15W) of the source grid
+        self.assertEqual(values[0, 0], 8015)
+        self.assertEqual(values[-1, -1], 13025)
+
+    def test_subset_area_outside_grid(self):
+        """Test that an area with no grid points raises an error."""
+        output = Path(self.tmp.name) / "outside.grib"
+        with self.assertRaises(ValueError):
+            subset_grib(self.source, output, area=[-10, 100, -20, 110])
+
+
+class TestIterMessages(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = Path(self.tmp.name) / "leg.grib"
+        write_test_grib(self.source, [1, 2, 3], [48, -30, 15, -2])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_time_filter(self):
+        """Test that messages outside the time range are skipped."""
+        messages = list(
+            iter_messages(self.source, start="2021-09-02", end="2021-09-02T12:00")
+        )
+        self.assertEqual([str(m["time"]) for m in messages], ["2021-09-02T12:00:00"])
+        self.assertEqual(messages[0]["values"].dtype, np.float32)
+
+    def test_short_name_filter(self):
+        """Test that other variables are skipped before decoding."""
+        self.assertEqual(list(iter_messages(self.source, short_names=["swh"])), [])
+
+    def test_area_crop(self):
+        """Test that values and coordinates are cropped to the area."""
+        message = list(iter_messages(self.source, area=[40, -15, 35, -5]))[0]
+        self.assertEqual(message["values"].shape, (6, 11))
+        self.assertEqual(message["lats"][0], 40)
+        self.assertEqual(message["lons"][-1], -5)
+        self.assertEqual(message["values"][0, 0], 8015)
+
+    def test_time_steps(self):
+        """Test that messages are grouped by valid time."""
+        steps = list(iter_time_steps(self.source))
+        self.assertEqual(len(steps), 3)
+        self.assertEqual(list(steps[0]["fields"]), ["2t"])
+        self.assertEqual(steps[0]["fields"]["2t"].shape, (34, 29))
+
+    def test_time_steps_of_variable_first_file(self):
+        """Test that a file listing one variable after another is grouped by time."""
+        path = Path(self.tmp.name) / "wind.grib"
+        request = {
+            "variable": ["10m_u_component_of_wind", "10m_v_component_of_wind"],
+            "year": "2021",
+            "month": "9",
+            "day": ["1", "2"],
+            "time": ["00:00", "12:00"],
+            "area": [48, -30, 40, -20],
+        }
+        write_synthetic_grib(path, request, grid=1.0)
+        self.assertEqual(
+            [m["short_name"] for m in iter_messages(path)][:2], ["10u", "10u"]
+        )
+        steps = list(iter_time_steps(path, start="2021-09-01T12:00"))
+        self.assertEqual(
+            [str(s["time"]) for s in steps],
+            ["2021-09-01T12:00:00", "2021-09-02T00:00:00", "2021-09-02T12:00:00"],
+        )
+        for step in steps:
+            self.assertEqual(sorted(step["fields"]), ["10u", "10v"])
+
+
+class TestVerifyGrib(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = Path(self.tmp.name) / "leg.grib"
+        write_test_grib(self.source, [1, 2, 3], [48, -30, 15, -2])
+        self.request = {"variable": ["2t"], "year": 2021, "month": 9, "time": "12:00"}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_complete_file(self):
+        """Test one message per variable, day and time of the request."""
+        self.request["day"] = ["1", "2", "3"]
+        self.assertEqual(verify_grib(self.source, self.request), 3)
+
+    def test_wrong_message_count(self):
+        self.request["day"] = ["1", "2", "3", "4"]
+        with self.assertRaises(GribIntegrityError):
+            verify_grib(self.source, self.request)
+
+    def test_truncated_and_trailing_bytes(self):
+        """Test that a cut short file and bytes after the last message are caught."""
+        data = self.source.read_bytes()
+        for damaged in (data[:-100], data[:-4], data + b"GRIB"):
+            self.source.write_bytes(damaged)
+            with self.assertRaises(GribIntegrityError):
+                verify_grib(self.source)
+
+
+if __name__ == "__main__":
+    unittest.main()
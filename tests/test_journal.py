@@ -0,0 +1,94 @@
+import unittest
+import tempfile
+from pathlib import Path
+from globe40.journal import (
+    DONE,
+    FAILED,
+    JobJournal,
+    backoff_delay,
+    is_transient_error,
+)
+
+
+class TestJobJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "gribs" / "jobs.sqlite"
+        self.journal = JobJournal(self.path)
+        self.journal.add_job("job-a", {"year": 2021, "month": 9}, "leg_1 2021-9")
+        self.delays = []
+
+    def tearDown(self):
+        self.journal.close()
+        self.tmp.cleanup()
+
+    def test_success_is_recorded(self):
+        """Test that a successful job is marked done after one attempt."""
+        self.assertEqual(self.journal.run("job-a", lambda: "ok"), "ok")
+        row = self.journal.get("job-a")
+        self.assertEqual(row["state"], DONE)
+        self.assertEqual(row["attempts"], 1)
+        self.assertIsNotNone(row["duration"])
+
+    def test_transient_failures_are_retried_with_backoff(self):
+        """Test that transient errors are retried with doubling delays."""
+        failures = [ConnectionError("reset"), ConnectionError("reset")]
+
+        def flaky():
+            if failures:
+                raise failures.pop()
+            return "ok"
+
+        self.journal.run("job-a", flaky, base_delay=10, sleep=self.delays.append)
+        self.assertEqual(self.delays, [10, 20])
+        row = self.journal.get("job-a")
+        self.assertEqual((row["state"], row["attempts"]), (DONE, 3))
+
+    def test_permanent_failure_is_not_retried(self):
+        """Test that a rejected request fails on its first attempt."""
+
+        def rejected():
+            raise Exception("the request you have submitted is not valid")
+
+        with self.assertRaises(Exception):
+            self.journal.run("job-a", rejected, sleep=self.delays.append)
+        row = self.journal.get("job-a")
+        self.assertEqual((row["state"], row["attempts"]), (FAILED, 1))
+        self.assertIn("not valid", row["last_error"])
+        self.assertEqual(self.delays, [])
+
+    def test_gives_up_after_max_attempts(self):
+        """Test that a job is marked failed once attempts run out."""
+
+        def down():
+            raise ConnectionError("service unavailable")
+
+        with self.assertRaises(ConnectionError):
+            self.journal.run("job-a", down, max_attempts=3, sleep=self.delays.append)
+        self.assertEqual(self.journal.get("job-a")["attempts"], 3)
+        self.assertEqual(self.journal.summary(), {FAILED: 1})
+
+    def test_state_survives_reopen(self):
+        """Test that a reopened journal remembers finished jobs."""
+        self.journal.run("job-a", lambda: None)
+        self.journal.add_job("job-b", {}, "")
+        reopened = JobJournal(self.path)
+        self.assertTrue(reopened.is_finished("job-a"))
+        self.assertFalse(reopened.is_finished("job-b"))
+        reopened.close()
+
+    def test_backoff_is_capped(self):
+        """Test that the backoff delay doubles up to its maximum."""
+        delays = [backoff_delay(n, 60, 300) for n in range(1, 6)]
+        self.assertEqual(delays, [60, 120, 240, 300, 300])
+
+    def test_is_transient_error(self):
+        """Test classification of transient and permanent errors."""
+        self.assertTrue(is_transient_error(ConnectionError("timed out")))
+        self.assertFalse(is_transient_error(KeyError("waves2")))
+        self.assertFalse(is_transient_error(Exception("No data available")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import csv
+import tempfile
+import unittest
+from pathlib import Path
+from globe40.legs import Leg, read_legs
+
+ROW = {
+    "leg_name": "prologue",
+    "leg_color_code": "#FF0000",
+    "start_city": "Lorient",
+    "start_lat": "47.696",
+    "start_lon": "-3.377",
+    "start_date": "2025-08-31 12:00",
+    "tz_start": "1",
+    "finish_city": "Cadiz",
+    "finish_lat": "36.55",
+    "finish_lon": "-6.282",
+    "approx_finish_date": "2025-09-04",
+    "minimum_duration_days": "",
+    "bb_left": "-15",
+    "bb_bottom": "35",
+    "bb_right": "-2",
+    "bb_top": "48",
+}
+
+
+def write_tsv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]), delimiter="\t")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+class TestLeg(unittest.TestCase):
+
+    def test_row_is_parsed(self):
+        """Test that coordinates become floats and the start time is split off."""
+        leg = Leg(ROW)
+        self.assertEqual(leg.start_lat, 47.696)
+        self.assertEqual(leg.bb_left, -15.0)
+        self.assertEqual(leg.start_date, "2025-08-31")
+        self.assertEqual(leg.start_time_utc, "12:00")
+        self.assertIsNone(leg.minimum_duration_days)
+        self.assertEqual(leg.area, [48.0, -15.0, 35.0, -2.0])
+
+    def test_start_time_is_zero_padded(self):
+        leg = Leg({**ROW, "start_time_utc": " 9:00"})
+        self.assertEqual(leg.start_time_utc, "09:00")
+        leg = Leg({**ROW, "start_date": "2025-08-31 3:00"})
+        self.assertEqual(leg.start_time_utc, "03:00")
+
+    def test_leg_indexes_like_a_row(self):
+        """Test that slots and extra columns can be read by column name."""
+        leg = Leg(ROW)
+        self.assertEqual(leg["leg_name"], "prologue")
+        self.assertEqual(leg["tz_start"], "1")
+        self.assertIsNone(leg.get("tz_finish"))
+        with self.assertRaises(KeyError):
+            leg["tz_finish"]
+        self.assertFalse(hasattr(leg, "__dict__"))
+
+    def test_invalid_rows_are_rejected(self):
+        """Test that missing columns, bad ranges and reversed dates raise."""
+        for column, value in (
+            ("start_city", ""),
+            ("start_lat", "95"),
+            ("bb_left", "west"),
+            ("bb_bottom", "50"),
+            ("approx_finish_date", "2025-08-01"),
+            ("start_date", "2025-08-31 noon"),
+            ("start_time_utc", "25:00"),
+        ):
+            with self.subTest(column=column), self.assertRaises(ValueError):
+                Leg({**ROW, column: value})
+
+
+class TestReadLegs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "legs.tsv"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_repo_tables_parse(self):
+        """Test that the leg tables shipped with the repository are valid."""
+        root = Path(__file__).parent.parent
+        for name in (
+            "globe_40_legs_2026.tsv",
+            "globe_40_legs_2026.split_leg_4.tsv",
+            "test_leg_info.tsv",
+        ):
+            with self.subTest(name=name):
+                legs = read_legs(root / name)
+                self.assertEqual(legs[0].leg_name, "prologue")
+
+    def test_waypoints_are_kept(self):
+        """Test that the optional waypoints column of the test legs is kept."""
+        legs = read_legs(Path(__file__).parent / "globe_40_legs_2026.waypoints.tsv")
+        self.assertEqual(len(legs), 7)
+        self.assertEqual(
+            legs[2]["waypoints"], "-10 -30; -30 -25; -40 -5; -40 20; -35 40"
+        )
+
+    def test_error_names_the_line(self):
+        """Test that an invalid row is reported with its line number."""
+        write_tsv(self.path, [ROW, {**ROW, "leg_name": "leg_1", "finish_lat": "-91"}])
+        with self.assertRaisesRegex(ValueError, "line 3: finish_lat"):
+            read_legs(self.path)
+
+    def test_repeated_leg_is_rejected(self):
+        write_tsv(self.path, [ROW, ROW])
+        with self.assertRaisesRegex(ValueError, "repeated"):
+            read_legs(self.path)
+
+    def test_parsed_legs_are_passed_through(self):
+        legs = [Leg(ROW)]
+        self.assertEqual(read_legs(legs), legs)
+
+
+if __name__ == "__main__":
+    unittest.main()
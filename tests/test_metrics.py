@@ -0,0 +1,106 @@
+import json
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+from globe40.fake_cds import FakeCDSServer
+from globe40.metrics import STATE_LOGGERS, MetricsLog, watch_state_logger
+from globe40.reanalysis_retriever import ReanalysisRetriever
+
+
+class TestMetricsLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        # The fake server reports requests as running on its own logger, at INFO
+        logger = logging.getLogger("globe40.fake_cds")
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.INFO)
+        watch_state_logger(logger.name)
+        self.metrics = MetricsLog(
+            self.root / "metrics.jsonl", self.root / "globe40.prom"
+        )
+        self.server = FakeCDSServer(
+            queue_delay=100, seconds_per_field=1, grid=5.0, time_scale=1e-4
+        )
+        self.retriever = ReanalysisRetriever(self.server.client(), metrics=self.metrics)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read_log(self):
+        with open(self.metrics.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_retrieval_is_recorded(self):
+        """Test that queue wait, processing and transfer are split."""
+        path = self.retriever.retrieve_reanalysis_grib(
+            2021, 9, ["1", "2"], "6_hourly", "mslp", "leg", [48, -15, 35, -2], self.root
+        )
+        self.assertIsNotNone(path)
+        (entry,) = self.read_log()
+        self.assertEqual(entry["state"], "completed")
+        self.assertEqual(entry["attempt"], 1)
+        self.assertEqual(entry["bytes"], path.stat().st_size)
+        self.assertIsNotNone(entry["queue_wait"])
+        # 8 fields at 1 simulated second each
+        self.assertGreaterEqual(entry["processing"], 8 * 1e-4)
+        self.assertGreater(entry["throughput"], 0)
+        self.assertEqual(len(entry["request_key"]), 64)
+
+    def test_client_logger_levels_are_untouched(self):
+        """Test that listening for state changes leaves the clients' levels alone."""
+        for name in STATE_LOGGERS:
+            self.assertEqual(logging.getLogger(name).level, logging.NOTSET)
+
+    def test_failed_attempts_are_counted(self):
+        """Test that every attempt at a request key is logged in turn."""
+        self.server.failure_rate = 1.0
+        for _ in range(2):
+            self.retriever.retrieve_reanalysis_grib(
+                2021,
+                9,
+                ["1"],
+                "daily_noon",
+                "mslp",
+                "leg",
+                [48, -15, 35, -2],
+                self.root,
+            )
+        self.server.failure_rate = 0.0
+        self.retriever.retrieve_reanalysis_grib(
+            2021, 9, ["1"], "daily_noon", "mslp", "leg", [48, -15, 35, -2], self.root
+        )
+        entries = self.read_log()
+        self.assertEqual([e["attempt"] for e in entries], [1, 2, 3])
+        self.assertEqual(
+            [e["state"] for e in entries], ["failed", "failed", "completed"]
+        )
+        self.assertIn("503", entries[0]["error"])
+        summary = self.metrics.summary()
+        self.assertEqual(summary["requests"], {"failed": 2, "completed": 1})
+        self.assertEqual(summary["retried"], 1)
+
+    def test_prometheus_textfile(self):
+        """Test that the text file holds one sample per metric with help and type."""
+        self.retriever.retrieve_reanalysis_grib(
+            2021, 9, ["1"], "daily_noon", "mslp", "leg", [48, -15, 35, -2], self.root
+        )
+        text = (self.root / "globe40.prom").read_text()
+        self.assertIn('globe40_cds_requests_total{state="completed"} 1\n', text)
+        self.assertIn("# TYPE globe40_cds_bytes_total counter\n", text)
+        samples = {
+            line.split()[0]: float(line.split()[1])
+            for line in text.splitlines()
+            if not line.startswith("#")
+        }
+        self.assertEqual(
+            samples["globe40_cds_bytes_total"], self.metrics.summary()["bytes"]
+        )
+        self.assertGreater(samples["globe40_cds_last_success_timestamp_seconds"], 0)
+        self.assertFalse((self.root / "globe40.prom.tmp").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
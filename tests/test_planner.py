@@ -0,0 +1,130 @@
+import unittest
+from pathlib import Path
+import get_g40_course_gribs as g40
+from globe40.cost import request_bytes
+from globe40.legs import read_legs
+from globe40.planner import (
+    area_grid_points,
+    plan_estimate,
+    plan_requests,
+    union_area,
+    union_days,
+)
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def make_chunk(leg_name, area, days, year=2021, month=9):
+    return {
+        "year": year,
+        "month": month,
+        "days": ["{}".format(d) for d in days],
+        "leg_name": leg_name,
+        "area": area,
+        "output_dir": f"./gribs/{leg_name}",
+    }
+
+
+class TestPlanRequests(unittest.TestCase):
+
+    def test_area_grid_points(self):
+        """Test grid points of a 1 x 2 degree box at native resolution."""
+        self.assertEqual(area_grid_points([41, 0, 40, 2]), 5 * 9)
+
+    def test_union_area_and_days(self):
+        """Test the union of two areas and two day lists."""
+        self.assertEqual(
+            union_area([48, -15, 35, -2], [40, -30, 15, -5]), [48, -30, 15, -2]
+        )
+        self.assertEqual(union_days(["3", "1"], ["2", "3"]), ["1", "2", "3"])
+
+    def test_overlapping_legs_are_merged(self):
+        """Test that boxes mostly overlapping in the same month share one request."""
+        chunks = [
+            make_chunk("prologue", [48, -15, 35, -2], range(1, 20)),
+            make_chunk("leg_1", [47, -14, 36, -3], range(1, 31)),
+        ]
+        planned = plan_requests(chunks)
+        self.assertEqual(len(planned), 1)
+        self.assertEqual(planned[0]["area"], [48, -15, 35, -2])
+        self.assertEqual(len(planned[0]["days"]), 30)
+        self.assertEqual(
+            {m["leg_name"] for m in planned[0]["members"]}, {"prologue", "leg_1"}
+        )
+
+    def test_merges_that_grow_the_download_are_refused(self):
+        """Test that neighbouring boxes whose union costs more stay apart."""
+        chunks = [
+            make_chunk("prologue", [48, -15, 35, -2], range(1, 20)),
+            make_chunk("leg_1", [40, -30, 15, -5], range(1, 31)),
+        ]
+        self.assertEqual(len(plan_requests(chunks)), 2)
+        self.assertEqual(len(plan_requests(chunks, merge_tolerance=0.5)), 1)
+
+    def test_planned_bytes_never_go_up(self):
+        """Test that planning the race's legs downloads no more than the chunks."""
+        keys = ["ten_metre_wind", "mslp", "waves"]
+        chunks = [
+            chunk
+            for row in read_legs(REPO_DIR / "globe_40_legs_2026.tsv")
+            for chunk in g40.process_row(None, row, 25, 14, "6_hourly", keys, None)
+        ]
+        separate = plan_estimate(chunks, "6_hourly", keys)["totals"]
+        planned = plan_estimate(plan_requests(chunks), "6_hourly", keys)["totals"]
+        self.assertLessEqual(planned["bytes"], separate["bytes"])
+        self.assertLessEqual(planned["requests"], separate["requests"])
+
+    def test_distant_legs_are_not_merged(self):
+        """Test that far apart boxes are kept as separate requests."""
+        chunks = [
+            make_chunk("leg_1", [40, -30, 15, -5], range(1, 31)),
+            make_chunk("leg_3", [-5, 50, -45, 155], range(1, 31)),
+        ]
+        self.assertEqual(len(plan_requests(chunks)), 2)
+
+    def test_different_months_are_not_merged(self):
+        """Test that chunks from different months are never merged."""
+        chunks = [
+            make_chunk("prologue", [48, -15, 35, -2], range(1, 20), month=9),
+            make_chunk("leg_1", [40, -30, 15, -5], range(1, 31), month=10),
+        ]
+        self.assertEqual(len(plan_requests(chunks)), 2)
+
+
+class TestPlanEstimate(unittest.TestCase):
+
+    def test_totals_per_leg_and_variable_set(self):
+        """Test fields and bytes of a merged request and what each leg asked for."""
+        chunks = [
+            make_chunk("prologue", [48, -15, 35, -2], range(1, 11)),
+            make_chunk("leg_1", [40, -30, 15, -5], range(1, 31)),
+        ]
+        plan = plan_estimate(
+            plan_requests(chunks, merge_tolerance=0.5),
+            "6_hourly",
+            ["ten_metre_wind", "mslp"],
+        )
+        request = plan["requests"][0]
+        self.assertEqual(request["legs"], ["leg_1", "prologue"])
+        self.assertEqual(request["fields"], 30 * 4 * 3)
+        self.assertEqual(request["bytes"], request_bytes(360, [48, -30, 15, -2]))
+        self.assertEqual(plan["totals"]["requests"], 1)
+        self.assertEqual(plan["legs"]["prologue"]["fields"], 10 * 4 * 3)
+        self.assertEqual(plan["variable_sets"]["ten_metre_wind"]["fields"], 240)
+        self.assertEqual(plan["variable_sets"]["mslp"]["fields"], 120)
+        self.assertGreater(plan["totals"]["queue_seconds"], 0)
+
+    def test_oversized_requests_are_flagged(self):
+        """Test that requests over the CDS field limit are counted."""
+        small = make_chunk("leg_1", [40, -30, 15, -5], range(1, 3))
+        large = make_chunk("leg_1", [40, -30, 15, -5], range(1, 31))
+        large["month"] = (1, 2, 3)
+        plan = plan_estimate([small, large], "hourly", "waves", max_fields=1000)
+        self.assertEqual(plan["requests"][1]["fields"], 3 * 30 * 24 * 3)
+        self.assertEqual([r["oversized"] for r in plan["requests"]], [False, True])
+        self.assertEqual(plan["totals"]["oversized"], 1)
+        self.assertEqual(plan["legs"]["leg_1"]["requests"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,10 @@ import pytest
 import vcr
 import logging
 from pathlib import Path
+import eccodes
+from globe40.cache import GribCache, request_key
+from globe40.fake_cds import FakeCDSServer
+from globe40.grib_tools import iter_grib_handles, iter_messages
 from globe40.reanalysis_retriever import ReanalysisRetriever
 
 # Configure vcrpy
@@ -79,3 +83,83 @@ def test_retrieve_reanalysis_grib_failure(retriever, caplog):
         )
 
     assert "Error: Failed to retrieve data." in caplog.text
+
+
+def test_retrieve_variable_sets_single_request(tmp_path):
+    """Test that several variable sets are fetched once and split per set."""
+    server = FakeCDSServer(queue_delay=0, grid=1.0, time_scale=1e-6)
+    retriever = ReanalysisRetriever(server.client())
+
+    output_paths = retriever.retrieve_variable_sets(
+        year=2021,
+        month=9,
+        day_range=["1", "2"],
+        timesteps_key="12_hourly",
+        variable_set_keys=["ten_metre_wind", "mslp", "waves"],
+        leg_name="test_leg",
+        area=[50, -10, 40, 10],
+        output_dir=str(tmp_path),
+    )
+
+    assert len(server.records) == 1
+    assert server.records[0]["fields"] == 6 * 2 * 2
+    assert sorted(output_paths) == ["mslp", "ten_metre_wind", "waves"]
+    for key, path in output_paths.items():
+        assert path == tmp_path / f"G40_test_leg__{key}__2021_9__12_hourly.grib"
+    assert not (tmp_path / "G40_test_leg__ten_metre_wind+mslp+waves__2021_9__12_hourly.grib").exists()
+
+    names = [
+        eccodes.codes_get(gid, "shortName")
+        for gid in iter_grib_handles(output_paths["waves"])
+    ]
+    assert sorted(set(names)) == ["mwd", "mwp", "swh"]
+    assert len(names) == 3 * 2 * 2
+
+
+def test_retrieve_variable_sets_single_key_with_cache(tmp_path):
+    """Test that a single variable set returns the leg's file, not the cache's."""
+    server = FakeCDSServer(queue_delay=0, grid=1.0, time_scale=1e-6)
+    cache = GribCache(tmp_path / "cache")
+    retriever = ReanalysisRetriever(server.client(), cache=cache)
+    output_dir = tmp_path / "gribs"
+
+    for _ in range(2):
+        output_paths = retriever.retrieve_variable_sets(
+            year=2021,
+            month=9,
+            day_range=["1", "2"],
+            timesteps_key="12_hourly",
+            variable_set_keys=["mslp"],
+            leg_name="test_leg",
+            area=[50, -10, 40, 10],
+            output_dir=str(output_dir),
+        )
+        path = output_dir / "G40_test_leg__mslp__2021_9__12_hourly.grib"
+        assert output_paths == {"mslp": path}
+        assert path.exists()
+    assert len(server.records) == 1
+
+
+def test_grid_option(tmp_path):
+    """Test that a coarser grid snaps the area and is recorded in name and key."""
+    server = FakeCDSServer(queue_delay=0, grid=0.25, time_scale=1e-6)
+    cache = GribCache(tmp_path / "cache")
+    native = ReanalysisRetriever(server.client(), cache=cache)
+    coarse = ReanalysisRetriever(server.client(), cache=cache, grid=1.0)
+
+    _, request = coarse.build_request(
+        2021, 9, ["1"], "daily_noon", "mslp", [47.3, -14.6, 35.1, -2.2]
+    )
+    assert request["area"] == [48, -15, 35, -2]
+    assert request["grid"] == [1.0, 1.0]
+    _, native_request = native.build_request(
+        2021, 9, ["1"], "daily_noon", "mslp", [48, -15, 35, -2]
+    )
+    assert request_key("ds", request) != request_key("ds", native_request)
+
+    path = coarse.retrieve_reanalysis_grib(
+        2021, 9, ["1"], "daily_noon", "mslp", "leg", [47.3, -14.6, 35.1, -2.2], tmp_path
+    )
+    assert (tmp_path / "G40_leg__mslp__2021_9__daily_noon__1deg.grib").exists()
+    message = list(iter_messages(path))[0]
+    assert message["values"].shape == (14, 14)
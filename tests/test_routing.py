@@ -0,0 +1,184 @@
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+from globe40.fake_cds import write_synthetic_grib
+from globe40.reanalysis_retriever import ReanalysisRetriever
+from globe40.routing import (
+    BoatPolar,
+    FieldSampler,
+    destination,
+    haversine_nm,
+    initial_bearing,
+    isochrone_route,
+    route_leg,
+)
+from globe40.store import FieldStore
+
+
+def uniform_sampler(value, lats=(50, 30), lons=(-20, 0), hours=240):
+    times = np.datetime64("2021-09-01T00:00", "s") + np.arange(0, hours + 1, 6) * 3600
+    lat_grid = np.linspace(*lats, 21)
+    lon_grid = np.linspace(*lons, 21)
+    values = np.full((times.size, lat_grid.size, lon_grid.size), value, np.float32)
+    return FieldSampler(times, lat_grid, lon_grid, values)
+
+
+# Reaches 6 knots at 90 degrees and above in 10 knots of wind, nothing upwind
+TEST_POLAR = BoatPolar(
+    [0, 45, 90, 180], [0, 10, 30], [[0, 0, 0], [0, 4, 8], [0, 6, 12], [0, 6, 12]]
+)
+
+
+class TestGeodesy(unittest.TestCase):
+
+    def test_destination_round_trip(self):
+        """Test that distance and bearing recover a destination."""
+        lat, lon = destination(40.0, -10.0, np.array([30.0, 200.0]), 120.0)
+        np.testing.assert_allclose(haversine_nm(40.0, -10.0, lat, lon), 120.0)
+        np.testing.assert_allclose(
+            initial_bearing(40.0, -10.0, lat, lon), [30.0, 200.0], atol=1e-6
+        )
+
+
+class TestBoatPolar(unittest.TestCase):
+
+    def test_interpolation(self):
+        """Test bilinear interpolation, tack symmetry and clamping."""
+        speeds = TEST_POLAR.speed(
+            np.array([90, -90, 67.5, 90]), np.array([10, 10, 10, 50])
+        )
+        np.testing.assert_allclose(speeds, [6, 6, 5, 12])
+
+
+class TestFieldSampler(unittest.TestCase):
+
+    def test_interpolation(self):
+        """Test linear time and bilinear space interpolation."""
+        times = np.array(["2021-09-01T00", "2021-09-01T06"], dtype="datetime64[s]")
+        values = np.array([[[0, 1], [2, 3]], [[10, 11], [12, 13]]], np.float32)
+        sampler = FieldSampler(times, [41, 40], [-10, -9], values)
+        result = sampler("2021-09-01T03", np.array([40.5, 45]), np.array([-9.5, -9.5]))
+        self.assertAlmostEqual(result[0], 6.5)
+        self.assertTrue(np.isnan(result[1]))
+
+    def test_sample_matches_time_slices(self):
+        """Test that points each with their own time match one time at a time."""
+        times = np.datetime64("2021-09-01T00", "s") + np.arange(4) * 6 * 3600
+        rng = np.random.default_rng(1)
+        values = rng.standard_normal((4, 5, 6)).astype(np.float32)
+        sampler = FieldSampler(
+            times, np.linspace(44, 40, 5), np.arange(-10, -4), values
+        )
+        point_times = times[0] + rng.integers(0, 18 * 3600, 50).astype("timedelta64[s]")
+        lats = rng.uniform(40, 44, 50)
+        lons = rng.uniform(-10, -5, 50)
+        expected = [
+            sampler(t, np.array([lat]), np.array([lon]))[0]
+            for t, lat, lon in zip(point_times, lats, lons)
+        ]
+        np.testing.assert_allclose(
+            sampler.sample(point_times, lats, lons), expected, rtol=1e-5
+        )
+
+    def test_sample_outside_data_is_nan(self):
+        times = np.array(["2021-09-01T00", "2021-09-01T06"], dtype="datetime64[s]")
+        values = np.array([[[0, 1], [2, 3]], [[10, 11], [12, 13]]], np.float32)
+        sampler = FieldSampler(times, [41, 40], [-10, -9], values)
+        result = sampler.sample(
+            np.array(["2021-09-01T06", "2021-09-01T07", "2021-08-31T23"], "M8[s]"),
+            np.array([40.0, 40.5, 40.5]),
+            np.array([-9.0, -9.5, -9.5]),
+        )
+        self.assertEqual(result[0], 13.0)
+        self.assertTrue(np.isnan(result[1:]).all())
+
+
+class TestIsochroneRoute(unittest.TestCase):
+
+    def test_beam_reach(self):
+        """Test that a beam reach in steady wind takes distance over speed."""
+        # 10 knots from the north, sailing due west
+        u = uniform_sampler(0.0)
+        v = uniform_sampler(-10 / 1.943844)
+        start, finish = (40.0, -5.0), (40.0, -15.0)
+        result = isochrone_route(start, finish, "2021-09-01T00", TEST_POLAR, u, v)
+        self.assertTrue(result["reached"])
+        distance = haversine_nm(*start, *finish)
+        self.assertAlmostEqual(result["elapsed_hours"], distance / 6, delta=2.0)
+        self.assertEqual((result["lats"][-1], result["lons"][-1]), finish)
+
+    def test_upwind_beats(self):
+        """Test that a dead upwind finish is reached by tacking."""
+        u = uniform_sampler(0.0)
+        v = uniform_sampler(-10 / 1.943844)
+        start, finish = (35.0, -10.0), (37.0, -10.0)
+        result = isochrone_route(start, finish, "2021-09-01T00", TEST_POLAR, u, v)
+        self.assertTrue(result["reached"])
+        # Best VMG is at 45 degrees, 4 knots, so about 2.83 knots upwind
+        self.assertAlmostEqual(result["elapsed_hours"], 120 / (4 / np.sqrt(2)), delta=4)
+        self.assertGreater(np.ptp(result["lons"]), 0.1)
+
+    def test_land_is_avoided(self):
+        """Test that points where the wave field is missing are never used."""
+        u = uniform_sampler(0.0)
+        v = uniform_sampler(-10 / 1.943844)
+        swh = uniform_sampler(1.0)
+        # An island on the rhumb line between the start and the finish
+        swh.values[:, 9:12, 10] = np.nan
+        start, finish = (40.0, -5.0), (40.0, -15.0)
+        result = isochrone_route(
+            start, finish, "2021-09-01T00", TEST_POLAR, u, v, swh=swh
+        )
+        self.assertTrue(result["reached"])
+        self.assertGreater(np.ptp(result["lats"]), 1.5)
+        sampled = swh(np.datetime64("2021-09-01"), result["lats"], result["lons"])
+        self.assertFalse(np.isnan(sampled).any())
+
+
+class TestRouteLeg(unittest.TestCase):
+
+    def test_route_leg_from_store(self):
+        """Test routing a leg row over the wind fields of a shifted year."""
+        row = {
+            "leg_name": "prologue",
+            "start_lat": "47.696",
+            "start_lon": "-3.377",
+            "start_date": "2025-08-31",
+            "start_time_utc": "12:00",
+            "finish_lat": "36.55",
+            "finish_lon": "-6.282",
+            "approx_finish_date": "2025-09-04",
+            "minimum_duration_days": "4",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            store = FieldStore(root / "store")
+            for month, days in ((8, ["31"]), (9, ["1", "2", "3", "4"])):
+                _, request = ReanalysisRetriever(None).build_request(
+                    2021, month, days, "6_hourly", "ten_metre_wind", [48, -15, 35, -2]
+                )
+                path = root / f"G40_prologue__ten_metre_wind__2021_{month}.grib"
+                write_synthetic_grib(path, request, grid=1.0, seed=month)
+                store.ingest_grib(path, "prologue")
+
+            results = route_leg(store, row, TEST_POLAR, year_shifts=[-4], max_hours=36)
+            morning = route_leg(
+                store,
+                {**row, "start_time_utc": "9:00"},
+                TEST_POLAR,
+                year_shifts=[-4],
+                max_hours=6,
+            )
+
+        self.assertEqual(len(results), 1)
+        result = results[0]
+        self.assertEqual(result["year_shift"], -4)
+        self.assertEqual(str(result["start_time"]), "2021-08-31T12:00:00")
+        self.assertEqual((result["lats"][0], result["lons"][0]), (47.696, -3.377))
+        self.assertEqual(result["times"].size, result["lats"].size)
+        self.assertEqual(str(morning[0]["start_time"]), "2021-08-31T09:00:00")
+
+
+if __name__ == "__main__":
+    unittest.main()
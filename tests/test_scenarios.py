@@ -0,0 +1,123 @@
+import itertools
+import unittest
+import numpy as np
+from globe40.scenarios import (
+    extend_intervals,
+    plan_scenarios,
+    shift_years,
+    union_requests,
+)
+from globe40.utils import extend_interval, get_days_in_interval
+
+LEGS = [
+    {
+        "leg_name": "prologue",
+        "start_date": "2025-08-31 12:00",
+        "approx_finish_date": "2025-09-04",
+        "bb_left": "-15",
+        "bb_bottom": "35",
+        "bb_right": "-2",
+        "bb_top": "48",
+    },
+    {
+        "leg_name": "leg_1",
+        "start_date": "2025-09-14",
+        "approx_finish_date": "2025-09-20",
+        "bb_left": "-30",
+        "bb_bottom": "15",
+        "bb_right": "-5",
+        "bb_top": "40",
+    },
+]
+
+
+class TestExtendIntervals(unittest.TestCase):
+
+    def test_shift_years_clips_leap_day(self):
+        """Test that 29 February moves to the 28th like relativedelta."""
+        shifted = shift_years(np.array(["2024-02-29", "2024-03-01"]), [-1, -4])
+        np.testing.assert_array_equal(
+            shifted, np.array(["2023-02-28", "2020-03-01"], dtype="datetime64[D]")
+        )
+
+    def test_matches_extend_interval(self):
+        """Test every combination against the scalar extend_interval."""
+        pairs = [("2024-02-29", "2024-03-10"), ("2025-12-20", "2026-01-05")]
+        percentages, paddings, shifts = [-30, 0, 25, 50], [0, 3, 14], [-6, -4, -1]
+        for (start, end), pct, pad, shift in itertools.product(
+            pairs, percentages, paddings, shifts
+        ):
+            new_start, new_end = extend_intervals(start, end, pct, pad, shift)
+            self.assertEqual(
+                (str(new_start), str(new_end)),
+                extend_interval(start, end, pct, pad, shift),
+            )
+
+    def test_broadcast_grid(self):
+        """Test that parameters broadcast into one array per combination."""
+        new_start, new_end = extend_intervals(
+            np.array(["2024-01-01", "2024-06-01"])[:, None, None],
+            np.array(["2024-01-11", "2024-06-21"])[:, None, None],
+            np.array([0, 50])[None, :, None],
+            np.array([0, 2, 4])[None, None, :],
+        )
+        self.assertEqual(np.broadcast(new_start, new_end).shape, (2, 2, 3))
+        self.assertEqual(str(new_end[1, 1, 2]), "2022-07-05")
+
+    def test_start_after_end(self):
+        with self.assertRaises(ValueError):
+            extend_intervals(["2024-01-10"], ["2024-01-01"])
+
+
+class TestPlanScenarios(unittest.TestCase):
+
+    def test_scenario_totals(self):
+        """Test that each scenario counts the days of every leg and shift."""
+        plan = plan_scenarios(
+            LEGS,
+            percentages=(0, 25),
+            paddings=(0, 14),
+            year_shift_sets=[(-2,), (-3, -2)],
+            departure_offsets=(0, 7),
+        )
+        self.assertEqual(len(plan["scenarios"]), 16)
+        for scenario in plan["scenarios"]:
+            expected = 0
+            for row, shift in itertools.product(LEGS, scenario["year_shifts"]):
+                start, end = extend_interval(
+                    row["start_date"][:10],
+                    row["approx_finish_date"][:10],
+                    scenario["percentage_to_change"],
+                    scenario["days_either_end"],
+                    shift,
+                )
+                expected += sum(
+                    len(days) for _, _, days in get_days_in_interval(start, end)
+                )
+            self.assertEqual(scenario["days"], expected)
+
+    def test_union_is_deduplicated(self):
+        """Test that overlapping scenarios are downloaded once."""
+        plan = plan_scenarios(LEGS, percentages=(0, 25), paddings=(0, 14))
+        widest = max(plan["scenarios"], key=lambda s: s["days"])
+        self.assertEqual(
+            sum(leg["days"] for leg in plan["union"].values()), widest["days"]
+        )
+
+    def test_union_requests_by_month(self):
+        """Test that the union comes out as process_row style monthly requests."""
+        requests = union_requests(
+            LEGS[:1], percentages=(0,), paddings=(0, 2), year_shift_sets=[(-2,)]
+        )
+        self.assertEqual(
+            [(r["year"], r["month"], r["days"]) for r in requests],
+            [
+                (2023, 8, ["29", "30", "31"]),
+                (2023, 9, ["1", "2", "3", "4", "5", "6"]),
+            ],
+        )
+        self.assertEqual(requests[0]["area"], [48.0, -15.0, 35.0, -2.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
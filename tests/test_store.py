@@ -0,0 +1,188 @@
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+from globe40.fake_cds import write_synthetic_grib
+from globe40.reanalysis_retriever import ReanalysisRetriever
+from globe40.store import FieldStore, chunk_name_for, decode_grib
+
+
+def synthetic_request(
+    month, days, variable_set_key="ten_metre_wind", area=(48, -15, 35, -2)
+):
+    _, request = ReanalysisRetriever(None).build_request(
+        2021, month, days, "6_hourly", variable_set_key, list(area)
+    )
+    return request
+
+
+class TestFieldStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.gribs = self.root / "gribs" / "prologue"
+        self.gribs.mkdir(parents=True)
+        write_synthetic_grib(
+            self.gribs / "G40_prologue__ten_metre_wind__2021_8__6_hourly.grib",
+            synthetic_request(8, ["30", "31"]),
+            grid=1.0,
+        )
+        write_synthetic_grib(
+            self.gribs / "G40_prologue__ten_metre_wind__2021_9__6_hourly.grib",
+            synthetic_request(9, ["1", "2", "3"]),
+            grid=1.0,
+            seed=1,
+        )
+        self.store = FieldStore(self.root / "store")
+        self.store.ingest_directory(self.gribs)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_decode_grib(self):
+        """Test that a GRIB file decodes to time x lat x lon arrays per variable."""
+        fields = decode_grib(
+            self.gribs / "G40_prologue__ten_metre_wind__2021_9__6_hourly.grib"
+        )
+        self.assertEqual(sorted(fields), ["10u", "10v"])
+        self.assertEqual(fields["10u"]["values"].shape, (12, 14, 14))
+        self.assertEqual(fields["10u"]["lats"][0], 48)
+        self.assertEqual(fields["10u"]["lons"][0], -15)
+        self.assertEqual(str(fields["10u"]["times"][1]), "2021-09-01T06:00:00")
+
+    def test_layout(self):
+        """Test the leg and variable directories and coordinate indexes."""
+        self.assertEqual(self.store.legs(), ["prologue"])
+        self.assertEqual(self.store.variables("prologue"), ["10u", "10v"])
+        field = self.store.open("prologue", "10u")
+        self.assertEqual(len(field.chunks), 2)
+        self.assertEqual(field.times.size, 20)
+        self.assertEqual((field.lats.size, field.lons.size), (14, 14))
+
+    def test_sel_inside_chunk_is_a_view(self):
+        """Test that a slice inside one chunk is served from the memory map."""
+        field = self.store.open("prologue", "10u")
+        times, values = field.sel("2021-09-01T06:00", "2021-09-02T00:00")
+        self.assertEqual(times.size, 4)
+        self.assertIsInstance(values, np.memmap)
+        self.assertFalse(values.flags.writeable)
+
+    def test_sel_across_chunks(self):
+        """Test that a slice spanning two chunks returns both parts in order."""
+        field = self.store.open("prologue", "10u")
+        times, values = field.sel("2021-08-31T12:00", "2021-09-01T00:00")
+        self.assertEqual(
+            [str(t) for t in times],
+            ["2021-08-31T12:00:00", "2021-08-31T18:00:00", "2021-09-01T00:00:00"],
+        )
+        self.assertEqual(values.shape, (3, 14, 14))
+
+    def test_streamed_ingest_matches_decode(self):
+        """Test that the streamed chunks hold the time-sorted decoded values."""
+        fields = decode_grib(
+            self.gribs / "G40_prologue__ten_metre_wind__2021_8__6_hourly.grib"
+        )
+        times, values = self.store.open("prologue", "10v").sel(
+            "2021-08-30", "2021-08-31T18:00"
+        )
+        np.testing.assert_array_equal(times, fields["10v"]["times"])
+        np.testing.assert_array_equal(values, fields["10v"]["values"])
+        self.assertEqual(list(self.root.glob("store/**/*.part")), [])
+
+    def test_reingest_replaces_chunk(self):
+        """Test that ingesting a file again replaces its chunk."""
+        self.store.ingest_directory(self.gribs)
+        self.assertEqual(len(self.store.open("prologue", "10u").chunks), 2)
+
+    def test_grid_mismatch(self):
+        """Test that a file whose points fall between the stored ones is rejected."""
+        path = self.root / "G40_prologue__ten_metre_wind__2021_10__6_hourly.grib"
+        write_synthetic_grib(
+            path, synthetic_request(10, ["1"], area=(45.5, -10.5, 40.5, -5.5)), grid=1.0
+        )
+        with self.assertRaises(ValueError):
+            self.store.ingest_grib(path, "prologue")
+
+    def test_wider_area_regrids_stored_chunks(self):
+        """Test that a file past the stored grid widens it and moves the old chunks."""
+        field = self.store.open("prologue", "10u")
+        _, before = field.sel("2021-08-30", "2021-09-03T18")
+        before = np.array(before)
+        path = self.root / "G40_prologue__ten_metre_wind__2021_10__6_hourly.grib"
+        write_synthetic_grib(
+            path, synthetic_request(10, ["1"], area=(52, -10, 50, -5)), grid=1.0
+        )
+        self.store.ingest_grib(path, "prologue")
+
+        field = self.store.open("prologue", "10u")
+        np.testing.assert_array_equal(field.lats, np.arange(52, 34, -1))
+        np.testing.assert_array_equal(field.lons, np.arange(-15, -1))
+        _, after = field.sel("2021-08-30", "2021-09-03T18")
+        np.testing.assert_array_equal(after[:, 4:], before)
+        self.assertTrue(np.isnan(after[:, :4]).all())
+        _, october = field.sel("2021-10-01", "2021-10-01T18")
+        self.assertEqual(int((~np.isnan(october[0])).sum()), 18)
+        self.assertFalse(list(field.directory.glob("*.part")))
+
+    def test_other_spacing_gets_its_own_group(self):
+        """Test that a file on a different spacing is stored on a grid of its own."""
+        path = (
+            self.root / "G40_prologue__ten_metre_wind__2021_10__6_hourly__0.5deg.grib"
+        )
+        write_synthetic_grib(path, synthetic_request(10, ["1"]), grid=0.5)
+        self.store.ingest_grib(path, "prologue")
+        self.assertEqual(
+            self.store.variables("prologue"),
+            ["10u", "10u__0.5deg", "10v", "10v__0.5deg"],
+        )
+        self.assertEqual(len(self.store.open("prologue", "10u").chunks), 2)
+        coarse = self.store.open("prologue", "10u__0.5deg")
+        self.assertEqual(len(coarse.chunks), 1)
+        self.assertEqual(coarse.lats[1] - coarse.lats[0], -0.5)
+
+    def test_tiles_are_stitched_into_one_chunk(self):
+        """Test that the tiles of a period share one chunk on the leg grid."""
+        tiles = self.root / "gribs" / "leg_2"
+        tiles.mkdir()
+        for tile, area in enumerate(((20, -30, 10, -20), (12, -20, 0, -10)), 1):
+            write_synthetic_grib(
+                tiles / f"G40_leg_2__ten_metre_wind__2021_10_tile{tile}__6_hourly.grib",
+                synthetic_request(10, ["1", "2"], area=area),
+                grid=1.0,
+                seed=tile,
+            )
+        self.store.ingest_directory(tiles)
+        field = self.store.open("leg_2", "10u")
+        self.assertEqual(
+            [c["name"] for c in field.chunks],
+            ["G40_leg_2__ten_metre_wind__2021_10__6_hourly"],
+        )
+        np.testing.assert_array_equal(field.lats, np.arange(20, -1, -1))
+        np.testing.assert_array_equal(field.lons, np.arange(-30, -9))
+        _, values = field.sel("2021-10-01", "2021-10-03")
+        self.assertEqual(values.shape, (8, 21, 21))
+        self.assertFalse(np.isnan(values[:, 0, 0]).any())
+        self.assertFalse(np.isnan(values[:, 20, 20]).any())
+        self.assertTrue(np.isnan(values[:, 20, 0]).all())
+
+    def test_file_inside_leg_grid_is_placed(self):
+        """Test that a smaller area, e.g. a corridor window, is placed on the grid."""
+        path = self.root / "G40_prologue__ten_metre_wind__2021_10__6_hourly.grib"
+        write_synthetic_grib(
+            path, synthetic_request(10, ["1"], area=(45, -10, 40, -5)), grid=1.0
+        )
+        self.store.ingest_grib(path, "prologue")
+        _, values = self.store.open("prologue", "10u").sel("2021-10-01", "2021-10-02")
+        self.assertEqual(values.shape, (4, 14, 14))
+        self.assertEqual(int((~np.isnan(values[0])).sum()), 36)
+
+    def test_chunk_name_drops_tile(self):
+        self.assertEqual(
+            chunk_name_for("G40_leg_t1__waves__2021_9_1-15_tile2__6_hourly.grib"),
+            "G40_leg_t1__waves__2021_9_1-15__6_hourly",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
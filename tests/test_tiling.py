@@ -0,0 +1,87 @@
+import unittest
+from pathlib import Path
+import numpy as np
+from globe40.cost import area_grid_points
+from globe40.legs import read_legs
+from globe40.corridor import parse_waypoints
+from globe40.tiling import corridor_mask, corridor_tiles, partition_columns
+
+LEG_2 = {
+    "leg_name": "leg_2",
+    "start_lat": "16.886",
+    "start_lon": "-24.988",
+    "finish_lat": "-20.936",
+    "finish_lon": "55.478",
+    "bb_left": "-50",
+    "bb_bottom": "-45",
+    "bb_right": "60",
+    "bb_top": "20",
+    "waypoints": "-10 -30; -30 -25; -40 -5; -40 20; -35 40",
+}
+
+LEGS_TSV = Path(__file__).resolve().parent / "globe_40_legs_2026.waypoints.tsv"
+
+
+def contains(area, lat, lon):
+    north, west, south, east = area
+    if west > east:
+        return south <= lat <= north and (lon >= west or lon <= east)
+    return south <= lat <= north and west <= lon <= east
+
+
+class TestPartition(unittest.TestCase):
+
+    def test_diagonal_band_is_split(self):
+        """Test that a diagonal band is covered by several smaller rectangles."""
+        mask = np.zeros((12, 12), dtype=bool)
+        for i in range(12):
+            mask[i, max(i - 1, 0) : i + 2] = True
+        cost, runs = partition_columns(mask, 3, 0)
+        self.assertEqual(len(runs), 3)
+        self.assertEqual(runs[0][0], 0)
+        self.assertEqual(runs[-1][1], 11)
+        self.assertLess(cost, mask.size / 2)
+
+    def test_overhead_keeps_one_rectangle(self):
+        """Test that a rectangle is not added when it saves less than its overhead."""
+        mask = np.ones((4, 6), dtype=bool)
+        cost, runs = partition_columns(mask, 4, 1)
+        self.assertEqual((cost, runs), (25, [(0, 5)]))
+
+
+class TestCorridorTiles(unittest.TestCase):
+
+    def test_tiles_cover_the_track_in_less_area(self):
+        tiles = corridor_tiles(LEG_2, margin_nm=300)
+        self.assertGreater(len(tiles), 1)
+        self.assertLess(
+            sum(area_grid_points(t) for t in tiles),
+            area_grid_points([20, -50, -45, 60]) / 2,
+        )
+        for lat, lon in ((16.886, -24.988), (-20.936, 55.478), (-40, 20)):
+            self.assertTrue(any(contains(t, lat, lon) for t in tiles))
+        for north, west, south, east in tiles:
+            self.assertTrue(north <= 20 and south >= -45 and west >= -50 and east <= 60)
+
+    def test_leg_2_tiles_cover_the_route_round_the_cape(self):
+        """Test that leg 2's tiles cover its waypoints and leave out Central Africa."""
+        leg = next(l for l in read_legs(LEGS_TSV) if l.leg_name == "leg_2")
+        tiles = corridor_tiles(leg)
+        for lat, lon in [(-34.36, 18.47), *parse_waypoints(leg["waypoints"])]:
+            self.assertTrue(any(contains(t, lat, lon) for t in tiles), (lat, lon))
+        self.assertFalse(any(contains(t, 0, 20) for t in tiles))
+
+    def test_legs_without_waypoints_keep_the_bounding_box(self):
+        row = {k: v for k, v in LEG_2.items() if k != "waypoints"}
+        self.assertEqual(corridor_tiles(row), [[20.0, -50.0, -45.0, 60.0]])
+
+    def test_mask_follows_the_track(self):
+        mask = corridor_mask(LEG_2, margin_nm=300)
+        self.assertEqual(mask.shape, (65, 110))
+        # The cell holding the start, 20 - 16.9 rows down and 50 - 25 across
+        self.assertTrue(mask[3, 25])
+        self.assertFalse(mask[0, -1])
+
+
+if __name__ == "__main__":
+    unittest.main()
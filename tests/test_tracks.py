@@ -0,0 +1,93 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from globe40.store import FieldStore
+from globe40.tracks import join_track, parse_times, read_positions, write_joined
+
+
+def store_field(store, leg_name, short_name, offset):
+    """Stores a field equal to offset plus hours since the start plus latitude."""
+    times = np.datetime64("2021-09-01T00", "s") + np.arange(0, 48, 6) * 3600
+    lats = np.arange(44.0, 39.75, -0.25)
+    lons = np.arange(-10.0, -4.75, 0.25)
+    hours = np.arange(0, 48, 6)[:, None, None]
+    values = offset + hours + lats[None, :, None] + 0 * lons[None, None, :]
+    field = {
+        "times": times,
+        "lats": lats,
+        "lons": lons,
+        "values": values.astype(np.float32),
+    }
+    store.write_chunk(leg_name, short_name, "2021-09", field)
+
+
+class TestJoinTrack(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = FieldStore(self.tmp.name)
+        store_field(self.store, "leg_1", "10u", 0.0)
+        store_field(self.store, "leg_1", "swh", 100.0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fields_are_interpolated_at_each_position(self):
+        """Test linear interpolation in time and space for every variable."""
+        times = parse_times(["2021-09-01T03:00Z", "2021-09-01 13:30", "2021-09-05"])
+        lats = np.array([41.1, 42.3, 42.0])
+        lons = np.array([-7.3, -9.9, -6.0])
+        joined = join_track(self.store, "leg_1", times, lats, lons)
+        self.assertEqual(list(joined), ["10u", "swh"])
+        np.testing.assert_allclose(
+            joined["10u"][:2], [3 + 41.1, 13.5 + 42.3], rtol=1e-6
+        )
+        np.testing.assert_allclose(joined["swh"][:2], [144.1, 155.8], rtol=1e-6)
+        self.assertTrue(np.isnan(joined["10u"][2]))
+
+    def test_track_file_round_trip(self):
+        """Test reading a comma separated export and writing it joined as TSV."""
+        path = Path(self.tmp.name) / "track.csv"
+        path.write_text(
+            "boat,time,lat,lon\n"
+            "a,2021-09-01T06:00,40.0,-8.0\n"
+            "b,2021-09-01T06:00,30.0,-8.0\n",
+            encoding="utf-8",
+        )
+        header, rows, times, lats, lons = read_positions(path)
+        joined = join_track(self.store, "leg_1", times, lats, lons, ["10u"])
+        out = io.StringIO()
+        write_joined(out, header, rows, joined)
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                "boat\ttime\tlat\tlon\t10u",
+                "a\t2021-09-01T06:00\t40.0\t-8.0\t46.000",
+                "b\t2021-09-01T06:00\t30.0\t-8.0\t",
+            ],
+        )
+
+    def test_quoted_tab_in_comma_separated_header(self):
+        """Test that a tab inside a quoted column name is not taken as the delimiter."""
+        path = Path(self.tmp.name) / "track.csv"
+        path.write_text(
+            'boat,"note\tfree text",time,lat,lon\n'
+            "a,x,2021-09-01T06:00,40.0,-8.0\n"
+            "b,y,2021-09-01T12:00,30.0,-8.5\n",
+            encoding="utf-8",
+        )
+        header, rows, times, lats, lons = read_positions(path)
+        self.assertEqual(header, ["boat", "note\tfree text", "time", "lat", "lon"])
+        np.testing.assert_array_equal(lons, [-8.0, -8.5])
+
+    def test_missing_columns_raise(self):
+        path = Path(self.tmp.name) / "track.tsv"
+        path.write_text("boat\tlatitude\tlongitude\n", encoding="utf-8")
+        with self.assertRaises(ValueError):
+            read_positions(path)
+
+
+if __name__ == "__main__":
+    unittest.main()